@@ -1,27 +1,48 @@
 import uuid
 from http import HTTPStatus
-from typing import Optional
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from core import config
+from core.admission import (EXPORT_GROUP, LIST_GROUP, SEARCH_GROUP,
+                            admission)
+from core.http_cache import cache_control
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from helpers import static_texts
+from helpers.cursor import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from helpers.ndjson import ndjson_response, split_fields
+from models.films import Film
+from models.request_models.batch import BatchRequest
 from models.response_models.films import Film_API, Film_Detail_API
+from services.base import FILM_CACHE, LIST_CACHE
 from services.films import (FilmService, FilmsServices, get_film_service,
                             get_films_services)
+from services.responses import (ResponseCacheService,
+                                get_response_cache_service)
 
 router = APIRouter()
 
 
 @router.get('/', summary='Получение списка фильмов',
-            response_description='Краткая информация по каждому фильму')
+            response_description='Краткая информация по каждому фильму',
+            dependencies=[cache_control(LIST_CACHE), admission(LIST_GROUP)])
 @router.get('/search', summary='Поиск фильма по слову в названии',
-            response_description='Краткая информация по фильму')
+            response_description='Краткая информация по фильму',
+            dependencies=[cache_control(LIST_CACHE),
+                          admission(SEARCH_GROUP)])
 async def film_list(
+        response: Response,
         films_services: FilmsServices = Depends(get_films_services),
+        response_cache: ResponseCacheService = Depends(
+            get_response_cache_service
+        ),
         query: Optional[str] = None,  # query param для поиска в названии
         genre: Optional[str] = None,  # query param для фильтрации по жанру
         sort: Optional[str] = '-imdb_rating',  # q_з для сортировки по рейтингу
-        page_size: Optional[int] = 10,  # Количество объектов на странице
-        page_number: Optional[int] = 1  # Номер страницы
+        # Количество объектов на странице
+        page_size: Optional[int] = Query(10, ge=1, le=config.MAX_PAGE_SIZE),
+        page_number: Optional[int] = 1,  # Номер страницы
+        cursor: Optional[str] = None  # Курсор вместо номера страницы
 ) -> Optional[list]:
     """
     Выдает список объектов со следующей информацией:
@@ -35,8 +56,14 @@ async def film_list(
     - **query**: Параметр для поиска фильма по слову в названии
     - **genre**: Фильтрация фильмов определенного жанра
     - **sort**: Сортировка фильмов по рейтингу (-imdb_rating/imdb_rating)
-    - **page_size**: Количество объектов на странице (По умолчанию - 10)
+    - **page_size**: Количество объектов на странице (По умолчанию - 10,
+    не больше MAX_PAGE_SIZE)
     - **page_number**: Номер страницы (По умолчанию - 1)
+    - **cursor**: Курсор страницы вместо **page_number**. Пустое значение -
+    первая страница, курсор следующей возвращается в заголовке
+    X-Next-Cursor (заголовка нет на последней странице). Истекший курсор -
+    410, обход нужно начать заново. Курсор с другими **query**, **genre**
+    или **sort** - 422
 
     При указании **query** невозможно дополнительно указать **genre**
     """
@@ -46,22 +73,77 @@ async def film_list(
     else:
         # Выбор варианта сортировки в зависимости от query param <sort>
         reverse = "desc" if sort[0] == '-' else "asc"
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                detail=static_texts.CURSOR_422
+            )
+        films, next_position = await films_services.get_all_after(
+            query, genre, reverse, page_size, position, Film_API.source_fields
+        )
+        if next_position:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                next_position
+            )
+        return [Film_API(
+            uuid=film['id'], title=film['title'],
+            imdb_rating=film['imdb_rating']) for film in films
+        ]
+
+    # Готовый ответ из кеша отдается без построения моделей
+    response_key = response_cache.build_key(
+        'film_list', query=query, genre=genre, reverse=reverse,
+        page_size=page_size, page_number=page_number
+    )
+    cached = await response_cache.get(response_key, LIST_CACHE)
+    if cached:
+        return cached
     films = await films_services.get_all(
-        query, genre, reverse, page_size, page_number
+        query, genre, reverse, page_size, page_number, Film_API.source_fields
     )
 
-    return [Film_API(
+    return await response_cache.put(response_key, [Film_API(
         uuid=film['id'], title=film['title'],
         imdb_rating=film['imdb_rating']) for film in films
-    ]
+    ], LIST_CACHE, films_services.list_tags(films, genre=genre, query=query))
+
+
+@router.get('/export', response_class=StreamingResponse,
+            summary='Выгрузка всех фильмов',
+            response_description='Фильмы в формате NDJSON',
+            dependencies=[admission(EXPORT_GROUP)])
+async def film_export(
+        films_services: FilmsServices = Depends(get_films_services),
+        fields: Optional[str] = None  # Поля фильма через запятую
+) -> StreamingResponse:
+    """
+    Выдает все фильмы каталога потоком NDJSON: по документу индекса
+    elasticsearch на строку (поля **id**, **title**, **imdb_rating** и др.).
+    Выгрузка идет напрямую из эластика, без кеша.
+
+    - **fields**: Поля документа через запятую (По умолчанию - все)
+    """
+    fields = split_fields(fields)
+    if fields and not set(fields) <= set(Film.__fields__):
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail=static_texts.EXPORT_FIELDS_422
+        )
+    return await ndjson_response(films_services.export(fields))
 
 
 @router.get('/{film_id}', response_model=Film_Detail_API,
             summary='Получение фильма по uuid',
-            response_description='Полная информация по фильму')
+            response_description='Полная информация по фильму',
+            dependencies=[cache_control(FILM_CACHE), admission()])
 async def film_details(
         film_id: uuid.UUID,
-        film_service: FilmService = Depends(get_film_service)
+        film_service: FilmService = Depends(get_film_service),
+        response_cache: ResponseCacheService = Depends(
+            get_response_cache_service
+        ),
 ) -> Film_Detail_API:
     """
     Выдает объект со следующей информацией:
@@ -75,15 +157,46 @@ async def film_details(
     - **writers**: Список сценаристов
     - **director**: Режиссер
     """
+    if not film_service.may_exist(str(film_id), count_pass=False):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail=static_texts.FILM_404
+        )
+    response_key = response_cache.build_key('film_details', film_id=film_id)
+    cached = await response_cache.get(response_key, FILM_CACHE)
+    if cached:
+        return cached
     film = await film_service.get_by_id(str(film_id))
     if not film:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail=static_texts.FILM_404
         )
 
-    return Film_Detail_API(
+    return await response_cache.put(response_key, Film_Detail_API(
         uuid=film.id, title=film.title,
         imdb_rating=film.imdb_rating, description=film.description,
         genre=film.genre, actors=film.actors, writers=film.writers,
         director=film.director
-    )
+    ), FILM_CACHE)
+
+
+@router.post('/batch', response_model=List[Optional[Film_Detail_API]],
+             summary='Получение нескольких фильмов по uuid',
+             response_description='Полная информация по каждому фильму',
+             dependencies=[admission()])
+async def film_batch(
+        batch: BatchRequest,
+        film_service: FilmService = Depends(get_film_service),
+) -> List[Optional[Film_Detail_API]]:
+    """
+    Выдает фильмы по списку **ids** (не больше BATCH_MAX_IDS, по умолчанию
+    100) в порядке запроса, на месте несуществующих фильмов - null.
+    Поля фильма те же, что у /films/{film_id}
+    """
+    films = await film_service.get_by_ids(batch.str_ids())
+
+    return [Film_Detail_API(
+        uuid=film.id, title=film.title,
+        imdb_rating=film.imdb_rating, description=film.description,
+        genre=film.genre, actors=film.actors, writers=film.writers,
+        director=film.director
+    ) if film else None for film in films]
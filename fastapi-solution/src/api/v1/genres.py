@@ -1,19 +1,29 @@
 import uuid
 from http import HTTPStatus
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from core.admission import admission
+from core.http_cache import cache_control
+from fastapi import APIRouter, Depends, HTTPException, Response
 from helpers import static_texts
+from models.request_models.batch import BatchRequest
 from models.response_models.genre import Genre
+from services.base import GENRE_CACHE, LIST_CACHE
 from services.genres import (GenreService, GenresServices, get_genre_service,
                              get_genres_services)
+from services.responses import (ResponseCacheService,
+                                get_response_cache_service)
 
 router = APIRouter()
 
 
 @router.get('/', summary='Получение списка жанров',
-            response_description='Список жанров')
+            response_description='Список жанров',
+            dependencies=[cache_control(LIST_CACHE), admission()])
 async def genre_list(
-    genres_services: GenresServices = Depends(get_genres_services)
+    genres_services: GenresServices = Depends(get_genres_services),
+    response_cache: ResponseCacheService = Depends(get_response_cache_service)
 ) -> list:
     """
     Выдает список объектов со следующей информацией:
@@ -21,17 +31,33 @@ async def genre_list(
     - **uuid**: UUID объекта в базе данных
     - **name**: Название жанра
     """
+    if genres_services.in_memory:
+        # Жанры в памяти воркера, ответ собирается один раз на версию
+        return Response(content=genres_services.registry.body(
+            'genre_list', lambda genres: orjson.dumps([
+                Genre(uuid=genre['id'], name=genre['name']).dict()
+                for genre in genres
+            ])
+        ), media_type='application/json')
+    response_key = response_cache.build_key('genre_list')
+    cached = await response_cache.get(response_key, LIST_CACHE)
+    if cached:
+        return cached
     genres = await genres_services.get_all()
 
-    return [Genre(uuid=genre['id'], name=genre['name']) for genre in genres]
+    return await response_cache.put(response_key, [
+        Genre(uuid=genre['id'], name=genre['name']) for genre in genres
+    ], LIST_CACHE, genres_services.list_tags(genres))
 
 
 @router.get('/{genre_id}', response_model=Genre,
             summary='Получение жанра по uuid',
-            response_description='Полная информация по жанру')
+            response_description='Полная информация по жанру',
+            dependencies=[cache_control(GENRE_CACHE), admission()])
 async def genre_details(
     genre_id: uuid.UUID,
-    genre_service: GenreService = Depends(get_genre_service)
+    genre_service: GenreService = Depends(get_genre_service),
+    response_cache: ResponseCacheService = Depends(get_response_cache_service)
 ) -> Genre:
     """
     Выдает объект со следующей информацией:
@@ -39,10 +65,41 @@ async def genre_details(
     - **uuid**: UUID объекта в базе данных
     - **name**: Название жанра
     """
+    genre = genre_service.from_memory(str(genre_id))
+    if genre:
+        return Genre(uuid=genre.id, name=genre.name)
+    if not genre_service.may_exist(str(genre_id), count_pass=False):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail=static_texts.GENRE_404
+        )
+    response_key = response_cache.build_key('genre_details', genre_id=genre_id)
+    cached = await response_cache.get(response_key, GENRE_CACHE)
+    if cached:
+        return cached
     genre = await genre_service.get_by_id(str(genre_id))
     if not genre:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail=static_texts.GENRE_404
         )
 
-    return Genre(uuid=genre.id, name=genre.name)
+    return await response_cache.put(
+        response_key, Genre(uuid=genre.id, name=genre.name), GENRE_CACHE
+    )
+
+
+@router.post('/batch', response_model=List[Optional[Genre]],
+             summary='Получение нескольких жанров по uuid',
+             response_description='Полная информация по каждому жанру',
+             dependencies=[admission()])
+async def genre_batch(
+    batch: BatchRequest,
+    genre_service: GenreService = Depends(get_genre_service)
+) -> List[Optional[Genre]]:
+    """
+    Выдает жанры по списку **ids** (не больше BATCH_MAX_IDS, по умолчанию
+    100) в порядке запроса, на месте несуществующих жанров - null
+    """
+    genres = await genre_service.get_by_ids(batch.str_ids())
+
+    return [Genre(uuid=genre.id, name=genre.name) if genre else None
+            for genre in genres]
@@ -3,22 +3,39 @@ from http import HTTPStatus
 from typing import List, Optional
 
 from api.v1.films import Film_API
-from fastapi import APIRouter, Depends, HTTPException
+from core import config
+from core.admission import (EXPORT_GROUP, LIST_GROUP, SEARCH_GROUP,
+                            admission)
+from core.http_cache import cache_control
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from helpers import static_texts
+from helpers.cursor import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from helpers.ndjson import ndjson_response, split_fields
+from models.person import Person as PersonDocument
+from models.request_models.batch import BatchRequest
 from models.response_models.person import Person
+from services.base import LIST_CACHE, PERSON_CACHE, SEARCH_CACHE
 from services.persons import PersonService, get_person_service
+from services.responses import (ResponseCacheService,
+                                get_response_cache_service)
 
 router = APIRouter()
 
 
 @router.get('/search', response_model=List[Person],
             summary='Поиск по персоне',
-            response_description='Персоны, совпадающие с запросом')
+            response_description='Персоны, совпадающие с запросом',
+            dependencies=[cache_control(SEARCH_CACHE),
+                          admission(SEARCH_GROUP)])
 async def person_search(
+    response: Response,
     person_service: PersonService = Depends(get_person_service),
+    response_cache: ResponseCacheService = Depends(get_response_cache_service),
     query: Optional[str] = None,
     page_number: Optional[int] = 1,
-    page_size: Optional[int] = 50
+    page_size: Optional[int] = Query(50, ge=1, le=config.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
 ) -> Optional[List[Person]]:
     """
     Выдает список объект со следующей информацией:
@@ -27,23 +44,87 @@ async def person_search(
     - **full_name**: ФИО персоны
     - **role**: Роль персоны
     - **film_ids**: Список UUID кинопроизведений, в которых участвовал человек
+
+    Вместо **page_number** можно передать **cursor**: пустое значение -
+    первая страница, курсор следующей возвращается в заголовке X-Next-Cursor.
+    Истекший курсор - 410, обход нужно начать заново, курсор с другим
+    **query** - 422
     """
-    hits = await person_service.search(query, page_number, page_size)
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                detail=static_texts.CURSOR_422
+            )
+        hits, next_position = await person_service.search_after(
+            query, page_size, position, Person.source_fields
+        )
+        if not hits and position:
+            # Обход выдачи курсором закончился
+            return []
+        if next_position:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+                next_position
+            )
+    else:
+        response_key = response_cache.build_key(
+            'person_search', query=query,
+            page_number=page_number, page_size=page_size
+        )
+        cached = await response_cache.get(response_key, SEARCH_CACHE)
+        if cached:
+            return cached
+        hits = await person_service.search(
+            query, page_number, page_size, Person.source_fields
+        )
     if not hits:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail=static_texts.PERSON_404
         )
-    return [Person(
+    persons = [Person(
         uuid=hit.id, full_name=hit.full_name,
         role=hit.role, film_ids=hit.film_ids) for hit in hits]
+    if cursor is not None:
+        return persons
+    return await response_cache.put(
+        response_key, persons, SEARCH_CACHE,
+        person_service.search_tags(hits, query)
+    )
+
+
+@router.get('/export', response_class=StreamingResponse,
+            summary='Выгрузка всех персон',
+            response_description='Персоны в формате NDJSON',
+            dependencies=[admission(EXPORT_GROUP)])
+async def person_export(
+    person_service: PersonService = Depends(get_person_service),
+    fields: Optional[str] = None
+) -> StreamingResponse:
+    """
+    Выдает всех персон потоком NDJSON: по документу индекса
+    elasticsearch на строку (поля **id**, **full_name**, **role**,
+    **film_ids**). Выгрузка идет напрямую из эластика, без кеша.
+
+    - **fields**: Поля документа через запятую (По умолчанию - все)
+    """
+    fields = split_fields(fields)
+    if fields and not set(fields) <= set(PersonDocument.__fields__):
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail=static_texts.EXPORT_FIELDS_422
+        )
+    return await ndjson_response(person_service.export(fields))
 
 
 @router.get('/{person_id}', response_model=Person,
             summary='Поиск персоны по uuid',
-            response_description='Полная информация по персоне')
+            response_description='Полная информация по персоне',
+            dependencies=[cache_control(PERSON_CACHE), admission()])
 async def person_details(
     person_id: uuid.UUID,
-    person_service: PersonService = Depends(get_person_service)
+    person_service: PersonService = Depends(get_person_service),
+    response_cache: ResponseCacheService = Depends(get_response_cache_service)
 ) -> Person:
     """
     Выдает объект со следующей информацией:
@@ -53,24 +134,36 @@ async def person_details(
     - **role**: Роль персоны
     - **film_ids**: Список UUID кинопроизведений, в которых участвовал человек
     """
+    if not person_service.may_exist(str(person_id), count_pass=False):
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail=static_texts.PERSON_404
+        )
+    response_key = response_cache.build_key(
+        'person_details', person_id=person_id
+    )
+    cached = await response_cache.get(response_key, PERSON_CACHE)
+    if cached:
+        return cached
     person = await person_service.get_by_id(str(person_id))
     if not person:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND, detail=static_texts.PERSON_404
         )
 
-    return Person(
+    return await response_cache.put(response_key, Person(
         uuid=person.id, full_name=person.full_name,
         role=person.role, film_ids=person.film_ids
-    )
+    ), PERSON_CACHE)
 
 
 @router.get('/{person_id}/film', response_model=List[Film_API],
             summary='Поиск фильмов по uuid персоны',
-            response_description='Список фильмов с участием персоны')
+            response_description='Список фильмов с участием персоны',
+            dependencies=[cache_control(LIST_CACHE), admission(LIST_GROUP)])
 async def person_film(
     person_id: uuid.UUID,
-    person_service: PersonService = Depends(get_person_service)
+    person_service: PersonService = Depends(get_person_service),
+    response_cache: ResponseCacheService = Depends(get_response_cache_service)
 ) -> List[Film_API]:
     """
     Выдает список объектов со следующей информацией:
@@ -79,10 +172,40 @@ async def person_film(
     - **title**: Название кинопроизведения
     - **imdb_rating**: Рейтинг кинопроизведения
     """
+    if not person_service.may_exist(str(person_id), count_pass=False):
+        return []
+    response_key = response_cache.build_key(
+        'person_film', person_id=person_id
+    )
+    cached = await response_cache.get(response_key, LIST_CACHE)
+    if cached:
+        return cached
     films = await person_service.get_film_list_by_id(str(person_id))
     if not films:
         return []
 
-    return [Film_API(
+    return await response_cache.put(response_key, [Film_API(
         uuid=film.id, title=film.title,
-        imdb_rating=film.imdb_rating) for film in films]
+        imdb_rating=film.imdb_rating) for film in films], LIST_CACHE,
+        person_service.film_list_tags(str(person_id), films))
+
+
+@router.post('/batch', response_model=List[Optional[Person]],
+             summary='Получение нескольких персон по uuid',
+             response_description='Полная информация по каждой персоне',
+             dependencies=[admission()])
+async def person_batch(
+    batch: BatchRequest,
+    person_service: PersonService = Depends(get_person_service)
+) -> List[Optional[Person]]:
+    """
+    Выдает персоны по списку **ids** (не больше BATCH_MAX_IDS, по умолчанию
+    100) в порядке запроса, на месте несуществующих персон - null.
+    Поля персоны те же, что у /persons/{person_id}
+    """
+    persons = await person_service.get_by_ids(batch.str_ids())
+
+    return [Person(
+        uuid=person.id, full_name=person.full_name,
+        role=person.role, film_ids=person.film_ids
+    ) if person else None for person in persons]
@@ -0,0 +1,25 @@
+import os
+
+from db import elastic, redis
+from fastapi import APIRouter
+
+router = APIRouter()
+
+
+@router.get('/pools', summary='Состояние пулов соединений',
+            response_description='Статистика пулов текущего воркера')
+async def pool_stats() -> dict:
+    """
+    Выдает статистику пулов соединений воркера, обработавшего запрос:
+
+    - **pid**: PID воркера
+    - **redis**: размер пула, соединения в работе и свободные,
+    ожидающие соединения запросы, число и суммарное время ожиданий
+    - **elastic**: по каждому узлу размер пула, соединения в работе
+    и свободные, ожидающие соединения запросы
+    """
+    return {
+        'pid': os.getpid(),
+        'redis': redis.pool_stats(),
+        'elastic': elastic.pool_stats(),
+    }
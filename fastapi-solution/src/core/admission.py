@@ -0,0 +1,119 @@
+import asyncio
+from collections import deque
+from http import HTTPStatus
+from typing import Deque, Dict, Optional
+
+from core import config, deadline, metrics
+from fastapi import Depends, HTTPException, Request
+from helpers import static_texts
+
+# Группы маршрутов, у каждой свой лимит в config.ADMISSION_LIMITS
+DEFAULT_GROUP = 'default'
+LIST_GROUP = 'list'
+SEARCH_GROUP = 'search'
+EXPORT_GROUP = 'export'
+
+
+class Bulkhead:
+    """Ограничение одновременных запросов группы маршрутов в воркере.
+    Запросы сверх limit ждут слота в очереди (FIFO) не дольше
+    queue_timeout секунд; если очередь заполнена или время ожидания
+    вышло, запрос отклоняется. Освободившийся слот передается первому
+    в очереди, поэтому новые запросы не обгоняют ждущих"""
+
+    def __init__(self, group: str, limit: int, queue_size: int,
+                 queue_timeout: float):
+        self.group = group
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Занятие слота. False - запрос отклонен. timeout - остаток
+        срока запроса, если он меньше времени ожидания в очереди"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._update_gauges()
+            return True
+        if len(self._waiters) >= self.queue_size:
+            metrics.count_shed(self.group, 'queue_full')
+            return False
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        wait = self.queue_timeout if timeout is None \
+            else max(min(self.queue_timeout, timeout), 0)
+        timer = loop.call_later(wait, self._expire, waiter)
+        try:
+            # True - слот передан этому запросу, False - время вышло
+            admitted = await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                # Слот уже передан, но запрос отменен (клиент ушел)
+                self.release()
+            raise
+        finally:
+            timer.cancel()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+        if not admitted:
+            metrics.count_shed(self.group, 'queue_timeout')
+        return admitted
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    def _expire(self, waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(False)
+
+    def _update_gauges(self):
+        metrics.update_admission_gauges(
+            self.group, self.active, len(self._waiters)
+        )
+
+
+bulkheads: Dict[str, Bulkhead] = {
+    group: Bulkhead(group, limit, queue_size, queue_timeout_ms / 1000)
+    for group, (limit, queue_size, queue_timeout_ms)
+    in config.ADMISSION_LIMITS.items()
+}
+
+
+def admission(group: str = DEFAULT_GROUP):
+    """Зависимость маршрута: срок запроса (core.deadline) из заголовка
+    X-Request-Timeout или по умолчанию для группы group, и слот группы
+    на время выполнения (до конца отправки ответа, включая потоковые).
+    При перегрузке запрос сразу получает 503 с Retry-After"""
+    bulkhead = bulkheads[group]
+
+    async def dependency(request: Request):
+        if config.REQUEST_DEADLINE_ENABLED:
+            deadline.start(deadline.request_timeout(
+                request.headers.get(deadline.TIMEOUT_HEADER),
+                config.REQUEST_TIMEOUTS[group],
+            ))
+        if not config.ADMISSION_ENABLED:
+            yield
+            return
+        if not await bulkhead.acquire(deadline.remaining()):
+            raise HTTPException(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                detail=static_texts.OVERLOADED_503,
+                headers={'Retry-After': str(config.ADMISSION_RETRY_AFTER)},
+            )
+        try:
+            yield
+        finally:
+            bulkhead.release()
+    return Depends(dependency)
@@ -12,10 +12,226 @@ PROJECT_NAME = os.getenv('PROJECT_NAME', 'movies')
 REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
 REDIS_PORT = int(os.getenv('REDIS_PORT', 6380))
 REDIS_PASSWORD = os.getenv('REDIS_PASSWORD', None)
+# Пул соединений редиса: размер, ожидание свободного соединения и таймауты.
+# Подписки и XREADGROUP идут через отдельный пул без socket_timeout
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 1))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 1))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1))
+REDIS_RETRY_ON_TIMEOUT = os.environ.get(
+    'REDIS_RETRY_ON_TIMEOUT', False
+) == 'True'
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
 
 ELASTIC_HOST = os.getenv('ELASTIC_HOST', 'elasticsearch')
 ELASTIC_PORT = int(os.getenv('ELASTIC_PORT', 9201))
+# Пул соединений эластика: размер на узел, таймаут запроса и повторы
+ELASTIC_MAX_CONNECTIONS = int(os.getenv('ELASTIC_MAX_CONNECTIONS', 25))
+ELASTIC_TIMEOUT = float(os.getenv('ELASTIC_TIMEOUT', 10))
+ELASTIC_MAX_RETRIES = int(os.getenv('ELASTIC_MAX_RETRIES', 3))
+ELASTIC_RETRY_ON_TIMEOUT = os.environ.get(
+    'ELASTIC_RETRY_ON_TIMEOUT', False
+) == 'True'
+ELASTIC_HTTP_COMPRESS = os.environ.get(
+    'ELASTIC_HTTP_COMPRESS', False
+) == 'True'
+# Как часто воркер обновляет метрики состояния пулов соединений, секунд
+POOL_METRICS_INTERVAL = float(os.getenv('POOL_METRICS_INTERVAL', 5))
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 DEBUG = os.environ.get('DEBUG', False) == 'True'
+
+# Курсорная пагинация: использовать point-in-time эластика,
+# чтобы обход выдачи не видел изменений индекса между страницами
+ELASTIC_CURSOR_USE_PIT = os.environ.get(
+    'ELASTIC_CURSOR_USE_PIT', False
+) == 'True'
+ELASTIC_PIT_KEEP_ALIVE = os.getenv('ELASTIC_PIT_KEEP_ALIVE', '1m')
+
+# Время жизни записей кеша по типам, в секундах: (мягкий TTL, жесткий TTL).
+# До мягкого TTL запись свежая, после него и до жесткого отдается
+# устаревшей, а в фоне обновляется из эластика
+CACHE_TTL = {
+    entity: (
+        int(os.getenv(f'{entity.upper()}_CACHE_SOFT_TTL', soft)),
+        int(os.getenv(f'{entity.upper()}_CACHE_HARD_TTL', hard)),
+    )
+    for entity, soft, hard in (
+        ('film', 60 * 5, 60 * 15),
+        ('genre', 60 * 10, 60 * 60),
+        ('person', 60 * 5, 60 * 15),
+        ('list', 60 * 5, 60 * 15),
+        ('search', 60 * 2, 60 * 10),
+    )
+}
+# Время жизни отрицательных записей (объекта нет, выдача пуста), секунд.
+# 0 - не кешировать отсутствие
+NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 30))
+# Доля мягкого TTL, на которую он случайно увеличивается при записи
+CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))
+
+# Кеш готовых ответов API (байты JSON) поверх кеша данных. ETag ответа
+# из него известен до сборки, поэтому только с ним 304 на If-None-Match
+# обходится без чтения данных и сериализации
+RESPONSE_CACHE_ENABLED = os.environ.get(
+    'RESPONSE_CACHE_ENABLED', False
+) == 'True'
+
+# Формат записей кеша: сериализация json или msgpack, сжатие zstd или lz4
+# (пусто - без сжатия) для записей от CACHE_COMPRESS_MIN_BYTES байт
+CACHE_SERIALIZER = os.getenv('CACHE_SERIALIZER', 'json')
+CACHE_COMPRESSION = os.getenv('CACHE_COMPRESSION', '')
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', 1024))
+
+# Локальный (in-memory) кеш воркера перед редисом
+LOCAL_CACHE_ENABLED = os.environ.get('LOCAL_CACHE_ENABLED', False) == 'True'
+LOCAL_CACHE_MAX_SIZE = int(os.getenv('LOCAL_CACHE_MAX_SIZE', 10000))
+LOCAL_CACHE_TTL = int(os.getenv('LOCAL_CACHE_TTL', 30))
+LOCAL_CACHE_INVALIDATION_CHANNEL = os.getenv(
+    'LOCAL_CACHE_INVALIDATION_CHANNEL', 'cache:invalidate'
+)
+
+# Блокировка в редисе на время загрузки ключа из эластика,
+# чтобы при промахе в ES ходил только один воркер
+CACHE_LOCK_ENABLED = os.environ.get('CACHE_LOCK_ENABLED', False) == 'True'
+CACHE_LOCK_TIMEOUT_MS = int(os.getenv('CACHE_LOCK_TIMEOUT_MS', 3000))
+CACHE_LOCK_POLL_MS = int(os.getenv('CACHE_LOCK_POLL_MS', 50))
+
+# Прогрев кеша: воркеры учитывают самые частые запросы (top-K),
+# сбрасывают счетчики в редис раз в WARMUP_FLUSH_INTERVAL секунд,
+# а раз в WARMUP_INTERVAL один из воркеров заново загружает горячие
+# ключи из эластика не более чем в WARMUP_CONCURRENCY запросов сразу.
+# Прогревается только кеш данных: кеш ответов (RESPONSE_CACHE_ENABLED)
+# заполняется первым запросом к странице, которому хватает кеша данных
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', False) == 'True'
+WARMUP_INTERVAL = int(os.getenv('WARMUP_INTERVAL', 300))
+WARMUP_FLUSH_INTERVAL = int(os.getenv('WARMUP_FLUSH_INTERVAL', 30))
+WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', 8))
+# Сколько ключей учитывает воркер и сколько хранится в редисе на тип
+WARMUP_TRACK_SIZE = int(os.getenv('WARMUP_TRACK_SIZE', 1000))
+WARMUP_TOP_KEYS = int(os.getenv('WARMUP_TOP_KEYS', 200))
+# Счетчики в редисе умножаются на WARMUP_DECAY при каждом прогреве,
+# чтобы горячими оставались недавние запросы
+WARMUP_DECAY = float(os.getenv('WARMUP_DECAY', 0.5))
+# Всегда прогреваются первые страницы /films и самые частые поиски персон
+WARMUP_FILM_PAGES = int(os.getenv('WARMUP_FILM_PAGES', 3))
+WARMUP_TOP_SEARCHES = int(os.getenv('WARMUP_TOP_SEARCHES', 50))
+
+# Реестр жанров в памяти каждого воркера вместо редиса и эластика
+GENRE_REGISTRY_ENABLED = os.environ.get(
+    'GENRE_REGISTRY_ENABLED', False
+) == 'True'
+GENRE_REGISTRY_REFRESH_INTERVAL = int(
+    os.getenv('GENRE_REGISTRY_REFRESH_INTERVAL', 300)
+)
+GENRE_REGISTRY_CHANNEL = os.getenv('GENRE_REGISTRY_CHANNEL', 'genres:changed')
+
+# Лента изменений (Redis Stream) для инвалидации кеша при обновлении
+# документов. С ней TTL кеша можно увеличить без риска отдать устаревшее
+CHANGE_FEED_ENABLED = os.environ.get('CHANGE_FEED_ENABLED', False) == 'True'
+CHANGE_FEED_STREAM = os.getenv('CHANGE_FEED_STREAM', 'changes')
+CHANGE_FEED_GROUP = os.getenv('CHANGE_FEED_GROUP', 'api')
+CHANGE_FEED_MAXLEN = int(os.getenv('CHANGE_FEED_MAXLEN', 100000))
+CHANGE_FEED_BATCH_SIZE = int(os.getenv('CHANGE_FEED_BATCH_SIZE', 100))
+CHANGE_FEED_BLOCK_MS = int(os.getenv('CHANGE_FEED_BLOCK_MS', 5000))
+# Через сколько событие, не подтвержденное другим воркером, перехватывается
+CHANGE_FEED_CLAIM_IDLE_MS = int(os.getenv('CHANGE_FEED_CLAIM_IDLE_MS', 60000))
+
+# Фильтры Блума по uuid документов (services.existence): запросы
+# несуществующих uuid отсекаются в памяти воркера. Фильтр перестраивается
+# из эластика раз в BLOOM_REBUILD_INTERVAL секунд с запасом емкости
+# BLOOM_CAPACITY_FACTOR, воркеры сверяют копию с редисом раз в
+# BLOOM_REFRESH_INTERVAL. Новые документы добавляются в фильтр лентой
+# изменений, без нее они видны только после перестроения
+BLOOM_ENABLED = os.environ.get('BLOOM_ENABLED', False) == 'True'
+BLOOM_ERROR_RATE = float(os.getenv('BLOOM_ERROR_RATE', 0.01))
+BLOOM_CAPACITY_FACTOR = float(os.getenv('BLOOM_CAPACITY_FACTOR', 2))
+BLOOM_REBUILD_INTERVAL = int(os.getenv('BLOOM_REBUILD_INTERVAL', 3600))
+BLOOM_REFRESH_INTERVAL = int(os.getenv('BLOOM_REFRESH_INTERVAL', 60))
+BLOOM_CHANNEL = os.getenv('BLOOM_CHANNEL', 'bloom:changed')
+
+# Автоматический выключатель запросов к эластику, свой для каждого типа
+# операции (get, mget, search...): после ELASTIC_BREAKER_FAILURES отказов
+# подряд запросы не выполняются ELASTIC_BREAKER_RESET_TIMEOUT секунд,
+# затем пропускаются ELASTIC_BREAKER_HALF_OPEN_CALLS пробных. Пока
+# эластик недоступен, промахи кеша отдаются из резервных копий записей,
+# которые живут в редисе STALE_CACHE_TTL секунд, а без копии - 503
+ELASTIC_BREAKER_ENABLED = os.environ.get(
+    'ELASTIC_BREAKER_ENABLED', False
+) == 'True'
+ELASTIC_BREAKER_FAILURES = int(os.getenv('ELASTIC_BREAKER_FAILURES', 5))
+ELASTIC_BREAKER_RESET_TIMEOUT = float(
+    os.getenv('ELASTIC_BREAKER_RESET_TIMEOUT', 10)
+)
+ELASTIC_BREAKER_HALF_OPEN_CALLS = int(
+    os.getenv('ELASTIC_BREAKER_HALF_OPEN_CALLS', 1)
+)
+STALE_CACHE_TTL = int(os.getenv('STALE_CACHE_TTL', 60 * 60 * 24))
+
+# Ограничение нагрузки на воркер (core.admission): у каждой группы
+# маршрутов свой лимит одновременных запросов, длина очереди ожидания
+# и наибольшее время ожидания в ней, мс. Дорогие поиск и выгрузка
+# не занимают слоты дешевых маршрутов. Запрос сверх очереди или не
+# дождавшийся слота сразу получает 503 с Retry-After (секунд)
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', False) == 'True'
+ADMISSION_LIMITS = {
+    group: (
+        int(os.getenv(f'ADMISSION_{group.upper()}_LIMIT', limit)),
+        int(os.getenv(f'ADMISSION_{group.upper()}_QUEUE', queue)),
+        int(os.getenv(
+            f'ADMISSION_{group.upper()}_QUEUE_TIMEOUT_MS', timeout
+        )),
+    )
+    for group, limit, queue, timeout in (
+        ('default', 100, 200, 1000),
+        ('list', 20, 40, 500),
+        ('search', 10, 20, 500),
+        ('export', 2, 0, 0),
+    )
+}
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+# Срок обработки запроса, секунд: из заголовка X-Request-Timeout (не больше
+# REQUEST_TIMEOUT_MAX) или по умолчанию для группы маршрутов, 0 - без
+# срока. Он ограничивает ожидание в очереди, собственные загрузки из
+# эластика (request_timeout клиента и timeout поиска - доля
+# ELASTIC_SEARCH_TIMEOUT_SHARE остатка) и ожидание общих загрузок через
+# кеш; сами общие загрузки идут без срока, их ждут и другие запросы
+REQUEST_DEADLINE_ENABLED = os.environ.get(
+    'REQUEST_DEADLINE_ENABLED', False
+) == 'True'
+REQUEST_TIMEOUTS = {
+    group: float(os.getenv(f'REQUEST_TIMEOUT_{group.upper()}', timeout))
+    for group, timeout in (
+        ('default', 2), ('list', 3), ('search', 3), ('export', 0),
+    )
+}
+REQUEST_TIMEOUT_MAX = float(os.getenv('REQUEST_TIMEOUT_MAX', 30))
+ELASTIC_SEARCH_TIMEOUT_SHARE = float(
+    os.getenv('ELASTIC_SEARCH_TIMEOUT_SHARE', 0.8)
+)
+# Пакетная загрузка get_by_id: одновременные запросы воркера к разным
+# uuid одной сущности объединяются в один MGET редиса и один _mget
+# эластика. Пока пакет загружается, следующий копится
+# BATCH_LOADER_WINDOW_MS, но не больше BATCH_LOADER_MAX_SIZE uuid
+BATCH_LOADER_ENABLED = os.environ.get('BATCH_LOADER_ENABLED', False) == 'True'
+BATCH_LOADER_WINDOW_MS = float(os.getenv('BATCH_LOADER_WINDOW_MS', 1))
+BATCH_LOADER_MAX_SIZE = int(os.getenv('BATCH_LOADER_MAX_SIZE', 100))
+# Объединение поисков списков и поиска (промахов кеша) одновременных
+# запросов воркера в один _msearch эластика. Окно и размер пакета -
+# как у BATCH_LOADER
+ELASTIC_MSEARCH_ENABLED = os.environ.get(
+    'ELASTIC_MSEARCH_ENABLED', False
+) == 'True'
+ELASTIC_MSEARCH_WINDOW_MS = float(os.getenv('ELASTIC_MSEARCH_WINDOW_MS', 2))
+ELASTIC_MSEARCH_MAX_SIZE = int(os.getenv('ELASTIC_MSEARCH_MAX_SIZE', 20))
+# Наибольший размер страницы списков и поиска
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+# Выгрузка всех документов индекса (/films/export, /persons/export):
+# размер страницы эластика и время жизни point-in-time между страницами
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', 1000))
+EXPORT_PIT_KEEP_ALIVE = os.getenv('EXPORT_PIT_KEEP_ALIVE', '5m')
+
+# Наибольшее число uuid в одном пакетном запросе (POST .../batch)
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', 100))
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+from core import config
+
+R = TypeVar('R')
+
+# Заголовок, которым клиент задает свой срок ответа, в секундах
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+# Крайний срок запроса по time.monotonic(), None - без срока.
+# Ставится зависимостью маршрута (core.admission) в задаче запроса и
+# копируется в задачи, которые она запускает (загрузки single flight)
+DEADLINE: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Срок запроса истек, продолжать работу незачем"""
+
+
+def request_timeout(header: Optional[str],
+                    default: float) -> Optional[float]:
+    """Срок запроса в секундах: из заголовка (не больше
+    REQUEST_TIMEOUT_MAX) или default маршрута. Некорректный заголовок
+    игнорируется. None - без срока: у маршрутов с default 0 (потоковые
+    выгрузки) срока нет и с заголовком"""
+    if default <= 0:
+        return None
+    try:
+        timeout = float(header) if header else default
+    except ValueError:
+        timeout = default
+    if timeout <= 0:
+        timeout = default
+    return min(timeout, config.REQUEST_TIMEOUT_MAX)
+
+
+def start(timeout: Optional[float]):
+    DEADLINE.set(None if timeout is None else time.monotonic() + timeout)
+
+
+def clear():
+    DEADLINE.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Сколько секунд осталось до срока, None - срока нет"""
+    deadline = DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check():
+    """Не начинать работу, если срок уже истек"""
+    if expired():
+        raise DeadlineExceeded()
+
+
+def elastic_timeouts(search: bool = False) -> dict:
+    """Параметры запроса к эластику по оставшемуся сроку: request_timeout
+    клиента, а для поиска еще и timeout самого эластика. Он короче на
+    запас на сеть и сборку ответа: по нему эластик отдает собранное
+    к этому моменту с timed_out вместо того, чтобы не ответить вовсе"""
+    left = remaining()
+    if left is None:
+        return {}
+    left = max(left, 0.001)
+    params = {'request_timeout': left}
+    if search:
+        share = config.ELASTIC_SEARCH_TIMEOUT_SHARE
+        params['timeout'] = f'{max(int(left * share * 1000), 1)}ms'
+    return params
+
+
+async def wait(awaitable: Awaitable[R]) -> R:
+    """Ожидание не дольше оставшегося срока. Отменяется только
+    ожидание: общая загрузка single flight защищена shield и
+    продолжается для остальных запросов"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        if not expired():
+            # Таймаут самой загрузки, а не срока запроса
+            raise
+        raise DeadlineExceeded() from None
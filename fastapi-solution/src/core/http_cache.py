@@ -0,0 +1,153 @@
+import hashlib
+from contextvars import ContextVar
+from typing import List, Optional, Sequence
+
+from core import config
+from fastapi import Depends, Request
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Ключ в request.state с заголовком Cache-Control маршрута
+CACHE_CONTROL_STATE = 'cache_control'
+# Ответ собран из резервных копий кеша, пока эластик недоступен
+# (см. services.base.ElasticUnavailable). Флаг ставится в задаче запроса
+DEGRADED = ContextVar('degraded', default=False)
+DEGRADED_HEADER = 'X-Degraded'
+# Выдача неполная: поиск эластика прерван по сроку запроса (timed_out)
+PARTIAL = ContextVar('partial', default=False)
+PARTIAL_HEADER = 'X-Partial-Results'
+# Значения If-None-Match условного запроса (GET и HEAD), см. not_modified
+IF_NONE_MATCH: ContextVar[Sequence[str]] = ContextVar(
+    'if_none_match', default=()
+)
+
+
+def mark_degraded():
+    DEGRADED.set(True)
+
+
+def mark_partial():
+    PARTIAL.set(True)
+
+
+def cache_control(entity: str):
+    """Зависимость маршрута: успешный ответ получает ETag и Cache-Control
+    со временем жизни записей entity в config.CACHE_TTL - свежим
+    до мягкого TTL и допустимым к отдаче устаревшим до жесткого.
+    Страницы по курсору не кешируются: курсор ссылается на PIT,
+    который живет недолго"""
+    soft, hard = config.CACHE_TTL[entity]
+    value = f'public, max-age={soft}, stale-while-revalidate={hard - soft}'
+
+    # async: синхронную зависимость FastAPI выполнял бы в пуле потоков
+    async def dependency(request: Request):
+        if 'cursor' not in request.query_params:
+            setattr(request.state, CACHE_CONTROL_STATE, value)
+    return Depends(dependency)
+
+
+def build_etag(body: bytes) -> str:
+    """Сильный ETag - хеш тела ответа"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def not_modified(etag: str) -> bool:
+    """Клиент уже получил тело с этим ETag - ответ можно заменить
+    на 304, не собирая его"""
+    if_none_match = IF_NONE_MATCH.get()
+    return etag in if_none_match or '*' in if_none_match
+
+
+def parse_etags(value: Optional[str]) -> List[str]:
+    """Значения If-None-Match. Для GET сравнение слабое,
+    поэтому префикс W/ отбрасывается"""
+    if not value:
+        return []
+    return [tag.strip().removeprefix('W/') for tag in value.split(',')]
+
+
+class ConditionalRequestMiddleware:
+    """Условные запросы для маршрутов с cache_control.
+    Тело успешного ответа хешируется в ETag; если он совпал с
+    If-None-Match, вместо тела отдается пустой 304 Not Modified.
+    Это экономит только передачу: ответ уже собран. Ответ, у которого
+    ETag есть заранее (кеш ответов, services.responses), и 304 маршрута
+    проходят без буферизации, получая лишь Cache-Control - так 304
+    обходится без чтения данных и сериализации только при включенном
+    RESPONSE_CACHE_ENABLED. Потоковые ответы (несколько кусков тела)
+    не меняются.
+    Ответ, помеченный mark_degraded, получает заголовки X-Degraded и
+    Warning, помеченный mark_partial - X-Partial-Results, а кешировать
+    их клиентам и прокси запрещается"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        DEGRADED.set(False)
+        PARTIAL.set(False)
+        conditional = scope['method'] in ('GET', 'HEAD')
+        state = scope.setdefault('state', {})
+        if_none_match = parse_etags(Headers(scope=scope).get('if-none-match'))
+        IF_NONE_MATCH.set(if_none_match if conditional else ())
+        start: Optional[Message] = None
+
+        async def send_conditional(message: Message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                if DEGRADED.get() or PARTIAL.get():
+                    message = {**message, 'headers': list(message['headers'])}
+                    headers = MutableHeaders(scope=message)
+                    if DEGRADED.get():
+                        headers[DEGRADED_HEADER] = 'true'
+                        headers['Warning'] = '110 - "Response is Stale"'
+                    if PARTIAL.get():
+                        headers[PARTIAL_HEADER] = 'true'
+                    headers['Cache-Control'] = 'no-store'
+                    await send(message)
+                    return
+                value = state.get(CACHE_CONTROL_STATE)
+                has_etag = any(
+                    name == b'etag' for name, _ in message['headers']
+                )
+                if conditional and value is not None and (
+                        message['status'] == 304 or has_etag):
+                    # ETag выставлен маршрутом до сборки тела
+                    message = {**message, 'headers': list(message['headers'])}
+                    headers = MutableHeaders(scope=message)
+                    headers['Cache-Control'] = value
+                    if message['status'] == 304:
+                        del headers['Content-Length']
+                    await send(message)
+                    return
+                if conditional and message['status'] == 200:
+                    # Заголовки придержим до тела - по нему считается ETag
+                    start = message
+                    return
+            if start is None:
+                await send(message)
+                return
+            message_start = {**start, 'headers': list(start['headers'])}
+            start = None
+            value = state.get(CACHE_CONTROL_STATE)
+            if value is None or message.get('more_body'):
+                await send(message_start)
+                await send(message)
+                return
+            headers = MutableHeaders(scope=message_start)
+            etag = build_etag(message.get('body', b''))
+            headers['ETag'] = etag
+            headers['Cache-Control'] = value
+            if not_modified(etag):
+                del headers['Content-Length']
+                del headers['Content-Type']
+                await send({**message_start, 'status': 304})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            await send(message_start)
+            await send(message)
+
+        await self.app(scope, receive, send_conditional)
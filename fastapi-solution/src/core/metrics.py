@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from core import config
+from db import elastic, redis
+from fastapi import Request, Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Под gunicorn каждый воркер пишет метрики в файлы каталога
+# PROMETHEUS_MULTIPROC_DIR, а /metrics собирает их со всех воркеров
+MULTIPROCESS = 'PROMETHEUS_MULTIPROC_DIR' in os.environ
+
+LATENCY_BUCKETS = (
+    .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Обращения к кешу по типам записей',
+    ['layer', 'entity', 'result'],
+)
+BACKEND_LATENCY = Histogram(
+    'backend_request_duration_seconds',
+    'Время запросов к редису и эластику, измеренное клиентом',
+    ['backend', 'operation', 'entity'], buckets=LATENCY_BUCKETS,
+)
+ELASTIC_TOOK = Histogram(
+    'elasticsearch_took_seconds', 'Время выполнения запроса по данным ES',
+    ['operation', 'entity'], buckets=LATENCY_BUCKETS,
+)
+BLOOM_CHECKS = Counter(
+    'bloom_checks', 'Проверки uuid по фильтру Блума индекса: reject - '
+    'документа точно нет, pass - возможно есть, false_positive - '
+    'пропущенного фильтром документа не оказалось в эластике',
+    ['index', 'result'],
+)
+BLOOM_ITEMS = Gauge(
+    'bloom_items', 'Число документов в фильтре Блума индекса',
+    ['index'], multiprocess_mode='max',
+)
+BLOOM_FALSE_POSITIVE_RATE = Gauge(
+    'bloom_estimated_false_positive_rate',
+    'Оценка доли ложных срабатываний фильтра Блума по его заполнению',
+    ['index'], multiprocess_mode='max',
+)
+ADMISSION_REQUESTS = Gauge(
+    'admission_requests', 'Запросы групп маршрутов: выполняются '
+    '(active) и ждут слота в очереди (queued)',
+    ['group', 'state'], multiprocess_mode='livesum',
+)
+ADMISSION_SHED = Counter(
+    'admission_shed', 'Запросы, отклоненные с 503: очередь заполнена '
+    '(queue_full) или слот не освободился вовремя (queue_timeout)',
+    ['group', 'reason'],
+)
+ELASTIC_BREAKER_STATE = Gauge(
+    'elastic_breaker_state', 'Состояние выключателя запросов к эластику: '
+    '0 - закрыт, 1 - полуоткрыт, 2 - разомкнут',
+    ['operation'], multiprocess_mode='max',
+)
+ELASTIC_BREAKER_REJECTED = Counter(
+    'elastic_breaker_rejected', 'Запросы к эластику, не выполненные '
+    'из-за разомкнутого выключателя',
+    ['operation'],
+)
+ELASTIC_PARTIAL = Counter(
+    'elastic_partial_results', 'Поиски, прерванные эластиком по сроку '
+    'запроса (timed_out) и отданные неполными',
+    ['operation', 'entity'],
+)
+DEADLINE_EXCEEDED = Counter(
+    'request_deadline_exceeded', 'Запросы, брошенные по истечении срока',
+    ['route'],
+)
+BATCH_LOADER_SIZE = Histogram(
+    'batch_loader_size', 'Число uuid в пакетах, собранных из одновременных '
+    'запросов get_by_id',
+    ['entity'], buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+ELASTIC_MSEARCH_SIZE = Histogram(
+    'elastic_msearch_size', 'Число поисков в пакетах _msearch, собранных '
+    'из одновременных запросов',
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+POOL_CONNECTIONS = Gauge(
+    'pool_connections', 'Соединения в пулах воркеров',
+    ['backend', 'state'], multiprocess_mode='livesum',
+)
+
+
+@contextmanager
+def backend_timer(backend: str, operation: str, entity: str):
+    """Замер времени запроса к редису или эластику"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        BACKEND_LATENCY.labels(backend, operation, entity).observe(
+            time.perf_counter() - started
+        )
+
+
+def observe_took(operation: str, entity: str, response: Optional[dict]):
+    """Время выполнения запроса на стороне эластика (поле took, мс)"""
+    if isinstance(response, dict) and 'took' in response:
+        ELASTIC_TOOK.labels(operation, entity).observe(
+            response['took'] / 1000
+        )
+
+
+def count_cache(layer: str, entity: str, result: str):
+    """Учет обращения к кешу: local_hit, hit, stale или miss"""
+    CACHE_REQUESTS.labels(layer, entity, result).inc()
+
+
+def count_bloom(index: str, result: str):
+    """Учет проверки по фильтру Блума: reject, pass или false_positive"""
+    BLOOM_CHECKS.labels(index, result).inc()
+
+
+def update_bloom_gauges(index: str, items: int, false_positive_rate: float):
+    BLOOM_ITEMS.labels(index).set(items)
+    BLOOM_FALSE_POSITIVE_RATE.labels(index).set(false_positive_rate)
+
+
+def update_admission_gauges(group: str, active: int, queued: int):
+    ADMISSION_REQUESTS.labels(group, 'active').set(active)
+    ADMISSION_REQUESTS.labels(group, 'queued').set(queued)
+
+
+def count_shed(group: str, reason: str):
+    ADMISSION_SHED.labels(group, reason).inc()
+
+
+BREAKER_STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def set_breaker_state(operation: str, state: str):
+    ELASTIC_BREAKER_STATE.labels(operation).set(BREAKER_STATES[state])
+
+
+def count_breaker_rejected(operation: str):
+    ELASTIC_BREAKER_REJECTED.labels(operation).inc()
+
+
+def count_partial(operation: str, entity: str):
+    ELASTIC_PARTIAL.labels(operation, entity).inc()
+
+
+def count_deadline_exceeded(route: str):
+    DEADLINE_EXCEEDED.labels(route).inc()
+
+
+def observe_batch(entity: str, size: int):
+    BATCH_LOADER_SIZE.labels(entity).observe(size)
+
+
+def observe_msearch(size: int):
+    ELASTIC_MSEARCH_SIZE.observe(size)
+
+
+# Маршруты по обработчикам, см. route_template
+_endpoint_routes: Dict[Callable, List[BaseRoute]] = {}
+
+
+def route_template(request: Request) -> str:
+    """Шаблон пути маршрута, например /api/v1/films/{film_id}.
+    Роутер уже нашел обработчик (endpoint в scope), поэтому сверяются
+    только маршруты этого обработчика - обычно один (у /films/ и
+    /films/search он общий). Для несуществующих путей - один общий
+    лейбл, чтобы не плодить серии"""
+    endpoint = request.scope.get('endpoint')
+    if endpoint is None:
+        return 'unmatched'
+    routes = _endpoint_routes.get(endpoint)
+    if routes is None:
+        routes = _endpoint_routes[endpoint] = [
+            route for route in request.app.router.routes
+            if getattr(route, 'endpoint', None) is endpoint
+        ]
+    if len(routes) == 1:
+        return routes[0].path
+    for route in routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+def update_pool_gauges():
+    """Состояние пулов соединений воркера для /metrics"""
+    redis_stats = redis.pool_stats()
+    elastic_nodes = elastic.pool_stats().values()
+    for state in ('in_use', 'idle', 'waiting'):
+        POOL_CONNECTIONS.labels('redis', state).set(redis_stats.get(state, 0))
+        POOL_CONNECTIONS.labels('elastic', state).set(sum(
+            node[state] for node in elastic_nodes
+        ))
+
+
+class PoolMonitor:
+    """Обновление метрик пулов раз в POOL_METRICS_INTERVAL. Каждый воркер
+    пишет свои значения, а /metrics обрабатывает только один из них,
+    поэтому обновлять их лишь при сборе метрик недостаточно"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                update_pool_gauges()
+            except Exception:
+                logger.exception('Failed to update pool metrics')
+            await asyncio.sleep(config.POOL_METRICS_INTERVAL)
+
+
+# Монитор пулов воркера, создается при старте приложения
+pool_monitor: Optional[PoolMonitor] = None
+
+
+class MetricsMiddleware:
+    """Время обработки запросов по маршрутам.
+    Чистый ASGI: без задачи и канала на каждый запрос, как у
+    BaseHTTPMiddleware. Потоковые ответы замеряются до отправки
+    последнего куска тела"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(
+                scope['method'], route_template(Request(scope)), status
+            ).observe(time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    update_pool_gauges()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
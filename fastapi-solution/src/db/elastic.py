@@ -5,5 +5,27 @@ from elasticsearch import AsyncElasticsearch
 es: Optional[AsyncElasticsearch] = None
 
 
+def pool_stats() -> dict:
+    """Статистика пулов HTTP-соединений эластика текущего воркера,
+    по одному на каждый узел. Пул создается при первом запросе к узлу"""
+    if es is None:
+        return {}
+    stats = {}
+    for connection in es.transport.connection_pool.connections:
+        session = getattr(connection, 'session', None)
+        connector = getattr(session, 'connector', None)
+        if connector is None:
+            continue
+        waiters = getattr(connector, '_waiters', {})
+        idle = sum(len(conns) for conns in connector._conns.values())
+        stats[connection.host] = {
+            'max': connector.limit,
+            'in_use': len(connector._acquired),
+            'idle': idle,
+            'waiting': sum(len(queue) for queue in waiters.values()),
+        }
+    return stats
+
+
 async def get_elastic() -> AsyncElasticsearch:
     return es
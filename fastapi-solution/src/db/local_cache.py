@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from aioredis import Redis
+
+logger = logging.getLogger(__name__)
+
+# Сообщение в канале инвалидации, по которому кеш очищается полностью
+FLUSH_ALL = '*'
+
+
+class LocalCache:
+    """In-memory кеш внутри воркера, стоящий перед редисом.
+    Ограничен по количеству записей (вытесняются давно не читанные - LRU)
+    и по времени жизни каждой записи.
+    Хранит уже разобранные объекты, поэтому попадание не требует
+    ни похода в редис, ни повторной валидации pydantic."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, *keys: Hashable):
+        for key in keys:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def start_listener(self, redis: Redis, channel: str):
+        """Запуск фоновой подписки на канал инвалидации.
+        redis - клиент без таймаута чтения (db.redis.blocking_redis)"""
+        self._listener = asyncio.create_task(self._listen(redis, channel))
+
+    async def stop_listener(self):
+        if self._listener is None:
+            return
+        self._listener.cancel()
+        try:
+            await self._listener
+        except asyncio.CancelledError:
+            pass
+        self._listener = None
+
+    async def _listen(self, redis: Redis, channel: str):
+        """Удаление записей, инвалидированных в других воркерах.
+        Пока подписки нет, сообщения теряются, поэтому после
+        переподключения локальный кеш очищается целиком."""
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                self.clear()
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    key = message['data']
+                    if isinstance(key, bytes):
+                        key = key.decode()
+                    if key == FLUSH_ALL:
+                        self.clear()
+                    else:
+                        self.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Cache invalidation listener failed')
+                self.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+
+local_cache: Optional[LocalCache] = None
+
+
+async def get_local_cache() -> Optional[LocalCache]:
+    return local_cache
@@ -1,8 +1,70 @@
+import time
 from typing import Optional
 
-from aioredis import Redis
+from aioredis import BlockingConnectionPool, Redis
+from aioredis.exceptions import ConnectionError
 
 redis: Optional[Redis] = None
+# Клиент для блокирующих чтений: подписок pub/sub и XREADGROUP с
+# ожиданием. Его пул без socket_timeout - иначе простаивающее чтение
+# обрывается таймаутом основного пула
+blocking_redis: Optional[Redis] = None
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """Пул соединений редиса со статистикой.
+    При исчерпании пула запрос ждет свободное соединение не дольше timeout,
+    число и суммарное время таких ожиданий накапливаются в счетчиках"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waiting = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    async def get_connection(self, command_name, *keys, **options):
+        if not self.pool.empty():
+            return await super().get_connection(
+                command_name, *keys, **options
+            )
+        self.waits += 1
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            return await super().get_connection(
+                command_name, *keys, **options
+            )
+        except ConnectionError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+            self.wait_seconds += time.monotonic() - started
+
+    def stats(self) -> dict:
+        # В очереди пула лежат свободные соединения и None на месте
+        # еще не созданных
+        idle = sum(1 for conn in self.pool._queue if conn is not None)
+        created = len(self._connections)
+        return {
+            'max': self.max_connections,
+            'created': created,
+            'in_use': created - idle,
+            'idle': idle,
+            'waiting': self.waiting,
+            'waits': self.waits,
+            'wait_seconds': round(self.wait_seconds, 6),
+            'timeouts': self.timeouts,
+        }
+
+
+def pool_stats() -> dict:
+    """Статистика пула соединений редиса текущего воркера"""
+    pool = getattr(redis, 'connection_pool', None)
+    if not isinstance(pool, InstrumentedConnectionPool):
+        return {}
+    return pool.stats()
 
 
 async def get_redis() -> Redis:
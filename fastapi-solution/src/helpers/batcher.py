@@ -0,0 +1,72 @@
+import asyncio
+from typing import (Any, Awaitable, Callable, Dict, Hashable, List, Optional,
+                    Set)
+
+
+class MicroBatcher:
+    """Объединение одновременных запросов по ключам в пакеты.
+    Ключи, запрошенные до отправки пакета, загружаются одним вызовом
+    load_many(keys) -> {key: value}; одинаковые ключи загружаются один раз.
+    Пока ни один пакет не загружается, пакет отправляется на следующем
+    обороте цикла событий, и одиночный запрос почти не ждет. Если
+    предыдущий пакет еще в работе, ключи копятся window секунд, но не
+    больше max_size - полный пакет отправляется сразу."""
+
+    def __init__(self, load_many: Callable[[List[Hashable]], Awaitable[dict]],
+                 window: float, max_size: int):
+        self.load_many = load_many
+        self.window = window
+        self.max_size = max_size
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._timer: Optional[asyncio.Handle] = None
+        # Загружаемые пакеты, ссылки держим, чтобы задачи не собрал GC
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def load(self, key: Hashable) -> Any:
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[key] = loop.create_future()
+            future.add_done_callback(self._retrieve)
+            if len(self._pending) >= self.max_size:
+                self._flush()
+            elif self._timer is None:
+                if self._inflight and self.window > 0:
+                    self._timer = loop.call_later(self.window, self._flush)
+                else:
+                    self._timer = loop.call_soon(self._flush)
+        # shield: отмена одного из ожидающих не отменяет загрузку пакета
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._dispatch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: Dict[Hashable, asyncio.Future]):
+        try:
+            results = await self.load_many(list(batch))
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as error:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
+
+    @staticmethod
+    def _retrieve(future: asyncio.Future):
+        # Помечаем исключение полученным, даже если ждать было некому
+        if not future.cancelled():
+            future.exception()
@@ -0,0 +1,59 @@
+import hashlib
+import math
+from typing import Iterable, List, Optional
+
+
+class BloomFilter:
+    """Фильтр Блума: проверка, что элемента точно нет в множестве.
+    Биты хранятся в формате битмапа редиса (бит 0 - старший бит первого
+    байта), поэтому фильтр записывается в редис одной строкой через SET
+    и читается через GET. Позиции элемента - двойное хеширование по
+    двум половинам blake2b"""
+
+    def __init__(self, size: int, hashes: int,
+                 bits: Optional[bytes] = None):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(bits) if bits is not None \
+            else bytearray((size + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int,
+                     error_rate: float) -> 'BloomFilter':
+        """Фильтр на capacity элементов с долей ложных срабатываний
+        не больше error_rate при заполнении"""
+        capacity = max(capacity, 1)
+        size = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        )
+        hashes = max(round(size / capacity * math.log(2)), 1)
+        return cls(size, hashes)
+
+    def positions(self, item: str) -> List[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def update(self, items: Iterable[str]):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (0x80 >> (position & 7))
+            for position in self.positions(item)
+        )
+
+    def fill_ratio(self) -> float:
+        """Доля установленных битов"""
+        ones = bin(int.from_bytes(self.bits, 'big')).count('1')
+        return ones / self.size
+
+    def false_positive_rate(self) -> float:
+        """Оценка доли ложных срабатываний при текущем заполнении"""
+        return self.fill_ratio() ** self.hashes
@@ -0,0 +1,94 @@
+from typing import Any, Optional
+
+import lz4.frame as lz4_frame
+import msgpack
+import orjson
+import zstandard
+
+# Первый байт записи - версия формата: младшие биты задают сериализацию,
+# старшие - сжатие. Значения выбраны так, что с них не может начинаться
+# JSON, поэтому записи без заголовка читаются как JSON. Это позволяет
+# выкатывать смену формата постепенно: новые воркеры читают старые записи.
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FORMAT_MASK = 0x0F
+COMPRESSION_ZSTD = 0x40
+COMPRESSION_LZ4 = 0x80
+COMPRESSION_MASK = 0xF0
+
+SERIALIZERS = {'json': FORMAT_JSON, 'msgpack': FORMAT_MSGPACK}
+COMPRESSIONS = {'zstd': COMPRESSION_ZSTD, 'lz4': COMPRESSION_LZ4}
+HEADERS = {
+    serializer | compression
+    for serializer in SERIALIZERS.values()
+    for compression in (0, *COMPRESSIONS.values())
+}
+
+
+class CacheCodecError(ValueError):
+    """Запись кеша не удалось разобрать"""
+
+
+class CacheCodec:
+    """Сериализация записей кеша с версионированным заголовком.
+
+    serializer - json (orjson) или msgpack, compression - zstd, lz4 или
+    None; сжимаются только данные длиннее compress_min_size байт.
+    JSON без сжатия пишется без заголовка, как и раньше."""
+
+    def __init__(self, serializer: str = 'json',
+                 compression: Optional[str] = None,
+                 compress_min_size: int = 1024):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f'Unknown cache serializer: {serializer}')
+        if compression and compression not in COMPRESSIONS:
+            raise ValueError(f'Unknown cache compression: {compression}')
+        self.format = SERIALIZERS[serializer]
+        self.compression = COMPRESSIONS.get(compression, 0)
+        self.compress_min_size = compress_min_size
+
+    def dumps(self, obj: Any) -> bytes:
+        if self.format == FORMAT_MSGPACK:
+            data = msgpack.packb(obj, use_bin_type=True)
+        else:
+            data = orjson.dumps(obj)
+        header = self.format
+        if self.compression and len(data) >= self.compress_min_size:
+            data = _compress(self.compression, data)
+            header |= self.compression
+        elif header == FORMAT_JSON:
+            return data
+        return bytes((header,)) + data
+
+    def loads(self, data: bytes) -> Any:
+        """Разбор записи в любом из поддерживаемых форматов,
+        независимо от того, какой формат выбран для записи"""
+        header = data[0]
+        try:
+            if header not in HEADERS:
+                # Запись без заголовка - JSON в старом формате
+                return orjson.loads(data)
+            data = data[1:]
+            if header & COMPRESSION_MASK:
+                data = _decompress(header & COMPRESSION_MASK, data)
+            if header & FORMAT_MASK == FORMAT_MSGPACK:
+                return msgpack.unpackb(data, raw=False)
+            return orjson.loads(data)
+        except CacheCodecError:
+            raise
+        except Exception as error:
+            raise CacheCodecError(str(error)) from error
+
+
+def _compress(compression: int, data: bytes) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    return lz4_frame.compress(data)
+
+
+def _decompress(compression: int, data: bytes) -> bytes:
+    if compression == COMPRESSION_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == COMPRESSION_LZ4:
+        return lz4_frame.decompress(data)
+    raise CacheCodecError(f'Unknown cache compression: {compression:#x}')
@@ -0,0 +1,64 @@
+import time
+from typing import Callable, Optional
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Автоматический выключатель запросов к внешнему сервису.
+    Закрыт - запросы идут как обычно. После failure_threshold отказов
+    подряд размыкается: reset_timeout секунд запросы не выполняются.
+    Затем полуоткрыт - пропускает не больше half_open_calls пробных
+    запросов: успех замыкает его, отказ снова размыкает.
+    on_change вызывается с новым состоянием при каждой смене"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 half_open_calls: int = 1,
+                 on_change: Optional[Callable[[str], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос. Разрешенный запрос должен
+        закончиться вызовом record"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._set_state(HALF_OPEN)
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                return False
+            self._probes += 1
+        return True
+
+    def record(self, success: Optional[bool]):
+        """Итог запроса: True - успех, False - отказ сервиса,
+        None - запрос прерван (например, отменен) без результата"""
+        if success is None:
+            if self.state == HALF_OPEN:
+                self._probes -= 1
+            return
+        if success:
+            self.failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or \
+                self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        if self.on_change is not None:
+            self.on_change(state)
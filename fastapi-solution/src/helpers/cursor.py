@@ -0,0 +1,44 @@
+import base64
+import binascii
+import hashlib
+from typing import Optional
+
+import orjson
+
+# Заголовок ответа с курсором следующей страницы
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+def encode_cursor(position: dict) -> str:
+    """Упаковка позиции в выдаче elasticsearch в непрозрачный курсор"""
+    return base64.urlsafe_b64encode(orjson.dumps(position)).decode()
+
+
+def decode_cursor(cursor: str) -> Optional[dict]:
+    """Распаковка курсора. Пустой курсор - начало выдачи.
+    Для некорректного курсора возвращает None"""
+    if not cursor:
+        return {}
+    try:
+        position = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(position, dict):
+        return None
+    if position and not (
+            set(position) <= {'after', 'pit', 'fp'}
+            and isinstance(position.get('after'), list)
+            and isinstance(position.get('fp'), str)
+            and isinstance(position.get('pit', ''), str)
+    ):
+        return None
+    return position
+
+
+def cursor_fingerprint(index: str, body: dict) -> str:
+    """Отпечаток выдачи курсора: индекс, запрос и сортировка. Курсор
+    одной выдачи нельзя продолжить с другими параметрами запроса"""
+    return hashlib.blake2b(orjson.dumps(
+        [index, body.get('query'), body.get('sort')],
+        option=orjson.OPT_SORT_KEYS
+    ), digest_size=8).hexdigest()
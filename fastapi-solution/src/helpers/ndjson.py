@@ -0,0 +1,43 @@
+from typing import AsyncIterator, List, Optional
+
+import orjson
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def split_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Список полей из параметра запроса через запятую"""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+async def ndjson_response(
+    pages: AsyncIterator[List[dict]]
+) -> StreamingResponse:
+    """Потоковый ответ NDJSON: по документу на строку, по куску на
+    страницу. Первая страница запрашивается до ответа, чтобы ошибка
+    эластика вернулась обычным кодом, а не оборванным телом. Остальные -
+    по мере того, как клиент забирает данные"""
+    try:
+        first = await pages.__anext__()
+    except StopAsyncIteration:
+        first = None
+
+    async def lines() -> AsyncIterator[bytes]:
+        if first is None:
+            return
+        try:
+            yield _dumps(first)
+            async for page in pages:
+                yield _dumps(page)
+        finally:
+            # Клиент отключился - выгрузка закрывается сразу
+            await pages.aclose()
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def _dumps(page: List[dict]) -> bytes:
+    return b''.join(orjson.dumps(doc) + b'\n' for doc in page)
@@ -0,0 +1,40 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом.
+    Пока загрузка по ключу выполняется, остальные вызовы с тем же ключом
+    не запускают свою, а ждут результат уже запущенной."""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    def start(self, key: str,
+              fn: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """Запуск загрузки по ключу без ожидания результата. Ключ
+        регистрируется сразу, поэтому загрузка, запущенная в фоне, видна
+        следующим вызовам еще до того, как задача начнет выполняться"""
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # shield: отмена одного из ожидающих не отменяет загрузку для других
+        return await asyncio.shield(self.start(key, fn))
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # Помечаем исключение полученным, даже если ждать было некому
+            future.exception()
+
+
+single_flight = SingleFlight()
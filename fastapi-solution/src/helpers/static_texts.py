@@ -1,3 +1,9 @@
 PERSON_404 = 'Persons not found'
 FILM_404 = 'Film not found'
 GENRE_404 = 'Genre not found'
+CURSOR_422 = 'Invalid cursor'
+CURSOR_410 = 'Cursor expired, restart from the first page'
+EXPORT_FIELDS_422 = 'Unknown export fields'
+OVERLOADED_503 = 'Service overloaded, retry later'
+ELASTIC_503 = 'Search backend unavailable, retry later'
+DEADLINE_504 = 'Request deadline exceeded'
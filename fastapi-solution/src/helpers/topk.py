@@ -0,0 +1,58 @@
+import heapq
+from typing import Dict, Hashable, List, Tuple
+
+
+class TopK:
+    """Приблизительный учет самых частых ключей (алгоритм Space-Saving).
+    Хранит не больше capacity счетчиков: новый ключ при заполнении
+    занимает место самого редкого и наследует его счетчик, поэтому
+    частые ключи не теряются, а память не растет с числом ключей.
+    Минимум ищется по куче с ленивым удалением устаревших записей."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts: Dict[Hashable, int] = {}
+        self._heap: List[Tuple[int, int, Hashable]] = []
+        # Порядковый номер записи в куче, чтобы не сравнивать сами ключи
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def record(self, key: Hashable, count: int = 1):
+        if self.capacity <= 0:
+            return
+        if key in self._counts:
+            self._counts[key] += count
+        elif len(self._counts) < self.capacity:
+            self._counts[key] = count
+        else:
+            self._counts[key] = self._pop_min() + count
+        self._push(key)
+
+    def items(self) -> List[Tuple[Hashable, int]]:
+        """Ключи со счетчиками по убыванию частоты"""
+        return sorted(self._counts.items(), key=lambda item: -item[1])
+
+    def pop_all(self) -> List[Tuple[Hashable, int]]:
+        """Накопленные счетчики с обнулением учета"""
+        items = self.items()
+        self._counts.clear()
+        self._heap.clear()
+        return items
+
+    def _push(self, key: Hashable):
+        self._seq += 1
+        heapq.heappush(self._heap, (self._counts[key], self._seq, key))
+        if len(self._heap) > 4 * self.capacity:
+            # Устаревших записей стало слишком много - пересобираем кучу
+            self._heap = [(count, seq, key) for seq, (key, count)
+                          in enumerate(self._counts.items())]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> int:
+        while True:
+            count, _, key = heapq.heappop(self._heap)
+            if self._counts.get(key) == count:
+                del self._counts[key]
+                return count
@@ -1,16 +1,22 @@
 import logging
+import math
 
 import aioredis
 import uvicorn
-from api.v1 import films, genres, persons
-from core import config
+from api.v1 import films, genres, persons, service
+from core import config, deadline, http_cache, metrics
 from core.logger import LOGGING
-from db import elastic, redis
+from db import elastic, local_cache, redis
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, Request, Response, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, ORJSONResponse
+from helpers import static_texts
+from services import changes, existence
+from services import genres as genre_services
+from services import warmup
+from services.base import CursorExpired, ElasticUnavailable, InvalidCursor
 
 app = FastAPI(
     title='Read-only API для онлайн-кинотеатра',
@@ -22,6 +28,9 @@ app = FastAPI(
     root_path="/film_api",
     default_response_class=ORJSONResponse,
 )
+# Метрики снаружи, чтобы в них попадали ответы 304
+app.add_middleware(http_cache.ConditionalRequestMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.exception_handler(RequestValidationError)
@@ -34,27 +43,144 @@ async def validation_exception_handler(
     )
 
 
+@app.exception_handler(CursorExpired)
+async def cursor_expired_handler(request: Request, exc: CursorExpired):
+    # Обход выдачи нужно начать заново с пустым курсором
+    return JSONResponse(
+        status_code=status.HTTP_410_GONE,
+        content={'detail': static_texts.CURSOR_410},
+    )
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content={'detail': static_texts.CURSOR_422},
+    )
+
+
+@app.exception_handler(ElasticUnavailable)
+async def elastic_unavailable_handler(
+    request: Request, exc: ElasticUnavailable
+):
+    # Промах кеша без резервной копии, пока эластик недоступен
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': static_texts.ELASTIC_503},
+        headers={'Retry-After': str(
+            math.ceil(config.ELASTIC_BREAKER_RESET_TIMEOUT)
+        )},
+    )
+
+
+@app.exception_handler(deadline.DeadlineExceeded)
+async def deadline_exceeded_handler(
+    request: Request, exc: deadline.DeadlineExceeded
+):
+    metrics.count_deadline_exceeded(metrics.route_template(request))
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={'detail': static_texts.DEADLINE_504},
+    )
+
+
 @app.on_event('startup')
 async def startup():
-    redis.redis = aioredis.from_url(
-        f'redis://{config.REDIS_HOST}:{config.REDIS_PORT}',
+    redis.redis = aioredis.Redis(
+        connection_pool=redis.InstrumentedConnectionPool.from_url(
+            f'redis://{config.REDIS_HOST}:{config.REDIS_PORT}',
+            password=config.REDIS_PASSWORD,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            timeout=config.REDIS_POOL_TIMEOUT,
+            socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+            socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+            socket_keepalive=True,
+            retry_on_timeout=config.REDIS_RETRY_ON_TIMEOUT,
+            health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+    )
+    redis.blocking_redis = aioredis.Redis(
+        connection_pool=aioredis.ConnectionPool.from_url(
+            f'redis://{config.REDIS_HOST}:{config.REDIS_PORT}',
+            password=config.REDIS_PASSWORD,
+            socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=config.REDIS_HEALTH_CHECK_INTERVAL,
+        )
     )
     elastic.es = AsyncElasticsearch(
-        hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}']
+        hosts=[f'{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'],
+        maxsize=config.ELASTIC_MAX_CONNECTIONS,
+        timeout=config.ELASTIC_TIMEOUT,
+        max_retries=config.ELASTIC_MAX_RETRIES,
+        retry_on_timeout=config.ELASTIC_RETRY_ON_TIMEOUT,
+        http_compress=config.ELASTIC_HTTP_COMPRESS,
     )
     if config.DEBUG:
         await redis.redis.flushdb()
+    metrics.pool_monitor = metrics.PoolMonitor()
+    metrics.pool_monitor.start()
+    if config.LOCAL_CACHE_ENABLED:
+        local_cache.local_cache = local_cache.LocalCache(
+            max_size=config.LOCAL_CACHE_MAX_SIZE, ttl=config.LOCAL_CACHE_TTL
+        )
+        local_cache.local_cache.start_listener(
+            redis.blocking_redis, config.LOCAL_CACHE_INVALIDATION_CHANNEL
+        )
+    if config.GENRE_REGISTRY_ENABLED:
+        genre_services.genre_registry = genre_services.GenreRegistry()
+        genre_services.genre_registry.start(
+            redis.blocking_redis, elastic.es, config.GENRE_REGISTRY_CHANNEL
+        )
+    if config.BLOOM_ENABLED:
+        existence.filters = existence.ExistenceFilters(
+            redis.redis, elastic.es, local_cache.local_cache,
+            blocking_redis=redis.blocking_redis,
+        )
+        existence.filters.start()
+    if config.CHANGE_FEED_ENABLED:
+        changes.consumer = changes.ChangeFeedConsumer(
+            redis.redis, elastic.es, local_cache.local_cache,
+            blocking_redis=redis.blocking_redis,
+        )
+        changes.consumer.start()
+    if config.WARMUP_ENABLED:
+        warmup.warmer = warmup.CacheWarmer(
+            redis.redis, elastic.es, local_cache.local_cache
+        )
+        warmup.warmer.start()
 
 
 @app.on_event('shutdown')
 async def shutdown():
+    if metrics.pool_monitor is not None:
+        await metrics.pool_monitor.stop()
+    if changes.consumer is not None:
+        await changes.consumer.stop()
+    if warmup.warmer is not None:
+        await warmup.warmer.stop()
+    if existence.filters is not None:
+        await existence.filters.stop()
+    if genre_services.genre_registry is not None:
+        await genre_services.genre_registry.stop()
+    if local_cache.local_cache is not None:
+        await local_cache.local_cache.stop_listener()
     await redis.redis.close()
+    await redis.blocking_redis.close()
     await elastic.es.close()
 
 
 app.include_router(films.router, prefix='/api/v1/films', tags=['Фильмы'])
 app.include_router(persons.router, prefix='/api/v1/persons', tags=['Люди'])
 app.include_router(genres.router, prefix='/api/v1/genres', tags=['Жанры'])
+app.include_router(service.router, prefix='/api/v1/service', tags=['Сервис'])
+
+
+@app.get('/metrics', include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    return metrics.metrics_response()
+
 
 if __name__ == '__main__':
     uvicorn.run(
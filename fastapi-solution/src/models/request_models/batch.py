@@ -0,0 +1,12 @@
+import uuid
+
+from core import config
+from pydantic import BaseModel, conlist
+
+
+class BatchRequest(BaseModel):
+    """Тело пакетного запроса: список uuid в нужном порядке"""
+    ids: conlist(uuid.UUID, min_items=1, max_items=config.BATCH_MAX_IDS)
+
+    def str_ids(self) -> list:
+        return [str(item_id) for item_id in self.ids]
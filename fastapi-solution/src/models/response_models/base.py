@@ -1,3 +1,5 @@
+from typing import ClassVar, Tuple
+
 import orjson
 from pydantic import BaseModel, validator
 
@@ -7,6 +9,8 @@ def orjson_dumps(v, *, default):
 
 
 class BaseResponse(BaseModel):
+    # Поля документа elasticsearch, из которых собирается ответ
+    source_fields: ClassVar[Tuple[str, ...]] = ('id',)
 
     uuid: str
 
@@ -5,6 +5,7 @@ from .base import BaseResponse
 
 class Film_API(BaseResponse):
     """Упрощенный сериализатор фильма для списков"""
+    source_fields = ('id', 'title', 'imdb_rating')
 
     title: str
     imdb_rating: float
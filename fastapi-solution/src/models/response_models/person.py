@@ -3,6 +3,7 @@ from .base import BaseResponse
 
 class Person(BaseResponse):
     """API модель для выдачи результата"""
+    source_fields = ('id', 'full_name', 'role', 'film_ids')
 
     full_name: str
     role: str
@@ -1,20 +1,102 @@
-import json
+import asyncio
+import logging
+import random
+import time
+import uuid
 from abc import abstractmethod
+from contextlib import contextmanager
 from functools import lru_cache
-from typing import List, Optional, TypeVar
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, List,
+                    Optional, Sequence, Set, Tuple, TypeVar)
 
+import orjson
 from aioredis import Redis
+from core import config, deadline, metrics
+from core.http_cache import mark_degraded, mark_partial
 from db.elastic import get_elastic
+from db.local_cache import FLUSH_ALL, LocalCache, get_local_cache
 from db.redis import get_redis
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import (AsyncElasticsearch, NotFoundError, RequestError,
+                           TransportError)
+from elasticsearch.exceptions import HTTP_EXCEPTIONS
 from fastapi import Depends
 from fastapi.encoders import jsonable_encoder
+from helpers.batcher import MicroBatcher
+from helpers.bloom import BloomFilter
+from helpers.cache_codec import CacheCodec, CacheCodecError
+from helpers.circuit_breaker import CircuitBreaker
+from helpers.cursor import cursor_fingerprint
+from helpers.singleflight import single_flight
+from helpers.topk import TopK
 from pydantic import parse_obj_as
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+logger = logging.getLogger(__name__)
 
 T = TypeVar("T", bound="BaseMovie")
 
+# Типы записей кеша, для каждого свое время жизни в config.CACHE_TTL
+FILM_CACHE = 'film'
+GENRE_CACHE = 'genre'
+PERSON_CACHE = 'person'
+LIST_CACHE = 'list'
+SEARCH_CACHE = 'search'
+
+# Теги ключей списков и поиска: sorted set ключей со временем их
+# истечения, по тегу находятся все страницы с документом, жанром и т.д.
+CACHE_TAG = 'tag'
+QUERY_TAG = 'query'
+# Тип записи кеша для документов индекса, по нему называются теги
+INDEX_ENTITIES = {
+    'movies': FILM_CACHE, 'genres': GENRE_CACHE, 'persons': PERSON_CACHE,
+}
+# Тег живет не меньше самого долгого ключа любого типа
+CACHE_TAG_TTL = int(max(
+    hard + soft * config.CACHE_TTL_JITTER
+    for soft, hard in config.CACHE_TTL.values()
+) * 1000)
+
+# Формат записей кеша данных в редисе
+cache_codec = CacheCodec(
+    serializer=config.CACHE_SERIALIZER,
+    compression=config.CACHE_COMPRESSION or None,
+    compress_min_size=config.CACHE_COMPRESS_MIN_BYTES,
+)
+
+# Самые частые запросы воркера для прогрева кеша, см. services.warmup
+hot_keys = TopK(config.WARMUP_TRACK_SIZE)
+
+# Фильтры Блума по uuid документов индексов, их загружает и обновляет
+# services.existence. Пока фильтра индекса нет, проверка пропускает все
+existence_filters: Dict[str, BloomFilter] = {}
+
+
+class _NotFound:
+    def __repr__(self) -> str:
+        return 'NOT_FOUND'
+
+
+# Отрицательная запись кеша: объекта нет в эластике или выдача пуста.
+# В редисе хранится байтом, с которого не начинается ни одна запись
+# cache_codec, при чтении превращается в NOT_FOUND. Живет
+# NEGATIVE_CACHE_TTL секунд и не обновляется в фоне
+NOT_FOUND = _NotFound()
+NEGATIVE_ENTRY = b'\x00'
+
+# Резервные копии записей кеша данных: живут STALE_CACHE_TTL секунд и
+# читаются, только когда эластик недоступен
+STALE_COPY = 'stale'
+
+# Ссылки на фоновые обновления кеша, чтобы задачи не собрал GC
+_background_tasks: Set[asyncio.Task] = set()
+
+# Снятие блокировки только ее владельцем
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 
 def build_redis_key(*args, **kwargs):
     """Создание структурированного ключа Redis"""
@@ -26,6 +108,184 @@ def build_redis_key(*args, **kwargs):
     return redis_key
 
 
+class ElasticUnavailable(Exception):
+    """Эластик недоступен: выключатель операции разомкнут
+    или запрос к нему завершился отказом"""
+
+    def __init__(self, operation: str):
+        super().__init__(f'Elasticsearch is unavailable for {operation}')
+        self.operation = operation
+
+
+class CursorExpired(Exception):
+    """Point-in-time курсора истек (клиент продолжил обход позже
+    ELASTIC_PIT_KEEP_ALIVE) или неизвестен эластику"""
+
+
+class InvalidCursor(Exception):
+    """Курсор выдан для другой выдачи (индекс, запрос или сортировка
+    отличаются) или эластик отверг его позицию"""
+
+
+# Выключатели запросов к эластику по типам операций
+elastic_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def elastic_breaker(operation: str) -> CircuitBreaker:
+    breaker = elastic_breakers.get(operation)
+    if breaker is None:
+        breaker = elastic_breakers[operation] = CircuitBreaker(
+            config.ELASTIC_BREAKER_FAILURES,
+            config.ELASTIC_BREAKER_RESET_TIMEOUT,
+            config.ELASTIC_BREAKER_HALF_OPEN_CALLS,
+            on_change=lambda state: metrics.set_breaker_state(
+                operation, state
+            ),
+        )
+    return breaker
+
+
+def is_elastic_failure(error: Exception) -> bool:
+    """Отказ самого эластика: нет соединения или таймаут (у них нет
+    HTTP-статуса), ошибка сервера или перегрузка (5xx, 429).
+    Ошибки запроса вроде 404 и 400 отказом не считаются"""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, TransportError):
+        status = error.status_code
+        return not isinstance(status, int) or status >= 500 or status == 429
+    return False
+
+
+@contextmanager
+def elastic_call(operation: str, entity: str):
+    """Запрос к эластику с замером времени. Запрос не начинается, если
+    срок запроса (core.deadline) истек, а прерванный по сроку поднимается
+    как DeadlineExceeded. При включенном ELASTIC_BREAKER_ENABLED запрос
+    идет через выключатель операции, а отказ эластика поднимается
+    как ElasticUnavailable"""
+    deadline.check()
+    breaker = elastic_breaker(operation) \
+        if config.ELASTIC_BREAKER_ENABLED else None
+    if breaker is not None and not breaker.allow():
+        metrics.count_breaker_rejected(operation)
+        raise ElasticUnavailable(operation)
+    success = None
+    try:
+        with metrics.backend_timer('elastic', operation, entity):
+            yield
+        success = True
+    except deadline.DeadlineExceeded:
+        # Срок вышел в ожидании общего пакета (_msearch) - не итог запроса
+        raise
+    except Exception as error:
+        if not is_elastic_failure(error):
+            success = True
+            raise
+        if deadline.expired():
+            # Таймаут по сроку вызывающего - не отказ эластика
+            raise deadline.DeadlineExceeded() from error
+        success = False
+        if breaker is None:
+            raise
+        raise ElasticUnavailable(operation) from error
+    finally:
+        if breaker is not None:
+            breaker.record(success)
+
+
+# Параметры elastic.search, которые переносятся в тело поиска в _msearch
+MSEARCH_BODY_PARAMS = {
+    'query': 'query', 'from_': 'from', 'size': 'size', 'sort': 'sort',
+    'timeout': 'timeout',
+}
+
+# Пакеты _msearch по клиентам эластика
+_msearch_batchers: Dict[AsyncElasticsearch, MicroBatcher] = {}
+
+
+def msearch_item(index: str, body: Optional[dict] = None,
+                 _source_includes: Optional[Sequence[str]] = None,
+                 request_timeout: Optional[float] = None,
+                 **params) -> Optional[str]:
+    """Поиск с параметрами elastic.search двумя строками NDJSON для
+    _msearch: заголовок с индексом и тело. Строка служит и ключом пакета:
+    одинаковые поиски выполняются один раз. request_timeout клиента не
+    переносится - каждый запрос ждет пакет не дольше своего срока.
+    None - у поиска есть параметры, которые в _msearch не перенести"""
+    body = dict(body or {})
+    for name, value in params.items():
+        if name not in MSEARCH_BODY_PARAMS:
+            return None
+        if value is not None:
+            body[MSEARCH_BODY_PARAMS[name]] = value
+    if _source_includes:
+        body['_source'] = {'includes': list(_source_includes)}
+    header = orjson.dumps({'index': index})
+    body = orjson.dumps(body, option=orjson.OPT_SORT_KEYS)
+    return b'\n'.join((header, body, b'')).decode()
+
+
+def msearch_error(response: dict) -> TransportError:
+    """Ошибка отдельного поиска из ответа _msearch - то же исключение,
+    что поднял бы клиент на такой же ответ search"""
+    status = response.get('status', 500)
+    error = response.get('error') or {}
+    kind = error.get('type', 'unknown') if isinstance(error, dict) else error
+    return HTTP_EXCEPTIONS.get(status, TransportError)(status, kind, response)
+
+
+def msearch_batcher(elastic: AsyncElasticsearch) -> MicroBatcher:
+    """Общий для сервисов воркера пакет поисков клиента elastic"""
+    batcher = _msearch_batchers.get(elastic)
+    if batcher is not None:
+        return batcher
+
+    async def load_many(items: List[str]) -> dict:
+        # Пакет общий для запросов с разными сроками, см. msearch_item
+        deadline.clear()
+        metrics.observe_msearch(len(items))
+        with metrics.backend_timer('elastic', 'msearch', SEARCH_CACHE):
+            response = await elastic.msearch(body=''.join(items))
+        return {
+            item: msearch_error(result) if 'error' in result else result
+            for item, result in zip(items, response['responses'])
+        }
+
+    batcher = _msearch_batchers[elastic] = MicroBatcher(
+        load_many, config.ELASTIC_MSEARCH_WINDOW_MS / 1000,
+        config.ELASTIC_MSEARCH_MAX_SIZE,
+    )
+    return batcher
+
+
+class PartialResults(list):
+    """Выдача эластика, собранная не полностью: поиск прерван по своему
+    timeout (timed_out). Отдается с пометкой, но не кешируется"""
+
+
+def build_tag(kind: str, *values: str) -> str:
+    """Ключ тега: тип (FILM_CACHE, GENRE_CACHE, PERSON_CACHE, LIST_CACHE
+    или QUERY_TAG) и значение"""
+    return build_redis_key(CACHE_TAG, kind, *values)
+
+
+def cache_tags(index: str, ids: Sequence[str] = (),
+               genre: Optional[str] = None,
+               query: Optional[str] = None) -> List[str]:
+    """Теги страницы списка или поиска по индексу index: все страницы
+    индекса (новый документ может попасть в любую из них), каждый
+    документ страницы, жанр фильтра и поисковый запрос"""
+    entity = INDEX_ENTITIES[index]
+    tags = [build_tag(LIST_CACHE, index)]
+    tags.extend(build_tag(entity, str(doc_id)) for doc_id in ids)
+    if genre:
+        tags.append(build_tag(GENRE_CACHE, genre))
+    if query:
+        tags.append(build_tag(QUERY_TAG, index, query.lower()))
+    return tags
+
+
 class AbstractServiceClass:
     @abstractmethod
     async def _get_instance_from_elastic(self, **params):
@@ -53,9 +313,404 @@ class AbstractBaseListServiceClass(AbstractServiceClass):
 
 
 class SimpleService:
-    def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
+    # Лейбл слоя кеша в метриках
+    cache_layer = 'data'
+    # Учитывать ли запросы сервиса в горячих ключах для прогрева
+    track_hot_keys = True
+    # Хранить ли резервные копии записей на время недоступности эластика
+    keep_stale_copy = True
+    # Объединять ли поиски сервиса с поисками других запросов в _msearch
+    # (при ELASTIC_MSEARCH_ENABLED)
+    coalesce_searches = True
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch,
+                 local_cache: Optional[LocalCache] = None):
         self.redis = redis
         self.elastic = elastic
+        self.local_cache = local_cache
+
+    async def _elastic_search(self, **params) -> dict:
+        """elastic.search(**params). При ELASTIC_MSEARCH_ENABLED
+        одновременные поиски воркера уходят в эластик одним _msearch,
+        ошибка отдельного поиска поднимается только у его запроса"""
+        item = msearch_item(**params) \
+            if config.ELASTIC_MSEARCH_ENABLED and self.coalesce_searches \
+            else None
+        if item is None:
+            return await self.elastic.search(**params)
+        result = await deadline.wait(msearch_batcher(self.elastic).load(item))
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _track(self, kind: str, *args):
+        """Учет запроса для прогрева: kind - тип загрузчика
+        в services.warmup, args - аргументы для его повторного вызова"""
+        if config.WARMUP_ENABLED and self.track_hot_keys:
+            hot_keys.record((kind, orjson.dumps([kind, *args])))
+
+    def _cache_ttl(self, entity: str) -> int:
+        """Время жизни записи в редисе в миллисекундах.
+        Мягкий TTL получает случайную надбавку, чтобы ключи, записанные
+        одновременно, не истекали одной волной. Окно устаревания
+        (жесткий TTL минус мягкий) остается постоянным - по нему
+        при чтении определяется, что запись пора обновить"""
+        soft, hard = config.CACHE_TTL[entity]
+        jitter = soft * random.uniform(0, config.CACHE_TTL_JITTER)
+        return int((hard + jitter) * 1000)
+
+    def _is_stale(self, pttl: int, entity: str) -> bool:
+        """Запись устарела, если ее остаток жизни попал в окно устаревания"""
+        soft, hard = config.CACHE_TTL[entity]
+        return 0 <= pttl <= (hard - soft) * 1000
+
+    def _encode(self, payload: Any) -> bytes:
+        return cache_codec.dumps(payload)
+
+    def _decode(self, data: bytes) -> Any:
+        return cache_codec.loads(data)
+
+    def _parse_cached(
+        self, key: str, data: bytes, parse: Optional[Callable[[Any], Any]]
+    ) -> Any:
+        """Разбор записи кеша. Нечитаемая запись считается промахом"""
+        if data == NEGATIVE_ENTRY:
+            return NOT_FOUND
+        try:
+            payload = self._decode(data)
+        except CacheCodecError:
+            logger.warning('Unreadable cache entry %s', key, exc_info=True)
+            return None
+        return parse(payload) if parse else payload
+
+    def _local_cache_get(self, key: str, entity: str) -> Any:
+        if self.local_cache is None:
+            return None
+        value = self.local_cache.get(key)
+        if value is not None:
+            metrics.count_cache(self.cache_layer, entity, 'local_hit')
+        return value
+
+    def _local_cache_set(self, key: str, value: Any, entity: str):
+        if self.local_cache is not None:
+            ttl = config.NEGATIVE_CACHE_TTL if value is NOT_FOUND \
+                else config.CACHE_TTL[entity][0]
+            self.local_cache.set(key, value, ttl=ttl)
+
+    def _cache_result(self, value: Any, pttl: int, entity: str) -> bool:
+        """Учет попадания в редис, возвращает признак устаревания"""
+        if value is NOT_FOUND:
+            metrics.count_cache(self.cache_layer, entity, 'negative_hit')
+            return False
+        stale = self._is_stale(pttl, entity)
+        metrics.count_cache(
+            self.cache_layer, entity, 'stale' if stale else 'hit'
+        )
+        return stale
+
+    async def _cache_read(
+        self, key: str, parse: Optional[Callable[[Any], Any]], entity: str
+    ) -> Tuple[Any, bool]:
+        """Чтение из кеша: сначала локальный кеш воркера, затем редис.
+        Запись из редиса декодируется и разбирается parse (если задан).
+        Возвращает значение и признак того, что оно устарело
+        (NOT_FOUND для отрицательной записи, None при промахе).
+        Свежее значение из редиса кладется в локальный кеш"""
+        value = self._local_cache_get(key, entity)
+        if value is not None:
+            return value, False
+        with metrics.backend_timer('redis', 'get', entity):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.pttl(key)
+                data, pttl = await pipe.execute()
+        value = self._parse_cached(key, data, parse) if data else None
+        if value is None:
+            metrics.count_cache(self.cache_layer, entity, 'miss')
+            return None, False
+        stale = self._cache_result(value, pttl, entity)
+        if not stale:
+            self._local_cache_set(key, value, entity)
+        return value, stale
+
+    async def _cache_get(
+        self, key: str, parse: Optional[Callable[[Any], Any]], entity: str
+    ):
+        value, _ = await self._cache_read(key, parse, entity)
+        return value
+
+    async def _cache_read_many(
+        self, keys: List[str], parse: Optional[Callable[[Any], Any]],
+        entity: str
+    ) -> List[Tuple[Any, bool]]:
+        """Чтение нескольких ключей: локальный кеш и один MGET для остальных"""
+        values: Dict[str, Tuple[Any, bool]] = {}
+        for key in keys:
+            value = self._local_cache_get(key, entity)
+            if value is not None:
+                values[key] = value, False
+        missed = [key for key in keys if key not in values]
+        if missed:
+            with metrics.backend_timer('redis', 'mget', entity):
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.mget(missed)
+                    for key in missed:
+                        pipe.pttl(key)
+                    data, *pttls = await pipe.execute()
+            for key, item, pttl in zip(missed, data, pttls):
+                value = self._parse_cached(key, item, parse) if item else None
+                if value is None:
+                    metrics.count_cache(self.cache_layer, entity, 'miss')
+                    continue
+                stale = self._cache_result(value, pttl, entity)
+                if not stale:
+                    self._local_cache_set(key, value, entity)
+                values[key] = value, stale
+        return [values.get(key, (None, False)) for key in keys]
+
+    async def _cache_set(self, key: str, payload: Any, value: Any,
+                         entity: str, tags: Sequence[str] = ()):
+        """Запись в редис payload (в формате cache_codec)
+        и в локальный кеш готового объекта value.
+        tags - теги ключа, см. cache_tags"""
+        ttl = self._cache_ttl(entity)
+        data = self._encode(payload)
+        with metrics.backend_timer('redis', 'set', entity):
+            if tags or self._stale_copies_enabled():
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(key, data, px=ttl)
+                    self._add_tags(pipe, key, ttl, tags)
+                    self._add_stale_copy(pipe, key, data)
+                    await pipe.execute()
+            else:
+                await self.redis.set(key, data, px=ttl)
+        self._local_cache_set(key, value, entity)
+
+    async def _cache_set_negative(self, entity: str, *keys: str,
+                                  tags: Sequence[str] = ()):
+        """Запись отрицательных записей для keys, см. NOT_FOUND.
+        tags - теги, чтобы пустую выдачу удалило появление документа"""
+        if not keys or config.NEGATIVE_CACHE_TTL <= 0:
+            return
+        ttl = config.NEGATIVE_CACHE_TTL * 1000
+        with metrics.backend_timer('redis', 'set', entity):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(key, NEGATIVE_ENTRY, px=ttl)
+                    self._add_tags(pipe, key, ttl, tags)
+                await pipe.execute()
+        for key in keys:
+            self._local_cache_set(key, NOT_FOUND, entity)
+
+    @staticmethod
+    def _add_tags(pipe, key: str, ttl: int, tags: Sequence[str]):
+        """Добавление ключа в теги. Ключ хранится со временем истечения:
+        истекшие ключи вычищаются из тега при каждой записи в него"""
+        now = int(time.time() * 1000)
+        for tag in tags:
+            pipe.zadd(tag, {key: now + ttl})
+            pipe.zremrangebyscore(tag, '-inf', now)
+            pipe.pexpire(tag, CACHE_TAG_TTL)
+
+    def _stale_copies_enabled(self) -> bool:
+        return self.keep_stale_copy and config.ELASTIC_BREAKER_ENABLED \
+            and config.STALE_CACHE_TTL > 0
+
+    def _add_stale_copy(self, pipe, key: str, data: bytes):
+        """Резервная копия записи, см. _read_stale_copies"""
+        if self._stale_copies_enabled():
+            pipe.set(build_redis_key(STALE_COPY, key), data,
+                     ex=config.STALE_CACHE_TTL)
+
+    async def _read_stale_copies(
+        self, keys: List[str], parse: Optional[Callable[[Any], Any]],
+        entity: str
+    ) -> Dict[str, Any]:
+        """Резервные копии записей для промахов кеша, пока эластик
+        недоступен. Ответ с ними вызывающий помечает mark_degraded"""
+        if not self._stale_copies_enabled():
+            return {}
+        with metrics.backend_timer('redis', 'mget', entity):
+            data = await self.redis.mget(
+                [build_redis_key(STALE_COPY, key) for key in keys]
+            )
+        values = {}
+        for key, item in zip(keys, data):
+            value = self._parse_cached(key, item, parse) if item else None
+            if value is not None:
+                metrics.count_cache(self.cache_layer, entity, 'stale_copy')
+                values[key] = value
+        return values
+
+    async def _cache_set_many(self, items: Dict[str, tuple], entity: str):
+        """Запись нескольких пар (payload, value) одним pipeline"""
+        if not items:
+            return
+        with metrics.backend_timer('redis', 'mset', entity):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, (payload, _) in items.items():
+                    data = self._encode(payload)
+                    pipe.set(key, data, px=self._cache_ttl(entity))
+                    self._add_stale_copy(pipe, key, data)
+                await pipe.execute()
+        for key, (_, value) in items.items():
+            self._local_cache_set(key, value, entity)
+
+    async def _get_or_load(
+        self, key: str, parse: Optional[Callable[[Any], Any]],
+        load: Callable[[], Awaitable[Any]], entity: str, empty: Any = None,
+    ):
+        """Чтение через кеш (stale-while-revalidate).
+        Свежее значение отдается сразу. Устаревшее тоже отдается сразу,
+        а обновление из эластика запускается в фоне. При промахе
+        значение загружается load, одновременные промахи ждут одну загрузку.
+        Для отрицательной записи возвращается empty, для неполной выдачи
+        (PartialResults) ответ помечается как неполный. Если эластик
+        недоступен, промах отдается из резервной копии записи, а без нее
+        поднимается ElasticUnavailable"""
+        deadline.check()
+        value, stale = await self._cache_read(key, parse, entity)
+        if value is None:
+            try:
+                # Ждем загрузку не дольше срока запроса
+                value = await deadline.wait(self._fetch_once(
+                    key, lambda: self._cache_get(key, parse, entity), load
+                ))
+            except ElasticUnavailable:
+                copies = await self._read_stale_copies([key], parse, entity)
+                if key not in copies:
+                    raise
+                value = copies[key]
+                mark_degraded()
+            if isinstance(value, PartialResults):
+                mark_partial()
+        elif stale:
+            self._run_in_background(key, lambda: self._fetch_locked(
+                key, lambda: self._cache_get(key, parse, entity), load
+            ))
+        return empty if value is NOT_FOUND else value
+
+    def _run_in_background(self, key: str,
+                           load: Callable[[], Awaitable[Any]]):
+        """Фоновое обновление ключа, если оно еще не выполняется.
+        Обновление регистрируется в single_flight под key, поэтому
+        одновременные устаревшие чтения запускают его один раз"""
+        if key in single_flight:
+            return
+        task = single_flight.start(
+            key, lambda: self._without_deadline(load())
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(self._background_done)
+
+    @staticmethod
+    async def _without_deadline(coro: Awaitable):
+        """Общая или фоновая загрузка не ограничена сроком запроса,
+        который ее запустил: ее ждут и другие запросы со своими сроками,
+        а фоновую - никто (ответ уже отдан из кеша). Задача получает
+        копию контекста, поэтому срок самого запроса не меняется"""
+        deadline.clear()
+        return await coro
+
+    @staticmethod
+    def _background_done(task: asyncio.Task):
+        _background_tasks.discard(task)
+        if not task.cancelled() and isinstance(
+                task.exception(), ElasticUnavailable):
+            # Устаревшая запись обновится, когда эластик вернется
+            return
+        if not task.cancelled() and task.exception():
+            logger.error('Background cache refresh failed',
+                         exc_info=task.exception())
+
+    async def _fetch_once(
+        self, key: str,
+        read_cache: Callable[[], Awaitable[Any]],
+        load: Callable[[], Awaitable[Any]],
+    ):
+        """Загрузка значения при промахе кеша по ключу key.
+        Одновременные промахи по одному ключу внутри воркера ждут одну
+        загрузку load (из эластика с записью в кеш). При включенной
+        блокировке в редисе то же самое распространяется на все воркеры:
+        загружает владелец блокировки, остальные ждут значения в кеше.
+        Загрузка идет без срока: иначе запрос с коротким сроком обрывал бы
+        ее для всех, кто к ней присоединился. Каждый вызывающий ограничивает
+        сроком только свое ожидание (deadline.wait в _get_or_load)"""
+        return await single_flight.do(
+            key, lambda: self._without_deadline(
+                self._fetch_locked(key, read_cache, load)
+            )
+        )
+
+    async def _fetch_locked(
+        self, key: str,
+        read_cache: Callable[[], Awaitable[Any]],
+        load: Callable[[], Awaitable[Any]],
+    ):
+        if not config.CACHE_LOCK_ENABLED:
+            return await load()
+        lock_key = build_redis_key('lock', key)
+        token = uuid.uuid4().hex
+        lock_timeout = config.CACHE_LOCK_TIMEOUT_MS
+        lock_deadline = time.monotonic() + lock_timeout / 1000
+        while not await self.redis.set(
+                lock_key, token, nx=True, px=lock_timeout):
+            # Ключ уже загружает другой воркер - ждем значение в кеше
+            await asyncio.sleep(config.CACHE_LOCK_POLL_MS / 1000)
+            value = await read_cache()
+            if value:
+                return value
+            if time.monotonic() >= lock_deadline:
+                # Владелец блокировки не успел - загружаем сами
+                return await load()
+        try:
+            return await load()
+        finally:
+            await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    async def invalidate_cache(self, *keys: str):
+        """Удаление ключей из редиса и из локальных кешей всех воркеров.
+        Без аргументов очищает локальные кеши целиком"""
+        channel = config.LOCAL_CACHE_INVALIDATION_CHANNEL
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if keys:
+                pipe.delete(*keys, *(
+                    build_redis_key(STALE_COPY, key) for key in keys
+                ))
+            for key in keys or (FLUSH_ALL,):
+                pipe.publish(channel, key)
+            await pipe.execute()
+        if self.local_cache is not None:
+            if keys:
+                self.local_cache.delete(*keys)
+            else:
+                self.local_cache.clear()
+
+    async def invalidate_tags(self, *tags: str) -> int:
+        """Удаление всех ключей, помеченных хотя бы одним из тегов,
+        вместе с самими тегами. Возвращает число удаленных ключей"""
+        if not tags:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.zrange(tag, 0, -1)
+            pipe.delete(*tags)
+            *members, _ = await pipe.execute()
+        keys = {
+            key.decode() if isinstance(key, bytes) else key
+            for tag_keys in members for key in tag_keys
+        }
+        if keys:
+            await self.invalidate_cache(*keys)
+        return len(keys)
+
+    async def invalidate_tagged(self, entity: str, *ids: str) -> int:
+        """Удаление страниц списков и поиска с документами ids.
+        entity - FILM_CACHE, PERSON_CACHE или GENRE_CACHE (для жанра
+        удаляются и страницы фильмов с фильтром по нему)"""
+        return await self.invalidate_tags(
+            *(build_tag(entity, doc_id) for doc_id in ids)
+        )
 
     def paginate_elastic(self, page_size: int, page_number: int) -> int:
         """Пагинация ответа elasticsearch"""
@@ -63,55 +718,296 @@ class SimpleService:
             return 0
         return page_size * (page_number - 1)
 
+    async def _search_after(
+        self, index: str, body: dict, page_size: int, position: dict,
+        fields: Optional[Sequence[str]] = None
+    ) -> Tuple[List[dict], Optional[dict]]:
+        """Курсорная пагинация через search_after.
+        К сортировке запроса добавляется id, чтобы порядок был однозначным.
+        position - позиция, на которой закончилась предыдущая страница
+        (пустая для первой), возвращаются документы страницы и позиция
+        для следующей (None, если выдача закончилась). Позиция другой
+        выдачи или отвергнутая эластиком поднимается как InvalidCursor.
+        Кеш не используется: курсорные страницы почти не переиспользуются.
+        fields - поля _source, которые нужно получить (None - все)"""
+        body = dict(body, size=page_size)
+        if fields:
+            body['_source'] = list(fields)
+        body['sort'] = body.get('sort', ['_score']) + [{'id': 'asc'}]
+        fingerprint = cursor_fingerprint(index, body)
+        if position and position.get('fp') != fingerprint:
+            raise InvalidCursor()
+        if position.get('after'):
+            body['search_after'] = position['after']
+        pit_id = position.get('pit')
+        if pit_id is None and config.ELASTIC_CURSOR_USE_PIT \
+                and not position.get('after'):
+            with elastic_call('search_after', SEARCH_CACHE):
+                pit = await self.elastic.open_point_in_time(
+                    index=index, keep_alive=config.ELASTIC_PIT_KEEP_ALIVE,
+                    **deadline.elastic_timeouts()
+                )
+            pit_id = pit['id']
+        try:
+            with elastic_call('search_after', SEARCH_CACHE):
+                if pit_id:
+                    body['pit'] = {
+                        'id': pit_id,
+                        'keep_alive': config.ELASTIC_PIT_KEEP_ALIVE,
+                    }
+                    docs = await self.elastic.search(
+                        body=body, **deadline.elastic_timeouts(search=True)
+                    )
+                    pit_id = docs.get('pit_id', pit_id)
+                else:
+                    docs = await self.elastic.search(
+                        index=index, body=body,
+                        **deadline.elastic_timeouts(search=True)
+                    )
+        except NotFoundError:
+            if pit_id:
+                # Пустая страница выглядела бы концом выдачи,
+                # и клиент молча получил бы ее неполной
+                raise CursorExpired() from None
+            return [], None
+        except RequestError:
+            # Запрос собран сервисом, от клиента в нем только позиция
+            raise InvalidCursor() from None
+        metrics.observe_took('search_after', SEARCH_CACHE, docs)
+        if docs.get('timed_out'):
+            metrics.count_partial('search_after', SEARCH_CACHE)
+            mark_partial()
+        hits = docs['hits']['hits']
+        if len(hits) < page_size:
+            if pit_id:
+                await self._close_pit(pit_id)
+            return [hit['_source'] for hit in hits], None
+        next_position = {'after': hits[-1]['sort'], 'fp': fingerprint}
+        if pit_id:
+            next_position['pit'] = pit_id
+        return [hit['_source'] for hit in hits], next_position
+
+    async def _close_pit(self, pit_id: str):
+        """Закрытие point-in-time. Оно не прерывается отменой запроса
+        (клиент отключился), иначе PIT занимал бы ресурсы эластика до
+        истечения keep_alive. Ошибка закрытия только логируется: она не
+        должна портить уже полученную страницу, PIT истечет сам"""
+        close = asyncio.ensure_future(
+            self.elastic.close_point_in_time(body={'id': pit_id})
+        )
+        try:
+            await asyncio.shield(close)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning('Failed to close point in time', exc_info=True)
+
 
 class BaseService(SimpleService, AbstractBaseServiceClass):
     """Базовый сервис. Включает подключение к редису и эластику, и основные методы.
     Использует дженерик для работы с моделью."""
     instance = T
+    cache_entity = FILM_CACHE
+    # Пакетная загрузка get_by_id, создается при первом запросе
+    _batcher: Optional[MicroBatcher] = None
+
+    def may_exist(self, base_id: str, count_pass: bool = True) -> bool:
+        """Проверка uuid по фильтру Блума индекса: False - документа
+        точно нет, и в редис с эластиком можно не ходить. Эндпоинты
+        проверяют uuid до кеша ответов с count_pass=False: пропуск
+        учтет get_by_id, если до него дойдет"""
+        bloom = existence_filters.get(self.instance.index)
+        if bloom is None:
+            return True
+        if base_id in bloom:
+            if count_pass:
+                metrics.count_bloom(self.instance.index, 'pass')
+            return True
+        metrics.count_bloom(self.instance.index, 'reject')
+        return False
 
     # get_by_id возвращает объект фильма.
     # Он опционален, так как фильм может отсутствовать в базе
     async def get_by_id(self, base_id: str) -> Optional[T]:
-        # Пытаемся получить данные из кеша, потому что оно работает быстрее
-        instance = await self._instance_from_cache(base_id)
-        if not instance:
-            # Если фильма нет в кеше, то ищем его в Elasticsearch
-            instance = await self._get_instance_from_elastic(base_id)
-            if not instance:
-                # Если он отсутствует в ES, значит, фильма вообще нет в базе
-                return None
-            # Сохраняем фильм  в кеш
-            await self._put_instance_to_cache(instance)
+        if not self.may_exist(base_id):
+            return None
+        # Пытаемся получить данные из кеша, потому что оно работает быстрее.
+        # Если фильма нет в кеше, то ищем его в Elasticsearch
+        self._track(self.cache_entity, base_id)
+        if config.BATCH_LOADER_ENABLED:
+            return await self._get_batched(base_id)
+        return await self._get_or_load(
+            base_id, self.instance.parse_obj,
+            lambda: self._load_instance(base_id), self.cache_entity
+        )
 
+    async def _get_batched(self, base_id: str) -> Optional[T]:
+        """get_by_id через пакетную загрузку: одновременные запросы
+        воркера объединяются в один MGET редиса и один _mget эластика
+        (см. MicroBatcher). Попадание в локальный кеш отдается сразу"""
+        deadline.check()
+        value = self._local_cache_get(base_id, self.cache_entity)
+        if value is None:
+            if self._batcher is None:
+                self._batcher = MicroBatcher(
+                    self._dispatch_batch,
+                    config.BATCH_LOADER_WINDOW_MS / 1000,
+                    config.BATCH_LOADER_MAX_SIZE,
+                )
+            return self._batch_result(
+                await deadline.wait(self._batcher.load(base_id))
+            )
+        return None if value is NOT_FOUND else value
+
+    async def _dispatch_batch(self, base_ids: List[str]) -> dict:
+        """Загрузка пакета. Пакет общий для запросов с разными сроками,
+        поэтому сам он сроком не ограничен - каждый запрос ждет свой
+        результат не дольше своего срока"""
+        deadline.clear()
+        metrics.observe_batch(self.cache_entity, len(base_ids))
+        return await self._load_batch(base_ids)
+
+    async def _load_instance(self, base_id: str) -> Optional[T]:
+        """Загрузка объекта из elasticsearch с сохранением в кеш"""
+        instance = await self._get_instance_from_elastic(base_id)
+        if not instance:
+            if self.instance.index in existence_filters:
+                metrics.count_bloom(self.instance.index, 'false_positive')
+            # Если он отсутствует в ES, значит, фильма вообще нет в базе.
+            # Запоминаем это, чтобы повторные запросы не шли в эластик
+            await self._cache_set_negative(self.cache_entity, base_id)
+            return None
+        # Сохраняем фильм  в кеш
+        await self._put_instance_to_cache(instance)
         return instance
 
+    async def get_by_ids(self, base_ids: List[str]) -> List[Optional[T]]:
+        """Пакетное получение объектов по списку uuid.
+        Один MGET в редис, один _mget в эластик только для промахов кеша
+        и одна запись найденного в кеш через pipeline.
+        Порядок результата совпадает с порядком base_ids,
+        на месте отсутствующих объектов - None"""
+        if not base_ids:
+            return []
+        deadline.check()
+        unique_ids = [base_id for base_id in dict.fromkeys(base_ids)
+                      if self.may_exist(base_id)]
+        if not unique_ids:
+            return [None] * len(base_ids)
+        for base_id in unique_ids:
+            self._track(self.cache_entity, base_id)
+        loaded = await self._load_batch(unique_ids)
+        return [self._batch_result(loaded.get(base_id))
+                for base_id in base_ids]
+
+    async def _load_batch(
+        self, base_ids: List[str]
+    ) -> Dict[str, Tuple[Any, bool]]:
+        """Объекты по уникальным uuid: локальный кеш и MGET редиса,
+        для промахов - _mget эластика, а если он недоступен - резервные
+        копии. Результат по каждому uuid - пара (объект, NOT_FOUND или
+        ElasticUnavailable; признак резервной копии)"""
+        parse, entity = self.instance.parse_obj, self.cache_entity
+        cached = await self._cache_read_many(base_ids, parse, entity)
+        loaded = {key: (value, False)
+                  for key, (value, _) in zip(base_ids, cached)
+                  if value is not None}
+        stale = [key for key, (value, is_stale) in zip(base_ids, cached)
+                 if is_stale]
+        if stale:
+            self._run_in_background(
+                build_redis_key('mget', *stale),
+                lambda: self._load_instances(stale)
+            )
+        missed = [key for key in base_ids if key not in loaded]
+        if not missed:
+            return loaded
+        try:
+            found = await self._load_instances(missed)
+        except ElasticUnavailable as error:
+            copies = await self._read_stale_copies(missed, parse, entity)
+            for key in missed:
+                loaded[key] = (copies[key], True) if key in copies \
+                    else (error, False)
+        else:
+            for key in missed:
+                loaded[key] = found.get(key, NOT_FOUND), False
+        return loaded
+
+    @staticmethod
+    def _batch_result(item: Optional[Tuple[Any, bool]]) -> Any:
+        """Объект из результата _load_batch для вызывающего запроса"""
+        if item is None:
+            return None
+        value, from_copy = item
+        if isinstance(value, Exception):
+            raise value
+        if from_copy:
+            mark_degraded()
+        return None if value is NOT_FOUND else value
+
+    async def _load_instances(self, base_ids: List[str]) -> Dict[str, T]:
+        """Загрузка объектов из elasticsearch с сохранением в кеш,
+        для отсутствующих сохраняются отрицательные записи"""
+        found = await self._get_instances_from_elastic(base_ids)
+        await self._put_instances_to_cache(found)
+        instances = {instance.id: instance for instance in found}
+        missing = [base_id for base_id in base_ids
+                   if base_id not in instances]
+        if self.instance.index in existence_filters:
+            for _ in missing:
+                metrics.count_bloom(self.instance.index, 'false_positive')
+        await self._cache_set_negative(self.cache_entity, *missing)
+        return instances
+
     async def _get_instance_from_elastic(
         self, instance_id: str
     ) -> Optional[T]:
         try:
-            doc = await self.elastic.get(
-                index=self.instance.index, id=instance_id
-            )
+            with elastic_call('get', self.cache_entity):
+                doc = await self.elastic.get(
+                    index=self.instance.index, id=instance_id,
+                    **deadline.elastic_timeouts()
+                )
         except NotFoundError:
             return None
         return self.instance(**doc['_source'])
 
+    async def _get_instances_from_elastic(
+        self, instance_ids: List[str]
+    ) -> List[T]:
+        """Поиск нескольких объектов в elasticsearch одним запросом _mget"""
+        try:
+            with elastic_call('mget', self.cache_entity):
+                docs = await self.elastic.mget(
+                    index=self.instance.index, body={'ids': instance_ids},
+                    **deadline.elastic_timeouts()
+                )
+        except NotFoundError:
+            return []
+        return [self.instance(**doc['_source'])
+                for doc in docs['docs'] if doc.get('found')]
+
     async def _instance_from_cache(self, instance_id: str) -> Optional[T]:
         # Пытаемся получить данные о фильме из кеша, используя команду get
-        data = await self.redis.get(instance_id)
-        if not data:
-            return None
-
-        instance = self.instance.parse_raw(data)
-        return instance
+        return await self._cache_get(
+            instance_id, self.instance.parse_obj, self.cache_entity
+        )
 
     async def _put_instance_to_cache(self, instance: T):
         # Сохраняем данные о фильме, используя команду set
-        # Выставляем время жизни кеша — 5 минут
+        # Время жизни кеша задается в config.CACHE_TTL
         # https://redis.io/commands/set
-        # pydantic позволяет сериализовать модель в json
-        await self.redis.set(
-            instance.id, instance.json(), ex=FILM_CACHE_EXPIRE_IN_SECONDS)
+        # pydantic позволяет получить словарь модели для cache_codec
+        await self._cache_set(
+            instance.id, instance.dict(), instance, self.cache_entity
+        )
+
+    async def _put_instances_to_cache(self, instances: List[T]):
+        """Сохранение нескольких объектов в кеш одним pipeline"""
+        await self._cache_set_many({
+            instance.id: (instance.dict(), instance) for instance in instances
+        }, self.cache_entity)
 
 
 class SearchServiceMixin(SimpleService):
@@ -130,49 +1026,186 @@ class SearchServiceMixin(SimpleService):
                      query_str: str = None,
                      page_number: Optional[int] = 1,
                      page_size: Optional[int] = 50,
+                     fields: Optional[Sequence[str]] = None,
                      **kwargs) -> Optional[List[T]]:
+        """Поиск по индексу. fields - поля, нужные вызывающему:
+        только они запрашиваются из эластика и хранятся в кеше
+        (под отдельным от полных документов ключом)"""
         redis_key = build_redis_key(
             self.instance.index, query=query_str,
             page_number=str(page_number), page_size=str(page_size)
         )
+        if fields:
+            redis_key = build_redis_key(redis_key, fields=','.join(fields))
+        self._track(
+            build_redis_key(SEARCH_CACHE, self.instance.index),
+            query_str, page_number, page_size, fields
+        )
 
-        results = await self._get_search_from_cache(redis_key)
+        return await self._get_or_load(
+            redis_key, lambda data: self._parse_search(data, fields),
+            lambda: self._load_search(
+                redis_key, query_str, page_number, page_size, fields
+            ),
+            SEARCH_CACHE
+        )
+
+    async def search_after(
+        self, query_str: str = None, page_size: Optional[int] = 50,
+        position: Optional[dict] = None,
+        fields: Optional[Sequence[str]] = None
+    ) -> Tuple[List[T], Optional[dict]]:
+        """Поиск с курсорной пагинацией, см. SimpleService._search_after"""
+        query = await self.query_builder(query_str)
+        hits, next_position = await self._search_after(
+            self.instance.index, {'query': query}, page_size, position or {},
+            fields
+        )
+        return self._build_hits(hits, fields), next_position
+
+    def _build_hits(
+        self, sources: List[dict], fields: Optional[Sequence[str]] = None
+    ) -> List[T]:
+        """Модели из документов эластика. Урезанные по fields документы
+        не проходят валидацию модели, поэтому собираются без нее"""
+        if fields:
+            return [self.instance.construct(**source) for source in sources]
+        return [self.instance(**source) for source in sources]
+
+    async def _load_search(self, redis_key: str, query_str: str = None,
+                           page_number: Optional[int] = 1,
+                           page_size: Optional[int] = 50,
+                           fields: Optional[Sequence[str]] = None):
+        results = await self._search_from_elastic(
+            query_str, page_number, page_size, fields
+        )
+        if isinstance(results, PartialResults):
+            return results
         if not results:
-            results = await self._search_from_elastic(query_str)
-            if not results:
-                return None
-            await self._put_search_to_cache(redis_key, results)
+            await self._cache_set_negative(
+                SEARCH_CACHE, redis_key,
+                tags=self.search_tags([], query_str)
+            )
+            return None
+        await self._put_search_to_cache(
+            redis_key, results, self.search_tags(results, query_str)
+        )
         return results
 
+    def search_tags(self, results: List[T],
+                    query_str: str = None) -> List[str]:
+        """Теги страницы поиска, см. cache_tags"""
+        return cache_tags(
+            self.instance.index, [result.id for result in results],
+            query=query_str
+        )
+
     async def _search_from_elastic(self,
                                    query_str: str = None,
                                    page_number: Optional[int] = 1,
                                    page_size: Optional[int] = 50,
+                                   fields: Optional[Sequence[str]] = None,
                                    **kwargs) -> Optional[List[T]]:
         try:
             query = await self.query_builder(query_str)
-            doc = await self.elastic.search(
-                index=self.instance.index,
-                query=query,
-                from_=self.paginate_elastic(page_size, page_number),
-                size=page_size)
+            with elastic_call('search', SEARCH_CACHE):
+                doc = await self._elastic_search(
+                    index=self.instance.index,
+                    query=query,
+                    from_=self.paginate_elastic(page_size, page_number),
+                    size=page_size,
+                    _source_includes=fields,
+                    **deadline.elastic_timeouts(search=True))
         except NotFoundError:
             return None
-        return [self.instance(
-            **hit.get('_source')) for hit in doc.get('hits').get('hits')]
+        metrics.observe_took('search', SEARCH_CACHE, doc)
+        hits = self._build_hits(
+            [hit.get('_source') for hit in doc.get('hits').get('hits')],
+            fields
+        )
+        if doc.get('timed_out'):
+            metrics.count_partial('search', SEARCH_CACHE)
+            return PartialResults(hits)
+        return hits
+
+    def _parse_search(
+        self, data: list, fields: Optional[Sequence[str]] = None
+    ) -> List[T]:
+        if fields:
+            return self._build_hits(data, fields)
+        return parse_obj_as(List[self.instance], data)
 
     async def _get_search_from_cache(self, redis_key: str) -> Optional[T]:
-        data = await self.redis.get(redis_key)
-        if not data:
-            return None
+        return await self._cache_get(
+            redis_key, self._parse_search, SEARCH_CACHE
+        )
 
-        results = parse_obj_as(List[self.instance], json.loads(data))
-        return results
+    async def _put_search_to_cache(self, redis_key, results: List[T],
+                                   tags: Sequence[str] = ()):
+        await self._cache_set(
+            redis_key, jsonable_encoder(results), results,
+            SEARCH_CACHE, tags
+        )
 
-    async def _put_search_to_cache(self, redis_key, results: List[T]):
-        await self.redis.set(redis_key,
-                             json.dumps(jsonable_encoder(results)),
-                             ex=FILM_CACHE_EXPIRE_IN_SECONDS)
+
+class ExportServiceMixin(SimpleService):
+    instance = T
+
+    async def export(
+        self, fields: Optional[Sequence[str]] = None
+    ) -> AsyncIterator[List[dict]]:
+        """Все документы индекса страницами по EXPORT_PAGE_SIZE.
+        Следующая страница запрашивается, только когда вызывающий
+        забрал текущую, поэтому в памяти не больше одной страницы.
+        fields - поля _source (None - все)"""
+        pages = self._scan(
+            self.instance.index, list(fields) if fields else None,
+            config.EXPORT_PAGE_SIZE,
+        )
+        try:
+            async for hits in pages:
+                yield [hit['_source'] for hit in hits]
+        finally:
+            # Закрываем обход сразу, а не при сборке мусора, чтобы PIT
+            # освобождался вместе с выгрузкой
+            await pages.aclose()
+
+    async def _scan(
+        self, index: str, source: Any, page_size: int
+    ) -> AsyncIterator[List[dict]]:
+        """Обход индекса через point-in-time и search_after в порядке
+        хранения (_shard_doc), без кеша. Отдает хиты эластика страницами
+        по page_size; source - значение _source запроса (None - все поля,
+        False - только _id)"""
+        entity = INDEX_ENTITIES[index]
+        with elastic_call('export', entity):
+            pit = await self.elastic.open_point_in_time(
+                index=index, keep_alive=config.EXPORT_PIT_KEEP_ALIVE
+            )
+        pit_id = pit['id']
+        body = {
+            'query': {'match_all': {}}, 'sort': ['_shard_doc'],
+            'size': page_size, 'track_total_hits': False,
+        }
+        if source is not None:
+            body['_source'] = source
+        try:
+            while True:
+                body['pit'] = {
+                    'id': pit_id, 'keep_alive': config.EXPORT_PIT_KEEP_ALIVE,
+                }
+                with elastic_call('export', entity):
+                    docs = await self.elastic.search(body=body)
+                metrics.observe_took('export', entity, docs)
+                pit_id = docs.get('pit_id', pit_id)
+                hits = docs['hits']['hits']
+                if hits:
+                    yield hits
+                if len(hits) < page_size:
+                    return
+                body['search_after'] = hits[-1]['sort']
+        finally:
+            await self._close_pit(pit_id)
 
 
 class BaseListService(SimpleService, AbstractBaseListServiceClass):
@@ -180,35 +1213,41 @@ class BaseListService(SimpleService, AbstractBaseListServiceClass):
     и основные методы.
     Использует дженерик для работы с моделью."""
     instance = T
+    cache_entity = LIST_CACHE
 
     async def _instance_from_cache(self, key: str) -> Optional[list]:
         """Поиск фильмов в кэше"""
-        data = await self.redis.get(key)
-        if not data:
-            return None
-        data = json.loads(data)
+        return await self._cache_get(key, None, self.cache_entity)
 
-        return data
+    def list_tags(self, items: list, **dimensions) -> List[str]:
+        """Теги страницы списка, dimensions - genre и query,
+        см. cache_tags"""
+        return cache_tags(
+            self.instance.index, [item['id'] for item in items],
+            **dimensions
+        )
 
-    async def _put_instance_to_cache(self, instance: list, redis_key: str):
+    async def _put_instance_to_cache(self, instance: list, redis_key: str,
+                                     tags: Sequence[str] = ()):
         """Сохранение фильмов в кэше"""
-        await self.redis.set(
-            redis_key, json.dumps(instance),
-            ex=FILM_CACHE_EXPIRE_IN_SECONDS
+        await self._cache_set(
+            redis_key, instance, instance, self.cache_entity, tags
         )
 
 
 @lru_cache()
 def get_base_service(
         redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic)
+        elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
 ) -> BaseService:
-    return BaseService(redis, elastic)
+    return BaseService(redis, elastic, local_cache)
 
 
 @lru_cache()
 def get_base_list_service(
         redis: Redis = Depends(get_redis),
-        elastic: AsyncElasticsearch = Depends(get_elastic)
+        elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
 ) -> BaseListService:
-    return BaseListService(redis, elastic)
+    return BaseListService(redis, elastic, local_cache)
@@ -0,0 +1,230 @@
+"""Инвалидация кеша по ленте изменений в Redis Stream.
+
+ETL (или любой другой источник) пишет в поток CHANGE_FEED_STREAM события
+{index, id, op}, воркеры API читают их через consumer group: каждое
+событие обрабатывается одним воркером, а локальные кеши остальных
+очищаются через канал инвалидации (SimpleService.invalidate_cache).
+
+Локальный продюсер для разработки:
+    python -m services.changes movies 3d825f60-9fff-4dfe-b294-1a45fa1e115d
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+from typing import Dict, List, Optional, Set, Tuple
+
+import aioredis
+from aioredis import Redis
+from core import config
+from db.local_cache import LocalCache
+from elasticsearch import AsyncElasticsearch
+from services.base import (INDEX_ENTITIES, LIST_CACHE, SimpleService,
+                           build_tag)
+from services.existence import notify_created
+from services.genres import notify_genres_changed
+from services.responses import ResponseCacheService
+
+logger = logging.getLogger(__name__)
+
+OPS = ('create', 'update', 'delete')
+
+# Ключи ответов с одним документом: эндпоинт и имя параметра с uuid
+DETAIL_RESPONSES = {
+    'movies': (('film_details', 'film_id'),),
+    'persons': (('person_details', 'person_id'),
+                ('person_film', 'person_id')),
+    'genres': (('genre_details', 'genre_id'),),
+}
+
+INDEXES = tuple(DETAIL_RESPONSES)
+
+
+def detail_keys(index: str, doc_id: str) -> List[str]:
+    """Ключи кеша с самим документом: запись сервиса (по uuid)
+    и готовые ответы эндпоинтов с этим документом"""
+    return [doc_id] + [
+        ResponseCacheService.build_key(endpoint, **{param: doc_id})
+        for endpoint, param in DETAIL_RESPONSES[index]
+    ]
+
+
+def consumer_name() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class ChangeFeedConsumer(SimpleService):
+    """Чтение ленты изменений и инвалидация затронутых ключей"""
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch,
+                 local_cache: Optional[LocalCache] = None,
+                 blocking_redis: Optional[Redis] = None):
+        super().__init__(redis, elastic, local_cache)
+        # XREADGROUP с block ждет дольше socket_timeout основного пула
+        self.blocking_redis = blocking_redis or redis
+        self.stream = config.CHANGE_FEED_STREAM
+        self.group = config.CHANGE_FEED_GROUP
+        self.consumer = consumer_name()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _create_group(self):
+        try:
+            await self.redis.xgroup_create(
+                self.stream, self.group, id='$', mkstream=True
+            )
+        except aioredis.exceptions.ResponseError as error:
+            if 'BUSYGROUP' not in str(error):
+                raise
+
+    async def _run(self):
+        while True:
+            try:
+                await self._create_group()
+                # Сначала свои необработанные события (после перезапуска
+                # задачи), потом брошенные другими воркерами
+                await self._consume('0')
+                while True:
+                    await self._claim_abandoned()
+                    await self._consume('>')
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Change feed consumer failed')
+                await asyncio.sleep(1)
+
+    async def _consume(self, start: str):
+        """Чтение и обработка событий: '0' - уже выданные этому
+        потребителю, '>' - новые (с ожиданием до CHANGE_FEED_BLOCK_MS)"""
+        while True:
+            response = await self.blocking_redis.xreadgroup(
+                self.group, self.consumer, {self.stream: start},
+                count=config.CHANGE_FEED_BATCH_SIZE,
+                block=config.CHANGE_FEED_BLOCK_MS if start == '>' else None,
+            )
+            messages = response[0][1] if response else []
+            if messages:
+                await self.process(messages)
+            if start == '>' or len(messages) < config.CHANGE_FEED_BATCH_SIZE:
+                return
+
+    async def _claim_abandoned(self):
+        """Перехват событий, которые долго не подтверждает другой
+        потребитель (например, воркер упал во время обработки)"""
+        response = await self.redis.execute_command(
+            'XAUTOCLAIM', self.stream, self.group, self.consumer,
+            config.CHANGE_FEED_CLAIM_IDLE_MS, '0-0',
+            'COUNT', config.CHANGE_FEED_BATCH_SIZE,
+        )
+        # Удаленные из потока события приходят без полей -
+        # они подтверждаются как некорректные
+        messages = []
+        for message_id, fields in response[1]:
+            fields = fields or []
+            messages.append(
+                (message_id, dict(zip(fields[::2], fields[1::2])))
+            )
+        if messages:
+            await self.process(messages)
+
+    async def process(self, messages: List[Tuple[bytes, dict]]):
+        """Инвалидация по пачке событий и их подтверждение"""
+        changes: Dict[str, Set[str]] = {}
+        created: Set[str] = set()
+        # Документы, которые есть в индексе после события
+        existing: Dict[str, Set[str]] = {}
+        for message_id, fields in messages:
+            event = {
+                (key.decode() if isinstance(key, bytes) else key):
+                (value.decode() if isinstance(value, bytes) else value)
+                for key, value in fields.items()
+            }
+            index, doc_id = event.get('index'), event.get('id')
+            op = event.get('op', 'update')
+            if index not in INDEXES or not doc_id or op not in OPS:
+                logger.warning('Skipping malformed change event %s: %s',
+                               message_id, event)
+                continue
+            changes.setdefault(index, set()).add(doc_id)
+            if op == 'create':
+                created.add(index)
+            if op != 'delete':
+                existing.setdefault(index, set()).add(doc_id)
+        if config.BLOOM_ENABLED:
+            # До инвалидации, чтобы сброшенную отрицательную запись
+            # не заменил отказ фильтра Блума
+            for index, ids in existing.items():
+                await notify_created(self.redis, index, ids)
+        if changes:
+            await self.invalidate(changes, created)
+        await self.redis.xack(
+            self.stream, self.group,
+            *(message_id for message_id, _ in messages)
+        )
+
+    async def invalidate(self, changes: Dict[str, Set[str]],
+                         created: Set[str] = frozenset()):
+        """Удаление ключей документов и страниц списков и поиска с ними
+        (по тегам, см. services.base.cache_tags). Новый документ может
+        попасть на любую страницу своего индекса, поэтому для created
+        удаляются все страницы индекса"""
+        keys = set()
+        tags = [build_tag(LIST_CACHE, index) for index in created]
+        for index, ids in changes.items():
+            for doc_id in ids:
+                keys.update(detail_keys(index, doc_id))
+                tags.append(build_tag(INDEX_ENTITIES[index], doc_id))
+        await self.invalidate_cache(*keys)
+        pages = await self.invalidate_tags(*tags)
+        if 'genres' in changes:
+            await notify_genres_changed(self.redis)
+        logger.info('Change feed: %s documents, %s keys invalidated',
+                    sum(len(ids) for ids in changes.values()),
+                    len(keys) + pages)
+
+
+consumer: Optional[ChangeFeedConsumer] = None
+
+
+async def emit_change(redis: Redis, index: str, doc_id: str,
+                      op: str = 'update'):
+    """Запись события в ленту изменений"""
+    if index not in INDEXES or op not in OPS:
+        raise ValueError(f'Unknown change event: {index} {op}')
+    await redis.xadd(
+        config.CHANGE_FEED_STREAM, {'index': index, 'id': doc_id, 'op': op},
+        maxlen=config.CHANGE_FEED_MAXLEN, approximate=True,
+    )
+
+
+async def _emit(args: argparse.Namespace):
+    redis = aioredis.from_url(
+        f'redis://{config.REDIS_HOST}:{config.REDIS_PORT}',
+        password=config.REDIS_PASSWORD,
+    )
+    try:
+        for doc_id in args.ids:
+            await emit_change(redis, args.index, doc_id, args.op)
+    finally:
+        await redis.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Событие в ленту изменений')
+    parser.add_argument('index', choices=INDEXES)
+    parser.add_argument('ids', nargs='+')
+    parser.add_argument('--op', choices=OPS, default='update')
+    asyncio.run(_emit(parser.parse_args()))
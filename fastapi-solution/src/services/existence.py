@@ -0,0 +1,231 @@
+"""Фильтры Блума по uuid документов индексов.
+
+Запрос несуществующего uuid (опечатка, перебор, устаревшая ссылка)
+отсекается в памяти воркера, без редиса и эластика. Ложных отрицаний
+нет: если uuid нет в фильтре, документа нет в индексе. Исключение -
+новый документ до того, как о нем сообщит лента изменений
+(services.changes); без ленты новые документы попадают в фильтр только
+при перестроении.
+
+В редисе фильтр индекса хранится битмапом bloom||<index>, его параметры -
+в bloom||<index>||params, а uuid, добавленные после построения, - в
+sorted set bloom||<index>||pending со временем добавления. Раз в
+BLOOM_REBUILD_INTERVAL один из воркеров (тот, кто взял блокировку)
+строит фильтры заново по всем _id индексов. Каждый воркер держит копию
+фильтров в services.base.existence_filters и перечитывает ее, когда в
+редисе появилась новая версия.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, Iterable, Optional
+
+import orjson
+from aioredis import Redis
+from core import config, metrics
+from db.local_cache import LocalCache
+from elasticsearch import AsyncElasticsearch
+from helpers.bloom import BloomFilter
+from services.base import (INDEX_ENTITIES, ExportServiceMixin,
+                           build_redis_key, elastic_call, existence_filters)
+
+logger = logging.getLogger(__name__)
+
+BLOOM_KEY = 'bloom'
+BLOOM_LOCK = build_redis_key(BLOOM_KEY, 'lock')
+INDEXES = tuple(INDEX_ENTITIES)
+# Сообщение в канале: перечитать фильтры из редиса. Остальные сообщения -
+# index||uuid нового документа
+RELOAD = 'reload'
+# Размер страницы при обходе _id индекса
+SCAN_PAGE_SIZE = 10000
+# Наименьшая емкость фильтра, чтобы пустой или маленький индекс
+# не получил фильтр, который переполнится первыми же документами
+MIN_CAPACITY = 1000
+# Сколько секунд uuid из ленты изменений остается в pending после начала
+# перестроения: документ мог еще не стать видимым для поиска
+# (refresh эластика) и не попасть в новый фильтр
+PENDING_GRACE = 60
+
+
+def bits_key(index: str) -> str:
+    return build_redis_key(BLOOM_KEY, index)
+
+
+def params_key(index: str) -> str:
+    return build_redis_key(BLOOM_KEY, index, 'params')
+
+
+def pending_key(index: str) -> str:
+    return build_redis_key(BLOOM_KEY, index, 'pending')
+
+
+class ExistenceFilters(ExportServiceMixin):
+    """Загрузка, перестроение и обновление фильтров Блума воркера"""
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch,
+                 local_cache: Optional[LocalCache] = None,
+                 blocking_redis: Optional[Redis] = None):
+        super().__init__(redis, elastic, local_cache)
+        # Подписка на канал - через клиент без таймаута чтения
+        self.blocking_redis = blocking_redis or redis
+        # Версии загруженных фильтров по индексам
+        self.versions: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        """Новые uuid и перезагрузка - по сообщениям в канале, сверка
+        версий и перестроение - по таймеру. После (пере)подписки фильтры
+        загружаются заново, так как пропущенные сообщения не доставляются"""
+        interval = config.BLOOM_REFRESH_INTERVAL
+        while True:
+            pubsub = self.blocking_redis.pubsub()
+            try:
+                await pubsub.subscribe(config.BLOOM_CHANNEL)
+                await self.refresh(force=True)
+                refresh_at = time.monotonic() + interval
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=max(refresh_at - time.monotonic(), 0),
+                    )
+                    if message is not None:
+                        await self.on_message(message['data'])
+                        continue
+                    if time.monotonic() < refresh_at:
+                        continue
+                    await self.refresh()
+                    refresh_at = time.monotonic() + interval
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Bloom filter refresh failed')
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+    async def on_message(self, data: bytes):
+        data = data.decode() if isinstance(data, bytes) else str(data)
+        if data == RELOAD:
+            await self.load_all(force=True)
+            return
+        index, _, doc_id = data.partition('||')
+        bloom = existence_filters.get(index)
+        if bloom is not None and doc_id:
+            bloom.add(doc_id)
+
+    async def refresh(self, force: bool = False):
+        """Перестроение, если подошло его время, и загрузка новых версий"""
+        if await self.redis.set(BLOOM_LOCK, 1, nx=True,
+                                ex=config.BLOOM_REBUILD_INTERVAL):
+            try:
+                await self.rebuild()
+            except Exception:
+                # Не ждем следующего интервала - попробует другой воркер
+                await self.redis.delete(BLOOM_LOCK)
+                raise
+            # Свои фильтры загрузятся по сообщению RELOAD
+            return
+        await self.load_all(force)
+
+    async def load_all(self, force: bool = False):
+        for index in INDEXES:
+            await self.load(index, force)
+
+    async def load(self, index: str, force: bool = False):
+        """Копия фильтра индекса из редиса вместе с pending.
+        Без force перечитывается только новая версия"""
+        params = await self.redis.get(params_key(index))
+        if params is None:
+            # Фильтра еще нет (или редис очищен) - проверка пропускает все
+            existence_filters.pop(index, None)
+            self.versions.pop(index, None)
+            return
+        if not force and \
+                self.versions.get(index) == orjson.loads(params)['version']:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(params_key(index))
+            pipe.get(bits_key(index))
+            pipe.zrange(pending_key(index), 0, -1)
+            params, bits, pending = await pipe.execute()
+        if params is None or bits is None:
+            return
+        params = orjson.loads(params)
+        size = params['size']
+        bloom = BloomFilter(
+            size, params['hashes'], bits.ljust((size + 7) // 8, b'\x00')
+        )
+        bloom.update(doc_id.decode() for doc_id in pending)
+        existence_filters[index] = bloom
+        self.versions[index] = params['version']
+        metrics.update_bloom_gauges(
+            index, params['items'] + len(pending), bloom.false_positive_rate()
+        )
+        logger.info('Bloom filter %s loaded: %s documents, %s pending',
+                    index, params['items'], len(pending))
+
+    async def rebuild(self):
+        for index in INDEXES:
+            await self.build(index)
+        await self.redis.publish(config.BLOOM_CHANNEL, RELOAD)
+
+    async def build(self, index: str):
+        """Фильтр по всем _id индекса с запасом BLOOM_CAPACITY_FACTOR
+        на рост. Из pending удаляются uuid, добавленные до начала обхода:
+        они уже есть в индексе и попали в новый фильтр"""
+        started = time.time()
+        with elastic_call('count', INDEX_ENTITIES[index]):
+            count = (await self.elastic.count(index=index))['count']
+        bloom = BloomFilter.for_capacity(
+            max(int(count * config.BLOOM_CAPACITY_FACTOR), MIN_CAPACITY),
+            config.BLOOM_ERROR_RATE,
+        )
+        items = 0
+        async for hits in self._scan(index, False, SCAN_PAGE_SIZE):
+            bloom.update(hit['_id'] for hit in hits)
+            items += len(hits)
+        params = {
+            'size': bloom.size, 'hashes': bloom.hashes, 'items': items,
+            'version': uuid.uuid4().hex,
+        }
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(bits_key(index), bytes(bloom.bits))
+            pipe.set(params_key(index), orjson.dumps(params))
+            pipe.zremrangebyscore(
+                pending_key(index), '-inf', started - PENDING_GRACE
+            )
+            await pipe.execute()
+        logger.info('Bloom filter %s built: %s documents, %s bytes',
+                    index, items, len(bloom.bits))
+
+
+filters: Optional[ExistenceFilters] = None
+
+
+async def notify_created(redis: Redis, index: str, ids: Iterable[str]):
+    """Добавление uuid новых документов в фильтры: в pending до
+    следующего перестроения и в копии всех воркеров через канал"""
+    ids = list(ids)
+    if not ids:
+        return
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zadd(pending_key(index), {doc_id: now for doc_id in ids})
+        for doc_id in ids:
+            pipe.publish(config.BLOOM_CHANNEL, build_redis_key(index, doc_id))
+        await pipe.execute()
@@ -1,22 +1,32 @@
 from functools import lru_cache
-from typing import Optional
+from typing import Optional, Sequence, Tuple
 
 from aioredis import Redis
+from core import deadline, metrics
 from db.elastic import get_elastic
+from db.local_cache import LocalCache, get_local_cache
 from db.redis import get_redis
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
 from models.films import Film
-from services.base import BaseListService, BaseService, build_redis_key
+from services.base import (FILM_CACHE, BaseListService, BaseService,
+                           ExportServiceMixin, PartialResults,
+                           build_redis_key, elastic_call)
+
+
+# Тип запроса списка фильмов для прогрева кеша
+FILMS_LIST = 'films'
 
 
 class FilmService(BaseService):
     """Выдача информации по фильму по uuid"""
     instance = Film
+    cache_entity = FILM_CACHE
 
 
-class FilmsServices(BaseListService):
+class FilmsServices(BaseListService, ExportServiceMixin):
     """Выдача информации по всем фильмам"""
+    instance = Film
 
     def get_elastic_query(
             self, query: Optional[str],
@@ -54,9 +64,12 @@ class FilmsServices(BaseListService):
 
     async def get_all(
             self, query: Optional[str], genre: Optional[str], reverse: str,
-            page_size: int, page_number: int
+            page_size: int, page_number: int,
+            fields: Optional[Sequence[str]] = None
     ) -> list:
-        """Основная функция выдачи информации по фильмам"""
+        """Основная функция выдачи информации по фильмам.
+        fields - поля фильма, нужные вызывающему: только они запрашиваются
+        из elasticsearch и хранятся в кэше под отдельным ключом"""
         # Создание составного ключа для хранения/поиска в кэше
         if query:
             redis_key = build_redis_key(
@@ -73,30 +86,74 @@ class FilmsServices(BaseListService):
                 'films', reverse=reverse,
                 page_number=str(page_number), page_size=str(page_size)
             )
+        if fields:
+            redis_key = build_redis_key(redis_key, fields=','.join(fields))
+        self._track(
+            FILMS_LIST, query, genre, reverse, page_size, page_number, fields
+        )
         # Ищем фильмы в кэше
-        films = await self._instance_from_cache(redis_key)
-
-        if not films:
-            # Если в кэше нет, то ищем в elasticsearch
-            films = await self._get_instance_from_elastic(
-                query, genre, reverse, page_size, page_number)
-            # Сохраняем в кэше информацию из elasticsearch
-            await self._put_instance_to_cache(films, redis_key)
+        # Если в кэше нет, то ищем в elasticsearch
+        return await self._get_or_load(
+            redis_key, None,
+            lambda: self._load_films(
+                redis_key, query, genre, reverse, page_size, page_number,
+                fields
+            ),
+            self.cache_entity, empty=[],
+        )
+
+    async def get_all_after(
+            self, query: Optional[str], genre: Optional[str], reverse: str,
+            page_size: int, position: dict,
+            fields: Optional[Sequence[str]] = None
+    ) -> Tuple[list, Optional[dict]]:
+        """Выдача фильмов с курсорной пагинацией (search_after).
+        Возвращает фильмы страницы и позицию для следующей страницы"""
+        return await self._search_after(
+            Film.index, self.get_elastic_query(query, genre, reverse),
+            page_size, position, fields
+        )
+
+    async def _load_films(
+            self, redis_key: str, query: Optional[str], genre: Optional[str],
+            reverse: str, page_size: int, page_number: int,
+            fields: Optional[Sequence[str]] = None
+    ) -> list:
+        """Поиск фильмов в elasticsearch с сохранением в кэше"""
+        films = await self._get_instance_from_elastic(
+            query, genre, reverse, page_size, page_number, fields)
+        if isinstance(films, PartialResults):
+            # Неполную выдачу не кешируем
+            return films
+        # Сохраняем в кэше информацию из elasticsearch,
+        # пустую выдачу - отрицательной записью
+        tags = self.list_tags(films, genre=genre, query=query)
+        if films:
+            await self._put_instance_to_cache(films, redis_key, tags)
+        else:
+            await self._cache_set_negative(
+                self.cache_entity, redis_key, tags=tags
+            )
         return films
 
     async def _get_instance_from_elastic(
             self, query: Optional[str], genre: Optional[str], reverse: str,
-            page_size: int, page_number: int
+            page_size: int, page_number: int,
+            fields: Optional[Sequence[str]] = None
     ) -> list:
         """Поиск фильмов в elasticserch"""
         films_list = []
         # Попробуем найти фильмы, иначе вернем пустой список
         try:
-            docs = await self.elastic.search(
-                index='movies', size=page_size,
-                from_=self.paginate_elastic(page_size, page_number),
-                body=self.get_elastic_query(query, genre, reverse)
-            )
+            with elastic_call('search', self.cache_entity):
+                docs = await self._elastic_search(
+                    index='movies', size=page_size,
+                    from_=self.paginate_elastic(page_size, page_number),
+                    body=self.get_elastic_query(query, genre, reverse),
+                    _source_includes=fields,
+                    **deadline.elastic_timeouts(search=True)
+                )
+            metrics.observe_took('search', self.cache_entity, docs)
             for doc in docs['hits']['hits']:
                 # В каждом фильме оставим поля согласно модели
                 # Объект модели нельзя сохранить в кэше,
@@ -104,6 +161,9 @@ class FilmsServices(BaseListService):
                 films_list.append(doc['_source'])
         except NotFoundError:
             return []
+        if docs.get('timed_out'):
+            metrics.count_partial('search', self.cache_entity)
+            return PartialResults(films_list)
         return films_list
 
 
@@ -111,13 +171,15 @@ class FilmsServices(BaseListService):
 def get_films_services(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
 ) -> FilmsServices:
-    return FilmsServices(redis, elastic)
+    return FilmsServices(redis, elastic, local_cache)
 
 
 @lru_cache()
 def get_film_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
 ) -> FilmService:
-    return FilmService(redis, elastic)
+    return FilmService(redis, elastic, local_cache)
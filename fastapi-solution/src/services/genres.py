@@ -1,61 +1,248 @@
+import asyncio
+import logging
+import time
 from functools import lru_cache
+from typing import Callable, Dict, List, Optional
 
 from aioredis import Redis
+from core import config, deadline, metrics
 from db.elastic import get_elastic
+from db.local_cache import LocalCache, get_local_cache
 from db.redis import get_redis
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
 from models.genre import Genre
-from services.base import BaseListService, BaseService, build_redis_key
+from services.base import (GENRE_CACHE, BaseListService, BaseService,
+                           ExportServiceMixin, build_redis_key, elastic_call)
+
+logger = logging.getLogger(__name__)
+
+# Размер страницы при загрузке всех жанров из эластика
+GENRES_PAGE_SIZE = 1000
+
+
+class GenreRegistry:
+    """Все жанры в памяти воркера, с индексами по id и по названию.
+    Жанров мало и меняются они редко, поэтому эндпоинты жанров
+    отдаются отсюда без редиса и эластика. Реестр загружается при
+    старте и перезагружается раз в GENRE_REGISTRY_REFRESH_INTERVAL
+    секунд или по сообщению в канале GENRE_REGISTRY_CHANNEL.
+    Пока жанры не загружены (эластик недоступен или индекс пуст),
+    сервисы работают через кеш, как раньше."""
+
+    def __init__(self):
+        self.genres: List[dict] = []
+        self.by_id: Dict[str, Genre] = {}
+        self.by_name: Dict[str, Genre] = {}
+        # Готовые ответы, собранные из текущей версии реестра
+        self._bodies: Dict[str, bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.genres)
+
+    def get(self, genre_id: str) -> Optional[Genre]:
+        return self.by_id.get(genre_id)
+
+    def get_by_name(self, name: str) -> Optional[Genre]:
+        return self.by_name.get(name.lower())
+
+    def body(self, key: str, build: Callable[[List[dict]], bytes]) -> bytes:
+        """Тело ответа, собранное build из жанров один раз на версию"""
+        body = self._bodies.get(key)
+        if body is None:
+            body = self._bodies[key] = build(self.genres)
+        return body
+
+    def update(self, genres: List[dict]):
+        instances = [Genre(**genre) for genre in genres]
+        # Подменяем все индексы сразу, чтобы запросы не видели смеси версий
+        self.genres, self._bodies = genres, {}
+        self.by_id = {genre.id: genre for genre in instances}
+        self.by_name = {genre.name.lower(): genre for genre in instances}
+
+    async def load(self, redis: Redis, elastic: AsyncElasticsearch):
+        genres = await GenresServices(
+            redis, elastic
+        )._get_instance_from_elastic()
+        self.update(genres)
+        logger.info('Genre registry loaded: %s genres', len(genres))
+
+    def start(self, redis: Redis, elastic: AsyncElasticsearch, channel: str):
+        """redis - клиент для подписки на канал, без таймаута чтения
+        (db.redis.blocking_redis)"""
+        self._task = asyncio.create_task(self._run(redis, elastic, channel))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self, redis: Redis, elastic: AsyncElasticsearch,
+                   channel: str):
+        """Перезагрузка по сообщению в канале или по таймеру.
+        После (пере)подписки реестр загружается заново, так как
+        пропущенные без подписки сообщения не доставляются"""
+        interval = config.GENRE_REGISTRY_REFRESH_INTERVAL
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                await self.load(redis, elastic)
+                refresh_at = time.monotonic() + interval
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=max(refresh_at - time.monotonic(), 0),
+                    )
+                    if message is None and time.monotonic() < refresh_at:
+                        continue
+                    await self.load(redis, elastic)
+                    refresh_at = time.monotonic() + interval
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Genre registry refresh failed')
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+
+
+genre_registry: Optional[GenreRegistry] = None
+
+
+async def get_genre_registry() -> Optional[GenreRegistry]:
+    return genre_registry
+
+
+async def notify_genres_changed(redis: Redis):
+    """Сигнал всем воркерам перезагрузить реестр жанров"""
+    await redis.publish(config.GENRE_REGISTRY_CHANNEL, 1)
 
 
 class GenreService(BaseService):
     """Выдача информации по жанру по uuid"""
     instance = Genre
+    cache_entity = GENRE_CACHE
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch,
+                 local_cache: Optional[LocalCache] = None,
+                 registry: Optional[GenreRegistry] = None):
+        super().__init__(redis, elastic, local_cache)
+        self.registry = registry
+
+    def from_memory(self, base_id: str) -> Optional[Genre]:
+        """Жанр из реестра воркера, если реестр загружен"""
+        if self.registry is None or not self.registry.loaded:
+            return None
+        return self.registry.get(base_id)
+
+    async def get_by_id(self, base_id: str) -> Optional[Genre]:
+        # Жанра нет в реестре - возможно, он добавлен после загрузки
+        return self.from_memory(base_id) or await super().get_by_id(base_id)
 
+    async def get_by_ids(self, base_ids: List[str]) -> List[Optional[Genre]]:
+        """Жанры из реестра, не найденные в нем - пакетно через кеш"""
+        genres = [self.from_memory(base_id) for base_id in base_ids]
+        missed = [base_id for base_id, genre in zip(base_ids, genres)
+                  if genre is None]
+        if missed:
+            found = dict(zip(missed, await super().get_by_ids(missed)))
+            genres = [genre or found.get(base_id)
+                      for base_id, genre in zip(base_ids, genres)]
+        return genres
 
-class GenresServices(BaseListService):
+
+class GenresServices(BaseListService, ExportServiceMixin):
     """Выдача информации по всем жанрам"""
+    instance = Genre
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch,
+                 local_cache: Optional[LocalCache] = None,
+                 registry: Optional[GenreRegistry] = None):
+        super().__init__(redis, elastic, local_cache)
+        self.registry = registry
+
+    @property
+    def in_memory(self) -> bool:
+        """Жанры отдаются из реестра воркера"""
+        return self.registry is not None and self.registry.loaded
 
     async def get_all(self, **kwargs) -> list:
         """Основная функция выдачи информации по всем жанрам"""
+        if self.in_memory:
+            return self.registry.genres
         # Ищем в кэше
         redis_key = build_redis_key('genres')
-        instances = await self._instance_from_cache(redis_key)
+        # В кэше нет - ищем в es, одним запросом на все промахи
+        return await self._get_or_load(
+            redis_key, None, lambda: self._load_genres(redis_key),
+            self.cache_entity, empty=[],
+        )
 
-        if not instances:
-            # В кэше нет - ищем в es
-            instances = await self._get_instance_from_elastic()
-            # И сохраняем в кэше
-            await self._put_instance_to_cache(instances, redis_key)
+    async def _load_genres(self, redis_key: str) -> list:
+        """Поиск жанров в es с сохранением в кэше"""
+        instances = await self._get_instance_from_elastic()
+        # И сохраняем в кэше
+        if instances:
+            await self._put_instance_to_cache(
+                instances, redis_key, self.list_tags(instances)
+            )
+        else:
+            await self._cache_set_negative(
+                self.cache_entity, redis_key, tags=self.list_tags([])
+            )
         return instances
 
     async def _get_instance_from_elastic(self) -> list:
-        """Функция поиска жанров в es"""
-        genres_list = []
+        """Функция поиска всех жанров в es.
+        Обычно все жанры помещаются в одну страницу GENRES_PAGE_SIZE.
+        Если нет, индекс обходится заново через point-in-time (_scan):
+        search_after без PIT не дает стабильного порядка между шардами
+        и обновлениями индекса и может пропустить или повторить жанры"""
         try:
-            # Пробуем найти фильмы в es, иначе возвращаем пустой список
-            docs = await self.elastic.search(
-                index='genres', size=26, body={"query": {"match_all": {}}}
-            )
-            for doc in docs['hits']['hits']:
-                genres_list.append(doc['_source'])
+            # Пробуем найти жанры в es, иначе возвращаем пустой список
+            with elastic_call('search', self.cache_entity):
+                docs = await self._elastic_search(
+                    index=Genre.index, body={
+                        'query': {'match_all': {}}, 'sort': ['_doc'],
+                        'size': GENRES_PAGE_SIZE,
+                    },
+                    **deadline.elastic_timeouts()
+                )
+            metrics.observe_took('search', self.cache_entity, docs)
+            hits = docs['hits']['hits']
+            if len(hits) < GENRES_PAGE_SIZE:
+                return [doc['_source'] for doc in hits]
+            genres_list = []
+            async for hits in self._scan(Genre.index, None, GENRES_PAGE_SIZE):
+                genres_list.extend(doc['_source'] for doc in hits)
+            return genres_list
         except NotFoundError:
             return []
-        return genres_list
 
 
 @lru_cache()
 def get_genre_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
+        registry: Optional[GenreRegistry] = Depends(get_genre_registry),
 ) -> GenreService:
-    return GenreService(redis, elastic)
+    return GenreService(redis, elastic, local_cache, registry)
 
 
 @lru_cache()
 def get_genres_services(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
+        registry: Optional[GenreRegistry] = Depends(get_genre_registry),
 ) -> GenresServices:
-    return GenresServices(redis, elastic)
+    return GenresServices(redis, elastic, local_cache, registry)
@@ -3,36 +3,41 @@ from typing import List, Optional
 
 from aioredis import Redis
 from db.elastic import get_elastic
+from db.local_cache import LocalCache, get_local_cache
 from db.redis import get_redis
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 from models.films import Film
 from models.person import Person
-from services.base import BaseService, SearchServiceMixin
+from services.base import (FILM_CACHE, PERSON_CACHE, BaseService,
+                           ExportServiceMixin, SearchServiceMixin, build_tag)
 from services.films import FilmService
 
-person_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
 
-
-class PersonService(BaseService, SearchServiceMixin):
+class PersonService(BaseService, SearchServiceMixin, ExportServiceMixin):
     instance = Person
+    cache_entity = PERSON_CACHE
 
     async def get_film_list_by_id(self, base_id: str) -> Optional[List[Film]]:
-        # Пытаемся получить данные из кеша, потому что оно работает быстрее
-        instance = await self._instance_from_cache(base_id)
+        instance = await self.get_by_id(base_id)
         if not instance:
-            # Если фильма нет в кеше, то ищем его в Elasticsearch
-            instance = await self._get_instance_from_elastic(base_id)
-            if not instance:
-                # Если он отсутствует в ES, значит, фильма вообще нет в базе
-                return None
-            # Сохраняем фильм  в кеш
-            await self._put_instance_to_cache(instance)
-        f_ids = instance.film_ids
-        f_service = FilmService(self.redis, self.elastic)
-        films = [await f_service.get_by_id(str(film_id)) for film_id in f_ids]
-
-        return films
+            # Если персоны нет ни в кеше, ни в ES, значит, ее нет в базе
+            return None
+        f_ids = [str(film_id) for film_id in instance.film_ids]
+        f_service = FilmService(
+            self.redis, self.elastic, self.local_cache
+        )
+        # Все фильмы персоны получаем пакетно, а не по одному
+        films = await f_service.get_by_ids(f_ids)
+
+        return [film for film in films if film]
+
+    @staticmethod
+    def film_list_tags(base_id: str, films: List[Film]) -> List[str]:
+        """Теги списка фильмов персоны: сама персона и ее фильмы"""
+        return [build_tag(PERSON_CACHE, base_id)] + [
+            build_tag(FILM_CACHE, film.id) for film in films
+        ]
 
     async def query_builder(self, query_str: str = None):
         return {
@@ -49,5 +54,6 @@ class PersonService(BaseService, SearchServiceMixin):
 def get_person_service(
         redis: Redis = Depends(get_redis),
         elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
 ) -> PersonService:
-    return PersonService(redis, elastic)
+    return PersonService(redis, elastic, local_cache)
@@ -0,0 +1,90 @@
+from functools import lru_cache
+from typing import List, Optional, Sequence, Union
+
+import orjson
+from aioredis import Redis
+from core import config
+from core.http_cache import DEGRADED, PARTIAL, build_etag, not_modified
+from db.elastic import get_elastic
+from db.local_cache import LocalCache, get_local_cache
+from db.redis import get_redis
+from elasticsearch import AsyncElasticsearch
+from fastapi import Depends, Response
+from pydantic import BaseModel
+from services.base import SimpleService, build_redis_key
+
+
+class ResponseCacheService(SimpleService):
+    """Кеш готовых ответов API.
+    Хранит итоговые байты JSON для эндпоинта и набора параметров,
+    при попадании они отдаются как есть, без построения моделей pydantic
+    и повторной сериализации. Включается config.RESPONSE_CACHE_ENABLED.
+    Ответы хранятся без cache_codec - это уже готовое тело ответа.
+    ETag считается по сохраненному телу, поэтому условный запрос
+    с совпавшим If-None-Match получает 304 сразу после чтения кеша"""
+    cache_layer = 'response'
+    # Ответ без эластика собирается из резервных копий кеша данных
+    keep_stale_copy = False
+
+    def _encode(self, payload: bytes) -> bytes:
+        return payload
+
+    def _decode(self, data: bytes) -> bytes:
+        return data
+
+    @staticmethod
+    def build_key(endpoint: str, **params) -> str:
+        """Ключ ответа: имя эндпоинта и значения его параметров"""
+        return build_redis_key(
+            'response', endpoint,
+            **{name: str(value) for name, value in sorted(params.items())}
+        )
+
+    async def get(self, key: str, entity: str) -> Optional[Response]:
+        if not config.RESPONSE_CACHE_ENABLED:
+            return None
+        body, stale = await self._cache_read(key, None, entity)
+        if not body or stale:
+            # Устаревший ответ дешевле собрать заново из кеша данных
+            return None
+        return self._response(body)
+
+    async def put(
+        self, key: str, content: Union[BaseModel, List[BaseModel]],
+        entity: str, tags: Sequence[str] = ()
+    ) -> Union[Response, BaseModel, List[BaseModel]]:
+        """Сохранение ответа. Если кеш ответов выключен, content
+        возвращается без изменений и сериализуется FastAPI как обычно.
+        tags - теги ответов со списками, как у страниц в кеше данных.
+        Деградированный или неполный ответ (см. core.http_cache)
+        не кешируется"""
+        if not config.RESPONSE_CACHE_ENABLED or DEGRADED.get() \
+                or PARTIAL.get():
+            # Ответ из резервных копий или неполная выдача не должны
+            # попасть в кеш как обычный ответ
+            return content
+        if isinstance(content, list):
+            body = orjson.dumps([item.dict() for item in content])
+        else:
+            body = orjson.dumps(content.dict())
+        await self._cache_set(key, body, body, entity, tags)
+        return self._response(body)
+
+    @staticmethod
+    def _response(body: bytes) -> Response:
+        etag = build_etag(body)
+        if not_modified(etag):
+            return Response(status_code=304, headers={'ETag': etag})
+        return Response(
+            content=body, media_type='application/json',
+            headers={'ETag': etag}
+        )
+
+
+@lru_cache()
+def get_response_cache_service(
+        redis: Redis = Depends(get_redis),
+        elastic: AsyncElasticsearch = Depends(get_elastic),
+        local_cache: Optional[LocalCache] = Depends(get_local_cache),
+) -> ResponseCacheService:
+    return ResponseCacheService(redis, elastic, local_cache)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import orjson
+from aioredis import Redis
+from core import config
+from db.local_cache import LocalCache
+from elasticsearch import AsyncElasticsearch
+from models.person import Person
+from models.response_models.films import Film_API
+from services.base import (FILM_CACHE, GENRE_CACHE, PERSON_CACHE,
+                           SEARCH_CACHE, SimpleService, build_redis_key,
+                           hot_keys)
+from services.films import FILMS_LIST, FilmService, FilmsServices
+from services.genres import GenreService, GenresServices
+from services.persons import PersonService
+
+logger = logging.getLogger(__name__)
+
+# Горячие ключи в редисе: sorted set на каждый тип запроса
+HOT_KEYS = 'warmup||hot'
+WARMUP_LOCK = 'warmup||lock'
+PERSON_SEARCH = build_redis_key(SEARCH_CACHE, Person.index)
+# Параметры первой страницы /films по умолчанию, см. api.v1.films
+FILM_PAGE_SIZE = 10
+
+# Текущий прогревщик воркера, создается при старте приложения
+warmer: Optional['CacheWarmer'] = None
+
+
+class CacheWarmer(SimpleService):
+    """Прогрев кеша горячими ключами.
+    Каждый воркер считает свои запросы в services.base.hot_keys и
+    периодически добавляет счетчики в общие для всех воркеров sorted set
+    в редисе. При старте и затем раз в WARMUP_INTERVAL один из воркеров
+    (тот, кто взял блокировку) повторяет самые частые запросы через
+    обычные методы сервисов: промахи загружаются из эластика,
+    попадания почти ничего не стоят.
+    Прогревается только кеш данных, ключи response||... кеша ответов
+    не заполняются: их собирают маршруты, а после прогрева первый
+    запрос к странице собирает ответ без обращения к эластику"""
+    track_hot_keys = False
+
+    def __init__(self, redis: Redis, elastic: AsyncElasticsearch,
+                 local_cache: Optional[LocalCache] = None):
+        super().__init__(redis, elastic, local_cache)
+        services = (
+            FilmService, FilmsServices, GenreService, GenresServices,
+            PersonService,
+        )
+        film, films, genre, genres, person = (
+            service(redis, elastic, local_cache) for service in services
+        )
+        for service in (film, films, genre, genres, person):
+            # Запросы прогрева не должны попадать в горячие ключи
+            service.track_hot_keys = False
+        self.genres = genres
+        self.films = films
+        self.loaders: Dict[str, Callable[..., Awaitable]] = {
+            FILM_CACHE: film.get_by_id,
+            GENRE_CACHE: genre.get_by_id,
+            PERSON_CACHE: person.get_by_id,
+            FILMS_LIST: films.get_all,
+            PERSON_SEARCH: person.search,
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Счетчики, накопленные с последнего сброса
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.flush()
+                if await self.redis.set(WARMUP_LOCK, 1, nx=True,
+                                        ex=config.WARMUP_INTERVAL):
+                    await self.warm_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Cache warm-up failed')
+            await asyncio.sleep(config.WARMUP_FLUSH_INTERVAL)
+
+    async def flush(self):
+        """Добавление счетчиков воркера в горячие ключи в редисе"""
+        items = hot_keys.pop_all()
+        if not items:
+            return
+        kinds = set()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for (kind, member), count in items:
+                kinds.add(kind)
+                pipe.zincrby(build_redis_key(HOT_KEYS, kind), count, member)
+            for kind in kinds:
+                # Храним только верхние WARMUP_TOP_KEYS ключей типа
+                pipe.zremrangebyrank(
+                    build_redis_key(HOT_KEYS, kind),
+                    0, -config.WARMUP_TOP_KEYS - 1
+                )
+            await pipe.execute()
+
+    async def hot(self, kind: str, limit: int) -> List[list]:
+        """Аргументы самых частых запросов типа kind"""
+        members = await self.redis.zrevrange(
+            build_redis_key(HOT_KEYS, kind), 0, limit - 1
+        )
+        return [orjson.loads(member)[1:] for member in members]
+
+    async def warm_up(self) -> int:
+        """Прогрев кеша, возвращает число запросов с ошибкой"""
+        calls: Dict[bytes, Callable[[], Awaitable]] = {}
+
+        def add(kind: str, *args):
+            calls[orjson.dumps([kind, *args])] = (
+                lambda: self.loaders[kind](*args)
+            )
+
+        # Всегда: список жанров, первые страницы фильмов для обеих
+        # сортировок и самые частые поиски персон
+        calls[b'genres'] = self.genres.get_all
+        for reverse in ('desc', 'asc'):
+            for page_number in range(1, config.WARMUP_FILM_PAGES + 1):
+                add(FILMS_LIST, None, None, reverse, FILM_PAGE_SIZE,
+                    page_number, list(Film_API.source_fields))
+        for args in await self.hot(PERSON_SEARCH, config.WARMUP_TOP_SEARCHES):
+            add(PERSON_SEARCH, *args)
+        # Горячие ключи остальных типов
+        for kind in self.loaders:
+            for args in await self.hot(kind, config.WARMUP_TOP_KEYS):
+                add(kind, *args)
+        await self._decay()
+
+        semaphore = asyncio.Semaphore(config.WARMUP_CONCURRENCY)
+
+        async def call(load: Callable[[], Awaitable]):
+            async with semaphore:
+                await load()
+
+        results = await asyncio.gather(
+            *(call(load) for load in calls.values()), return_exceptions=True
+        )
+        failed = [result for result in results
+                  if isinstance(result, Exception)]
+        for error in failed[:3]:
+            logger.warning('Cache warm-up request failed', exc_info=error)
+        logger.info('Cache warm-up: %s requests, %s failed',
+                    len(calls), len(failed))
+        return len(failed)
+
+    async def _decay(self):
+        """Уменьшение старых счетчиков, чтобы горячими были недавние"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for kind in self.loaders:
+                key = build_redis_key(HOT_KEYS, kind)
+                pipe.zunionstore(key, {key: config.WARMUP_DECAY})
+            await pipe.execute()
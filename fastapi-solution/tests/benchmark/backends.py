@@ -0,0 +1,87 @@
+"""Локальные бэкенды для нагрузочных тестов: редис и заглушка эластика,
+запущенные отдельными процессами, чтобы не делить GIL с нагрузкой."""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+BENCHMARK_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 120):
+    """Ожидание, пока процесс начнет принимать соединения.
+    Заглушке эластика на миллионе фильмов нужно время на загрузку данных"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f'Port {port} is not listening after {timeout}s')
+
+
+@contextmanager
+def process(args: list, port: int, **kwargs) -> Iterator[subprocess.Popen]:
+    proc = subprocess.Popen(args, **kwargs)
+    try:
+        wait_for_port(port)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextmanager
+def redis_server(mode: str = 'auto') -> Iterator[Tuple[str, int]]:
+    """Редис в памяти без сохранения на диск.
+    mode: server - процесс redis-server, fake - fakeredis (Python 3.11+;
+    медленнее настоящего, годится для сравнения прогонов между собой),
+    auto - redis-server, если он установлен"""
+    if mode == 'auto':
+        mode = 'server' if shutil.which('redis-server') else 'fake'
+    port = free_port()
+    if mode == 'server':
+        args = ['redis-server', '--port', str(port), '--save', '',
+                '--appendonly', 'no']
+    else:
+        args = [sys.executable, os.path.abspath(__file__), 'fakeredis',
+                str(port)]
+    with process(args, port, stdout=subprocess.DEVNULL):
+        yield '127.0.0.1', port
+
+
+def serve_fakeredis(port: int):
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    server.serve_forever()
+
+
+@contextmanager
+def stub_elastic(data_path: str, latency_ms: float = 0
+                 ) -> Iterator[Tuple[str, int]]:
+    port = free_port()
+    with process([
+        sys.executable, os.path.join(BENCHMARK_PATH, 'stub_es.py'),
+        '--data', data_path, '--port', str(port),
+        '--latency-ms', str(latency_ms),
+    ], port):
+        yield '127.0.0.1', port
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['fakeredis']:
+        serve_fakeredis(int(sys.argv[2]))
@@ -0,0 +1,75 @@
+"""Сравнение результатов двух прогонов нагрузочного теста:
+    python compare.py results/base.json results/new.json
+
+Для каждого эндпоинта выводятся rps и p50/p95/p99 обоих прогонов и
+изменение в процентах. Если задан --threshold, код возврата 1 означает,
+что хотя бы один перцентиль вырос (или rps упал) больше, чем на порог."""
+import argparse
+import json
+import sys
+from typing import List, Tuple
+
+METRICS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(base: float, new: float) -> float:
+    if not base:
+        return 0.0
+    return (new - base) / base * 100
+
+
+def compare(base: dict, new: dict, threshold: float = None
+            ) -> Tuple[List[str], bool]:
+    lines = [f'{"endpoint":<16}' + ''.join(
+        f'{metric:>29}' for metric in METRICS
+    )]
+    regressed = False
+    for name, new_stats in new['endpoints'].items():
+        base_stats = base['endpoints'].get(name)
+        if base_stats is None:
+            lines.append(f'{name:<16} (нет в базовом прогоне)')
+            continue
+        row = f'{name:<16}'
+        for metric in METRICS:
+            delta = change(base_stats[metric], new_stats[metric])
+            # Для rps плохо падение, для задержек - рост
+            worse = -delta if metric == 'rps' else delta
+            if threshold is not None and worse > threshold:
+                regressed = True
+            row += (f'{base_stats[metric]:>9} -> {new_stats[metric]:<9}'
+                    f'{delta:+6.1f}%')
+        lines.append(row)
+    return lines, regressed
+
+
+def describe(result: dict) -> str:
+    meta = result['meta']
+    git = meta['git']
+    dirty = ' (dirty)' if git.get('dirty') else ''
+    return (f'{git.get("commit", "")[:8]}{dirty} {git.get("subject", "")} '
+            f'{meta.get("label", "")} {meta["dataset"]}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float,
+                        help='Допустимое ухудшение в процентах')
+    args = parser.parse_args()
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    if base['meta']['load'] != new['meta']['load'] \
+            or base['meta']['dataset'] != new['meta']['dataset']:
+        print('Внимание: прогоны сделаны с разной нагрузкой или данными')
+    print('base:', describe(base))
+    print('new: ', describe(new))
+    lines, regressed = compare(base, new, args.threshold)
+    print('\n'.join(lines))
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Генератор синтетических данных для нагрузочных тестов.
+
+Документы строятся по схемам индексов из tests/functional/testdata/schemes
+(каждый документ проверяется на соответствие mapping со strict) и
+пишутся построчно в NDJSON, поэтому объем ограничен только диском:
+    python generate_data.py --films 1000000 --persons 500000 --out data
+
+Кроме данных пишется manifest.json: размер выборки и образцы uuid,
+слов названий и имен, из которых нагрузочный тест собирает запросы.
+Одинаковый --seed дает одинаковые данные."""
+import argparse
+import json
+import os
+import random
+import uuid
+from typing import Dict, Iterator, List
+
+import orjson
+
+SCHEMES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '..', 'functional', 'testdata', 'schemes'
+)
+
+GENRES = [
+    'Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime',
+    'Documentary', 'Drama', 'Family', 'Fantasy', 'Film-Noir', 'Game-Show',
+    'History', 'Horror', 'Music', 'Musical', 'Mystery', 'News',
+    'Reality-TV', 'Romance', 'Sci-Fi', 'Short', 'Sport', 'Talk-Show',
+    'Thriller', 'War',
+]
+
+WORDS = (
+    'star war empire return hope force awaken night dark knight rise lost '
+    'city love story secret garden last kingdom ship ocean fire ice storm '
+    'king queen shadow light silent river mountain road home dream game '
+    'house island journey legend machine mirror moon sun planet galaxy '
+    'ghost heart iron golden black white red blue green winter summer '
+    'spring autumn time space man woman child family friend enemy hunter '
+    'warrior soldier spy agent code mission escape revenge destiny promise '
+    'battle music dance song street town village forest desert sky world'
+).split()
+
+FIRST_NAMES = (
+    'John Mary James Anna Robert Linda Michael Elena William Olga David '
+    'Susan Richard Maria Joseph Karen Thomas Irina Charles Nancy George '
+    'Lisa Daniel Sofia Mark Julia Paul Alice Steven Emma Andrew Natalia'
+).split()
+
+LAST_NAMES = (
+    'Smith Johnson Williams Brown Jones Miller Davis Wilson Anderson '
+    'Taylor Thomas Moore Martin Jackson Thompson White Harris Clark Lewis '
+    'Robinson Walker Young Allen King Wright Scott Green Baker Adams '
+    'Nelson Hill Campbell Mitchell Roberts Carter Phillips Evans Turner'
+).split()
+
+# Сколько образцов каждого вида попадает в manifest.json
+SAMPLE_SIZE = 10000
+
+
+def load_scheme(index: str) -> dict:
+    with open(os.path.join(SCHEMES_PATH, f'{index}.json')) as file:
+        return json.load(file)['mappings']['properties']
+
+
+def validate(doc: dict, properties: dict, path: str = ''):
+    """Проверка документа по mapping: индексы созданы с dynamic strict,
+    поэтому лишнее или пропущенное поле - ошибка генератора"""
+    if set(doc) != set(properties):
+        raise ValueError(
+            f'{path or "document"} fields {sorted(doc)} '
+            f'do not match scheme {sorted(properties)}'
+        )
+    for name, field in properties.items():
+        if field.get('type') == 'nested':
+            for item in doc[name]:
+                validate(item, field['properties'], f'{path}{name}.')
+
+
+class Generator:
+    def __init__(self, films: int, persons: int, seed: int):
+        self.films = films
+        self.persons = persons
+        self.random = random.Random(seed)
+        self.genres = [
+            {'id': self.uuid(), 'name': name} for name in GENRES
+        ]
+        self.person_ids = [self.uuid() for _ in range(persons)]
+        self.person_names = [self.full_name() for _ in range(persons)]
+        # film_ids каждой персоны, заполняется при генерации фильмов
+        self.person_films: List[List[int]] = [[] for _ in range(persons)]
+        self.person_roles: List[str] = [''] * persons
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.random.getrandbits(128), version=4))
+
+    def words(self, low: int, high: int) -> str:
+        return ' '.join(
+            self.random.choice(WORDS)
+            for _ in range(self.random.randint(low, high))
+        )
+
+    def full_name(self) -> str:
+        return (f'{self.random.choice(FIRST_NAMES)} '
+                f'{self.random.choice(LAST_NAMES)}')
+
+    def people(self, film: int, low: int, high: int, role: str) -> List[dict]:
+        if not self.persons:
+            return []
+        people = []
+        for person in {self.random.randrange(self.persons)
+                       for _ in range(self.random.randint(low, high))}:
+            self.person_films[person].append(film)
+            self.person_roles[person] = self.person_roles[person] or role
+            people.append({
+                'id': self.person_ids[person],
+                'name': self.person_names[person],
+            })
+        return people
+
+    def iter_films(self) -> Iterator[dict]:
+        for film in range(self.films):
+            actors = self.people(film, 1, 5, 'actor')
+            writers = self.people(film, 1, 2, 'writer')
+            director = self.people(film, 0, 1, 'director')
+            yield {
+                'id': self.uuid(),
+                'imdb_rating': round(self.random.uniform(1, 10), 1),
+                'genre': self.random.sample(
+                    self.genres, self.random.randint(1, 3)
+                ),
+                'title': self.words(1, 4).title(),
+                'description': self.words(8, 20).capitalize() + '.',
+                'director': [item['name'] for item in director],
+                'actors_names': [item['name'] for item in actors],
+                'writers_names': [item['name'] for item in writers],
+                'actors': actors,
+                'writers': writers,
+            }
+
+    def iter_persons(self, film_ids: List[str]) -> Iterator[dict]:
+        for person in range(self.persons):
+            yield {
+                'id': self.person_ids[person],
+                'full_name': self.person_names[person],
+                'role': self.person_roles[person] or 'actor',
+                'film_ids': [film_ids[film]
+                             for film in self.person_films[person]],
+            }
+
+    def iter_genres(self) -> Iterator[dict]:
+        yield from self.genres
+
+
+def write_index(path: str, index: str, docs: Iterator[dict]) -> int:
+    properties = load_scheme(index)
+    count = 0
+    with open(os.path.join(path, f'{index}.ndjson'), 'wb') as file:
+        for doc in docs:
+            validate(doc, properties)
+            file.write(orjson.dumps(doc))
+            file.write(b'\n')
+            count += 1
+    return count
+
+
+def sample(rng: random.Random, items: list, size: int = SAMPLE_SIZE) -> list:
+    return rng.sample(items, min(size, len(items)))
+
+
+def generate(path: str, films: int, persons: int, seed: int) -> Dict:
+    os.makedirs(path, exist_ok=True)
+    generator = Generator(films, persons, seed)
+    film_ids: List[str] = []
+    title_words: Dict[str, int] = {}
+
+    def films_with_ids():
+        for film in generator.iter_films():
+            film_ids.append(film['id'])
+            for word in film['title'].lower().split():
+                title_words[word] = title_words.get(word, 0) + 1
+            yield film
+
+    counts = {
+        'movies': write_index(path, 'movies', films_with_ids()),
+        'persons': write_index(
+            path, 'persons', generator.iter_persons(film_ids)
+        ),
+        'genres': write_index(path, 'genres', generator.iter_genres()),
+    }
+    rng = random.Random(seed)
+    manifest = {
+        'seed': seed,
+        'counts': counts,
+        'film_ids': sample(rng, film_ids),
+        'person_ids': sample(rng, generator.person_ids),
+        'genre_ids': [genre['id'] for genre in generator.genres],
+        'title_words': sorted(title_words, key=title_words.get, reverse=True),
+        'name_words': sorted(set(FIRST_NAMES + LAST_NAMES)),
+    }
+    with open(os.path.join(path, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--persons', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='data')
+    args = parser.parse_args()
+    manifest = generate(args.out, args.films, args.persons, args.seed)
+    print(json.dumps(manifest['counts']))
+
+
+if __name__ == '__main__':
+    main()
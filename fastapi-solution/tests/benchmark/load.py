@@ -0,0 +1,299 @@
+"""Нагрузочный тест эндпоинтов api/v1.
+
+Каждый сценарий - один эндпоинт - нагружается по очереди: --concurrency
+клиентов в течение --duration секунд после --warmup секунд прогрева.
+Для сценария считаются пропускная способность и задержки p50/p95/p99,
+результат пишется в JSON вместе с коммитом и настройками кеша, чтобы
+прогоны можно было сравнить (compare.py):
+    python load.py --url http://127.0.0.1:8003 --manifest data/manifest.json
+
+uuid и слова запросов берутся из manifest.json генератора; при
+--distribution zipf популярные объекты запрашиваются чаще остальных,
+как у живого трафика, при uniform - равномерно (худший случай для кеша)."""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+API = '/api/v1'
+CURSOR_HEADER = 'X-Next-Cursor'
+# Сколько страниц проходит клиент курсором, прежде чем начать сначала
+CURSOR_PAGES = 20
+# Переменные окружения сервиса, которые попадают в результаты
+ENV_PREFIXES = ('CACHE_', 'LOCAL_CACHE_', 'RESPONSE_CACHE_', 'REDIS_',
+                'ELASTIC_')
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'results')
+
+
+class Sampler:
+    def __init__(self, manifest: dict, distribution: str, seed: int):
+        self.manifest = manifest
+        self.random = random.Random(seed)
+        self.weights: Dict[str, List[float]] = {}
+        self.distribution = distribution
+
+    def pick(self, name: str):
+        items = self.manifest[name]
+        if self.distribution == 'uniform':
+            return self.random.choice(items)
+        if name not in self.weights:
+            # Закон Ципфа: i-й по популярности объект запрашивается
+            # пропорционально 1/i
+            self.weights[name] = list(itertools.accumulate(
+                1 / rank for rank in range(1, len(items) + 1)
+            ))
+        return self.random.choices(
+            items, cum_weights=self.weights[name]
+        )[0]
+
+    def page(self, pages: int = 20) -> int:
+        return self.random.randint(1, pages)
+
+
+@dataclass
+class Scenario:
+    name: str
+    # Путь и параметры очередного запроса; state - состояние клиента
+    request: Callable[[Sampler, dict], Tuple[str, dict]]
+    on_response: Optional[Callable[[aiohttp.ClientResponse, dict], None]] \
+        = None
+
+
+def next_cursor(response: aiohttp.ClientResponse, state: dict):
+    cursor = response.headers.get(CURSOR_HEADER)
+    state['pages'] = state.get('pages', 0) + 1
+    if cursor is None or state['pages'] >= CURSOR_PAGES:
+        state.clear()
+    else:
+        state['cursor'] = cursor
+
+
+SCENARIOS = [
+    Scenario('films_list', lambda s, _: (f'{API}/films/', {
+        'sort': s.random.choice(('-imdb_rating', 'imdb_rating')),
+        'page_number': s.page(),
+    })),
+    Scenario('films_by_genre', lambda s, _: (f'{API}/films/', {
+        'genre': s.pick('genre_ids'), 'page_number': s.page(),
+    })),
+    Scenario('films_search', lambda s, _: (f'{API}/films/search', {
+        'query': s.pick('title_words'), 'page_number': s.page(5),
+    })),
+    Scenario('films_cursor', lambda s, state: (f'{API}/films/', {
+        'cursor': state.get('cursor', ''),
+    }), next_cursor),
+    Scenario('film_details', lambda s, _: (
+        f'{API}/films/{s.pick("film_ids")}', {}
+    )),
+    Scenario('genres_list', lambda s, _: (f'{API}/genres/', {})),
+    Scenario('genre_details', lambda s, _: (
+        f'{API}/genres/{s.pick("genre_ids")}', {}
+    )),
+    Scenario('persons_search', lambda s, _: (f'{API}/persons/search', {
+        'query': s.pick('name_words'), 'page_number': s.page(5),
+    })),
+    Scenario('persons_cursor', lambda s, state: (f'{API}/persons/search', {
+        'query': state.setdefault('query', s.pick('name_words')),
+        'cursor': state.get('cursor', ''),
+    }), next_cursor),
+    Scenario('person_details', lambda s, _: (
+        f'{API}/persons/{s.pick("person_ids")}', {}
+    )),
+    Scenario('person_films', lambda s, _: (
+        f'{API}/persons/{s.pick("person_ids")}/film', {}
+    )),
+]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль по ближайшему рангу; values должен быть отсортирован"""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies: List[float], statuses: Dict[int, int],
+              errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        'requests': total,
+        'errors': errors,
+        'statuses': {str(code): count for code, count in statuses.items()},
+        'rps': round(total / elapsed, 1) if elapsed else 0,
+        'mean_ms': round(sum(latencies) / total, 3) if total else 0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3) if total else 0,
+    }
+
+
+async def run_scenario(session: aiohttp.ClientSession, url: str,
+                       scenario: Scenario, sampler: Sampler,
+                       concurrency: int, duration: float,
+                       warmup: float) -> dict:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    errors = 0
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    async def client():
+        nonlocal errors
+        state: dict = {}
+        while True:
+            begin = time.perf_counter()
+            if begin >= stop_at:
+                return
+            path, params = scenario.request(sampler, state)
+            try:
+                async with session.get(url + path, params=params) as resp:
+                    await resp.read()
+                    status = resp.status
+                    if scenario.on_response and status == 200:
+                        scenario.on_response(resp, state)
+            except aiohttp.ClientError:
+                status = 0
+            end = time.perf_counter()
+            if begin < measure_from:
+                continue
+            latencies.append((end - begin) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status != 200:
+                errors += 1
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    return summarize(latencies, statuses, errors, elapsed)
+
+
+def git_revision() -> dict:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(
+                ['git', *args], capture_output=True, text=True, check=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ''
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'subject': git('log', '-1', '--format=%s'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+async def run(url: str, manifest: dict, scenarios: List[Scenario],
+              concurrency: int, duration: float, warmup: float,
+              distribution: str, seed: int) -> Dict[str, dict]:
+    results = {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for scenario in scenarios:
+            sampler = Sampler(manifest, distribution, seed)
+            results[scenario.name] = await run_scenario(
+                session, url, scenario, sampler, concurrency, duration, warmup
+            )
+            print(format_row(scenario.name, results[scenario.name]),
+                  flush=True)
+    return results
+
+
+def format_row(name: str, stats: dict) -> str:
+    return (f'{name:<16} {stats["rps"]:>9} rps  p50 {stats["p50_ms"]:>8} ms  '
+            f'p95 {stats["p95_ms"]:>8} ms  p99 {stats["p99_ms"]:>8} ms  '
+            f'errors {stats["errors"]}')
+
+
+def save(results: Dict[str, dict], meta: dict, out: Optional[str]) -> str:
+    if out is None:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        commit = meta['git']['commit'][:8] or 'nogit'
+        label = f'-{meta["label"]}' if meta.get('label') else ''
+        out = os.path.join(RESULTS_PATH, f'{stamp}-{commit}{label}.json')
+    with open(out, 'w') as file:
+        json.dump({'meta': meta, 'endpoints': results}, file, indent=2)
+    return out
+
+
+def build_meta(args: argparse.Namespace, manifest: dict,
+               env: Optional[dict] = None) -> dict:
+    env = os.environ if env is None else env
+    return {
+        'label': args.label,
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'git': git_revision(),
+        'host': {'python': platform.python_version(),
+                 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'dataset': manifest['counts'],
+        'load': {
+            'concurrency': args.concurrency, 'duration': args.duration,
+            'warmup': args.warmup, 'distribution': args.distribution,
+            'seed': args.seed,
+        },
+        'service_env': {key: value for key, value in sorted(env.items())
+                        if key.startswith(ENV_PREFIXES)},
+    }
+
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--distribution', choices=('zipf', 'uniform'),
+                        default='zipf')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument(
+        '--scenarios', default='',
+        help='Сценарии через запятую: '
+             + ', '.join(scenario.name for scenario in SCENARIOS)
+    )
+    parser.add_argument('--label', default='',
+                        help='Метка прогона в имени файла результатов')
+    parser.add_argument('--out', help='Файл результатов (по умолчанию '
+                                      'results/<время>-<коммит>.json)')
+
+
+def select_scenarios(names: str) -> List[Scenario]:
+    if not names:
+        return SCENARIOS
+    selected = names.split(',')
+    unknown = set(selected) - {scenario.name for scenario in SCENARIOS}
+    if unknown:
+        raise SystemExit(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+    return [scenario for scenario in SCENARIOS if scenario.name in selected]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8003')
+    parser.add_argument('--manifest', default='data/manifest.json')
+    add_load_arguments(parser)
+    args = parser.parse_args()
+    with open(args.manifest) as file:
+        manifest = json.load(file)
+    results = asyncio.run(run(
+        args.url, manifest, select_scenarios(args.scenarios),
+        args.concurrency, args.duration, args.warmup, args.distribution,
+        args.seed,
+    ))
+    print(save(results, build_meta(args, manifest), args.out))
+
+
+if __name__ == '__main__':
+    main()
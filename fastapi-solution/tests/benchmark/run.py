@@ -0,0 +1,135 @@
+"""Полный прогон нагрузочного теста на локальных бэкендах.
+
+Генерирует данные (если их еще нет), поднимает редис в памяти, заглушку
+эластика и сервис так же, как в docker-compose (gunicorn с воркерами
+uvicorn), нагружает все эндпоинты api/v1 и сохраняет результаты:
+    python run.py --films 1000000 --persons 500000 --workers 4
+    python run.py --env LOCAL_CACHE_ENABLED=True --label local-cache
+    python compare.py results/<до>.json results/<после>.json
+
+--env передает сервису настройки из core/config.py, так одно и то же
+изменение можно замерить включенным и выключенным."""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+import aiohttp
+import backends
+import generate_data
+import load
+
+SRC_PATH = os.path.join(backends.BENCHMARK_PATH, '..', '..', 'src')
+DATA_PATH = os.path.join(backends.BENCHMARK_PATH, 'data')
+
+
+def prepare_data(path: str, films: int, persons: int, seed: int) -> dict:
+    """Данные генерируются заново, только если изменился их размер"""
+    manifest_path = os.path.join(path, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if manifest['counts']['movies'] == films \
+                and manifest['counts']['persons'] == persons \
+                and manifest['seed'] == seed:
+            return manifest
+    print(f'Generating {films} films and {persons} persons...', flush=True)
+    return generate_data.generate(path, films, persons, seed)
+
+
+def wait_for_api(url: str, timeout: float = 120):
+    async def ping():
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                try:
+                    async with session.get(f'{url}/api/v1/genres/') as resp:
+                        if resp.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.5)
+        raise TimeoutError(f'API at {url} is not ready after {timeout}s')
+    asyncio.run(ping())
+
+
+@contextmanager
+def api_server(env: Dict[str, str], workers: int, server: str,
+               log_path: str = None) -> Iterator[str]:
+    port = backends.free_port()
+    if server == 'gunicorn':
+        args = ['gunicorn', 'main:app', '--workers', str(workers),
+                '--worker-class', 'uvicorn.workers.UvicornWorker',
+                '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    else:
+        args = [sys.executable, '-m', 'uvicorn', 'main:app',
+                '--workers', str(workers), '--port', str(port),
+                '--log-level', 'warning', '--no-access-log']
+    log = open(log_path or os.devnull, 'w')
+    try:
+        with backends.process(args, port, cwd=SRC_PATH, env=env,
+                              stdout=log, stderr=subprocess.STDOUT):
+            url = f'http://127.0.0.1:{port}'
+            wait_for_api(url)
+            yield url
+    finally:
+        log.close()
+
+
+def parse_env(items) -> Dict[str, str]:
+    env = {}
+    for item in items:
+        key, _, value = item.partition('=')
+        env[key] = value
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--films', type=int, default=100000)
+    parser.add_argument('--persons', type=int, default=50000)
+    parser.add_argument('--redis', choices=('auto', 'server', 'fake'),
+                        default='auto')
+    parser.add_argument('--es-latency-ms', type=float, default=0)
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'),
+                        default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--env', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='Настройка сервиса, можно повторять')
+    parser.add_argument('--api-log', help='Файл для вывода сервиса')
+    load.add_load_arguments(parser)
+    args = parser.parse_args()
+
+    manifest = prepare_data(args.data, args.films, args.persons, args.seed)
+    scenarios = load.select_scenarios(args.scenarios)
+    with backends.redis_server(args.redis) as (redis_host, redis_port), \
+            backends.stub_elastic(args.data, args.es_latency_ms) \
+            as (es_host, es_port):
+        service_env = {
+            'REDIS_HOST': redis_host, 'REDIS_PORT': str(redis_port),
+            'ELASTIC_HOST': es_host, 'ELASTIC_PORT': str(es_port),
+            **parse_env(args.env),
+        }
+        env = {**os.environ, **service_env}
+        env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        with api_server(env, args.workers, args.server, args.api_log) as url:
+            results = asyncio.run(load.run(
+                url, manifest, scenarios, args.concurrency, args.duration,
+                args.warmup, args.distribution, args.seed,
+            ))
+    meta = load.build_meta(args, manifest, env)
+    meta['setup'] = {'server': args.server, 'workers': args.workers,
+                     'redis': args.redis,
+                     'es_latency_ms': args.es_latency_ms}
+    print(load.save(results, meta, args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+"""HTTP-заглушка elasticsearch для нагрузочных тестов.
+
+Держит в памяти документы из NDJSON генератора и отвечает на те запросы,
+которые делает API: _doc, _mget, _search (match_all, match, nested по
+жанру, query_string, ids, сортировка, from/size, search_after, PIT),
+_msearch, _count и _pit. Для запросов по названию и имени строится
+инвертированный индекс, отсортированные выборки кешируются, поэтому
+ответы на миллионе фильмов остаются в пределах миллисекунд и в замерах
+видна работа сервиса, а не заглушки. Релевантность упрощенная: число
+совпавших слов запроса.
+
+--latency-ms добавляет к каждому ответу задержку, чтобы приблизить
+время ответа к настоящему кластеру:
+    python stub_es.py --data data --port 9201 --latency-ms 2"""
+import argparse
+import asyncio
+import bisect
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from aiohttp import web
+
+# Поля с инвертированным индексом для match и query_string
+TEXT_FIELDS = {'movies': 'title', 'persons': 'full_name'}
+
+# Сколько отсортированных выборок держать в памяти
+VIEWS_CACHE_SIZE = 256
+
+ES_VERSION = {'number': '7.17.2', 'build_flavor': 'default'}
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+class ElasticError(Exception):
+    """Ошибка, которую заглушка отдает клиенту в формате elasticsearch"""
+
+    def __init__(self, status: int, error_type: str, reason: str = ''):
+        super().__init__(reason or error_type)
+        self.status = status
+        self.body = {
+            'error': {'type': error_type, 'reason': reason or error_type},
+            'status': status,
+        }
+
+
+def tokenize(text) -> List[str]:
+    if isinstance(text, list):
+        text = ' '.join(text)
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class Index:
+    def __init__(self, name: str, docs: Iterable[dict]):
+        self.name = name
+        self.docs: Dict[str, dict] = {}
+        # Порядок хранения для сортировки по _doc и _shard_doc
+        self.positions: Dict[str, int] = {}
+        self.terms: Dict[str, List[str]] = {}
+        self.nested: Dict[Tuple[str, str], List[str]] = {}
+        text_field = TEXT_FIELDS.get(name)
+        for doc in docs:
+            self.positions.setdefault(doc['id'], len(self.positions))
+            self.docs[doc['id']] = doc
+            if text_field:
+                for term in set(tokenize(doc.get(text_field, ''))):
+                    self.terms.setdefault(term, []).append(doc['id'])
+            for field, value in doc.items():
+                if isinstance(value, list) and value \
+                        and isinstance(value[0], dict):
+                    for item in value:
+                        self.nested.setdefault(
+                            (f'{field}.id', item['id']), []
+                        ).append(doc['id'])
+        self.text_field = text_field
+        self.views: 'OrderedDict[bytes, tuple]' = OrderedDict()
+
+    def match_text(self, text: str) -> Dict[str, float]:
+        """Документы с любым из слов запроса, счет - число совпадений"""
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(text)):
+            for doc_id in self.terms.get(term, ()):
+                scores[doc_id] = scores.get(doc_id, 0) + 1
+        return scores
+
+    def candidates(self, query: Optional[dict]) -> Dict[str, float]:
+        if not query or 'match_all' in query:
+            return dict.fromkeys(self.docs, 1.0)
+        if 'bool' in query:
+            clauses = query['bool'].get('must') or query['bool'].get(
+                'filter') or {}
+            if isinstance(clauses, dict):
+                clauses = [clauses]
+            result = None
+            for clause in clauses:
+                found = self.candidates(clause)
+                if result is None:
+                    result = found
+                else:
+                    result = {doc_id: score + found[doc_id]
+                              for doc_id, score in result.items()
+                              if doc_id in found}
+            return result if result is not None else self.candidates(None)
+        if 'nested' in query:
+            return self.candidates(query['nested']['query'])
+        if 'ids' in query:
+            return {doc_id: 1.0 for doc_id in query['ids']['values']
+                    if doc_id in self.docs}
+        for kind in ('match', 'term', 'fuzzy'):
+            if kind in query:
+                (field, value), = query[kind].items()
+                if isinstance(value, dict):
+                    value = value.get('query', value.get('value'))
+                if field.endswith('.id'):
+                    return dict.fromkeys(self.nested.get((field, value), ()),
+                                         1.0)
+                if field == 'id':
+                    return {value: 1.0} if value in self.docs else {}
+                return self.match_text(value)
+        if 'query_string' in query:
+            return self.match_text(query['query_string']['query'])
+        raise ElasticError(400, 'parsing_exception',
+                           f'Unsupported query: {query}')
+
+    def sort_value(self, doc_id: str, field: str, score: float):
+        if field == '_score':
+            return score
+        if field in ('_doc', '_shard_doc'):
+            return self.positions[doc_id]
+        return self.docs[doc_id].get(field)
+
+    def view(self, query: Optional[dict], sort: list) -> tuple:
+        """Выборка по запросу, отсортированная как просил клиент:
+        (ключи сортировки, id документов, значения sort для ответа)"""
+        cache_key = orjson.dumps([query, sort], option=orjson.OPT_SORT_KEYS)
+        view = self.views.get(cache_key)
+        if view is not None:
+            self.views.move_to_end(cache_key)
+            return view
+        scores = self.candidates(query)
+        rows = []
+        for doc_id, score in scores.items():
+            values = [self.sort_value(doc_id, field, score)
+                      for field, _ in sort]
+            rows.append((sort_key(values, sort), doc_id, values))
+        rows.sort(key=lambda row: row[0])
+        view = (
+            [row[0] for row in rows], [row[1] for row in rows],
+            [row[2] for row in rows],
+        )
+        self.views[cache_key] = view
+        if len(self.views) > VIEWS_CACHE_SIZE:
+            self.views.popitem(last=False)
+        return view
+
+
+def parse_sort(sort) -> List[Tuple[str, str]]:
+    if not sort:
+        return [('_score', 'desc')]
+    if isinstance(sort, (str, dict)):
+        sort = [sort]
+    result = []
+    for item in sort:
+        if isinstance(item, str):
+            field, _, order = item.partition(':')
+            result.append((field, order or (
+                'desc' if field == '_score' else 'asc'
+            )))
+            continue
+        (field, order), = item.items()
+        if isinstance(order, dict):
+            order = order.get('order')
+        result.append((field, order or 'asc'))
+    return result
+
+
+def sort_key(values: list, sort: List[Tuple[str, str]]) -> tuple:
+    key = []
+    for value, (_, order) in zip(values, sort):
+        if value is None:
+            value = 0
+        if order == 'desc':
+            # Строки по убыванию не сортируются - в API их нет
+            value = -value if isinstance(value, (int, float)) else value
+        key.append(value)
+    return tuple(key)
+
+
+def project(source: dict, includes: Optional[List[str]]) -> dict:
+    if not includes:
+        return source
+    return {field: source[field] for field in includes if field in source}
+
+
+def source_includes(request: web.Request, body: dict) -> Optional[List[str]]:
+    includes = request.query.get('_source_includes') \
+        or request.query.get('_source')
+    if includes:
+        return includes.split(',')
+    source = body.get('_source')
+    if isinstance(source, list):
+        return source
+    if isinstance(source, dict):
+        return source.get('includes')
+    return None
+
+
+class StubElastic:
+    def __init__(self, data_path: str, latency: float = 0):
+        self.latency = latency
+        self.indexes: Dict[str, Index] = {}
+        for file_name in sorted(os.listdir(data_path)):
+            name, ext = os.path.splitext(file_name)
+            if ext == '.ndjson':
+                with open(os.path.join(data_path, file_name), 'rb') as file:
+                    self.indexes[name] = Index(
+                        name, (orjson.loads(line) for line in file)
+                    )
+        self.pits: Dict[str, str] = {}
+
+    def index(self, name: str) -> Index:
+        if name not in self.indexes:
+            raise ElasticError(404, 'index_not_found_exception', name)
+        return self.indexes[name]
+
+    async def respond(self, data: dict, started: float,
+                      status: int = 200) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if 'took' in data:
+            data['took'] = int((time.perf_counter() - started) * 1000)
+        return web.Response(
+            body=orjson.dumps(data), status=status,
+            content_type='application/json',
+        )
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[product_header])
+        app.router.add_route('GET', '/', self.info)
+        app.router.add_route('HEAD', '/', self.info)
+        app.router.add_route('GET', '/{index}/_doc/{id}', self.get)
+        app.router.add_route('*', '/{index}/_mget', self.mget)
+        app.router.add_route('*', '/_search', self.search)
+        app.router.add_route('*', '/{index}/_search', self.search)
+        app.router.add_route('*', '/_msearch', self.msearch)
+        app.router.add_route('*', '/{index}/_msearch', self.msearch)
+        app.router.add_route('*', '/{index}/_count', self.count)
+        app.router.add_route('POST', '/{index}/_pit', self.open_pit)
+        app.router.add_route('DELETE', '/_pit', self.close_pit)
+        return app
+
+    async def info(self, request: web.Request) -> web.Response:
+        return await self.respond({
+            'name': 'stub', 'cluster_name': 'benchmark',
+            'version': ES_VERSION, 'tagline': 'You Know, for Search',
+        }, time.perf_counter())
+
+    async def get(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        index = self.index(request.match_info['index'])
+        doc_id = request.match_info['id']
+        doc = index.docs.get(doc_id)
+        result = {'_index': index.name, '_id': doc_id, 'found': bool(doc)}
+        if doc is None:
+            return await self.respond(result, started, 404)
+        result['_source'] = project(doc, source_includes(request, {}))
+        return await self.respond(result, started)
+
+    async def mget(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        index = self.index(request.match_info['index'])
+        body = await read_body(request)
+        includes = source_includes(request, body)
+        ids = body.get('ids') or [doc['_id'] for doc in body.get('docs', [])]
+        docs = []
+        for doc_id in ids:
+            doc = index.docs.get(doc_id)
+            item = {'_index': index.name, '_id': doc_id, 'found': bool(doc)}
+            if doc is not None:
+                item['_source'] = project(doc, includes)
+            docs.append(item)
+        return await self.respond({'docs': docs}, started)
+
+    def run_search(self, index_name: Optional[str], body: dict,
+                   params: dict, includes: Optional[List[str]]) -> dict:
+        pit = body.get('pit')
+        if pit:
+            if pit['id'] not in self.pits:
+                raise ElasticError(404, 'search_context_missing_exception')
+            index_name = self.pits[pit['id']]
+        index = self.index(index_name)
+        sort = parse_sort(body.get('sort') or params.get('sort'))
+        keys, ids, values = index.view(body.get('query'), sort)
+        start = int(body.get('from', params.get('from', 0)) or 0)
+        size = int(body.get('size', params.get('size', 10)))
+        after = body.get('search_after')
+        if after:
+            start = bisect.bisect_right(keys, sort_key(after, sort))
+        hits = []
+        for position in range(start, min(start + size, len(ids))):
+            doc_id = ids[position]
+            hits.append({
+                '_index': index.name, '_id': doc_id, '_score': None,
+                '_source': project(index.docs[doc_id], includes),
+                'sort': values[position],
+            })
+        result = {
+            'took': 0, 'timed_out': False,
+            'hits': {
+                'total': {'value': len(ids), 'relation': 'eq'},
+                'max_score': None, 'hits': hits,
+            },
+        }
+        if pit:
+            result['pit_id'] = pit['id']
+        return result
+
+    async def search(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        body = await read_body(request)
+        result = self.run_search(
+            request.match_info.get('index'), body, request.query,
+            source_includes(request, body)
+        )
+        return await self.respond(result, started)
+
+    async def msearch(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        lines = [orjson.loads(line)
+                 for line in (await request.read()).splitlines() if line]
+        responses = []
+        for header, body in zip(lines[::2], lines[1::2]):
+            index_name = header.get('index', request.match_info.get('index'))
+            try:
+                item = self.run_search(
+                    index_name, body, {}, source_includes(request, body)
+                )
+                item['status'] = 200
+            except ElasticError as error:
+                item = error.body
+            responses.append(item)
+        return await self.respond(
+            {'took': 0, 'responses': responses}, started
+        )
+
+    async def count(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        index = self.index(request.match_info['index'])
+        body = await read_body(request)
+        return await self.respond({
+            'count': len(index.candidates(body.get('query')))
+        }, started)
+
+    async def open_pit(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        index = self.index(request.match_info['index'])
+        pit_id = uuid.uuid4().hex
+        self.pits[pit_id] = index.name
+        return await self.respond({'id': pit_id}, started)
+
+    async def close_pit(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        body = await read_body(request)
+        found = self.pits.pop(body.get('id'), None) is not None
+        return await self.respond(
+            {'succeeded': True, 'num_freed': int(found)}, started
+        )
+
+
+async def read_body(request: web.Request) -> dict:
+    data = await request.read()
+    return orjson.loads(data) if data else {}
+
+
+@web.middleware
+async def product_header(request: web.Request, handler) -> web.Response:
+    """Клиент elasticsearch 7.14+ проверяет, что отвечает elasticsearch"""
+    try:
+        response = await handler(request)
+    except ElasticError as error:
+        response = web.Response(
+            body=orjson.dumps(error.body), status=error.status,
+            content_type='application/json',
+        )
+    response.headers['X-Elastic-Product'] = 'Elasticsearch'
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data', default='data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9201)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+    stub = StubElastic(args.data, args.latency_ms / 1000)
+    web.run_app(stub.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -125,3 +125,16 @@ def make_get_request(session):
                 status=response.status,
             )
     return inner
+
+
+@pytest.fixture
+def make_post_request(session):
+    async def inner(method: str, data: Optional[dict] = None) -> HTTPResponse:
+        url = settings.service_url + settings.api_url + method
+        async with session.post(url, json=data) as response:
+            return HTTPResponse(
+                body=await response.json(),
+                headers=response.headers,
+                status=response.status,
+            )
+    return inner
@@ -7,6 +7,9 @@ class TestSettings(BaseSettings):
     redis_host: str = Field('redis')
     redis_port: int = Field(6379)
     service_url: str = Field('http://api:8000')
+    # API с реестром жанров в памяти (GENRE_REGISTRY_ENABLED)
+    genre_registry_service_url: str = Field('http://api_genre_registry:8000')
+    genre_registry_channel: str = Field('genres:changed')
     es_indexes: list = Field(['movies', 'genres', 'persons'])
     api_url: str = Field('/api/v1')
     method_films: str = Field('/films/')
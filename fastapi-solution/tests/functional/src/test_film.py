@@ -1,3 +1,4 @@
+import asyncio
 import json
 from http import HTTPStatus
 
@@ -130,7 +131,8 @@ async def test_films_cache(
 ):
     """Тест кэша"""
     page_number = '?page_number=2'
-    redis_key = 'films||reverse::desc||page_number::2||page_size::10'
+    redis_key = ('films||reverse::desc||page_number::2||page_size::10'
+                 '||fields::id,title,imdb_rating')
 
     # Очищаем Redis, чтобы проверить, что после запроса один конкретный ключ
     await redis_client.flushall()
@@ -220,4 +222,180 @@ async def test_films_search_non_existent_title(
 
     assert response.status == HTTPStatus.OK
     assert response.body == result
-    
\ No newline at end of file
+
+
+async def test_films_get_by_cursor(
+    es_client, make_get_request, create_fill_delete_es_index
+):
+    """Тест на курсорную пагинацию: обход всей выдачи страницами по 4"""
+    result = await expected_response_json('test_films_get_all')
+
+    films, cursor = [], ''
+    while cursor is not None:
+        response = await make_get_request(
+            settings.method_films, {'cursor': cursor, 'page_size': 4}
+        )
+        assert response.status == HTTPStatus.OK
+        assert len(response.body) <= 4
+        films += response.body
+        cursor = response.headers.get('X-Next-Cursor')
+
+    assert len(films) == 11
+    assert len({film['uuid'] for film in films}) == 11
+    assert films[:10] == result
+
+
+async def test_films_invalid_cursor(
+    es_client, make_get_request, create_fill_delete_es_index
+):
+    """Тест на некорректный курсор"""
+    error_msg = {'detail': 'Invalid cursor'}
+
+    response = await make_get_request(
+        settings.method_films, {'cursor': 'not-a-cursor'}
+    )
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.body == error_msg
+
+
+async def test_films_cursor_other_sort(
+    es_client, make_get_request, create_fill_delete_es_index
+):
+    """Курсор нельзя продолжить с другой сортировкой"""
+    error_msg = {'detail': 'Invalid cursor'}
+
+    response = await make_get_request(
+        settings.method_films, {'cursor': '', 'page_size': 4}
+    )
+    response = await make_get_request(
+        settings.method_films, {
+            'cursor': response.headers['X-Next-Cursor'],
+            'page_size': 4, 'sort': 'imdb_rating',
+        }
+    )
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.body == error_msg
+
+
+async def test_films_batch(
+    es_client, make_get_request, make_post_request,
+    create_fill_delete_es_index
+):
+    """Пакетное получение фильмов: порядок запроса и null для отсутствующих"""
+    ids = [
+        '0312ed51-8833-413f-bff5-0e139c11264a',
+        '2d811247-a406-32da-b34e-699bd10f7aec',
+        '3d825f60-9fff-4dfe-b294-1a45fa1e115d',
+    ]
+
+    response = await make_post_request(
+        f'{settings.method_films}batch', {'ids': ids}
+    )
+
+    assert response.status == HTTPStatus.OK
+    assert [film and film['uuid'] for film in response.body] == [
+        ids[0], None, ids[2]
+    ]
+    single = await make_get_request(f'{settings.method_films}{ids[2]}', {})
+    assert response.body[2] == single.body
+
+
+async def test_films_batch_too_many_ids(
+    es_client, make_post_request, create_fill_delete_es_index
+):
+    """Тест на ограничение числа uuid в пакетном запросе"""
+    ids = ['3d825f60-9fff-4dfe-b294-1a45fa1e115d'] * 101
+
+    response = await make_post_request(
+        f'{settings.method_films}batch', {'ids': ids}
+    )
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+async def test_films_page_size_limit(
+    es_client, make_get_request, create_fill_delete_es_index
+):
+    """Тест на ограничение размера страницы"""
+    response = await make_get_request(
+        settings.method_films, {'page_size': 1000}
+    )
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+async def test_films_export(
+    es_client, session, create_fill_delete_es_index
+):
+    """Выгрузка всех фильмов в NDJSON с выбором полей"""
+    url = f'{settings.service_url}{settings.api_url}{settings.method_films}'
+
+    async with session.get(
+        f'{url}export', params={'fields': 'id,title'}
+    ) as response:
+        lines = (await response.text()).splitlines()
+
+    assert response.status == HTTPStatus.OK
+    assert response.content_type == 'application/x-ndjson'
+    films = [json.loads(line) for line in lines]
+    assert len(films) == 11
+    assert all(set(film) == {'id', 'title'} for film in films)
+
+
+async def test_films_not_modified(
+    es_client, session, make_get_request, create_fill_delete_es_index
+):
+    """Повторный запрос с If-None-Match получает пустой 304"""
+    some_id = '3d825f60-9fff-4dfe-b294-1a45fa1e115d'
+    response = await make_get_request(f'{settings.method_films}{some_id}', {})
+    etag = response.headers['ETag']
+    url = f'{settings.service_url}{settings.api_url}{settings.method_films}'
+
+    async with session.get(
+        f'{url}{some_id}', headers={'If-None-Match': etag}
+    ) as not_modified:
+        body = await not_modified.read()
+
+    assert response.status == HTTPStatus.OK
+    assert 'max-age=' in response.headers['Cache-Control']
+    assert not_modified.status == HTTPStatus.NOT_MODIFIED
+    assert not_modified.headers['ETag'] == etag
+    assert body == b''
+
+
+async def test_films_non_existent_uuid_cached(
+    es_client, redis_client, make_get_request, create_fill_delete_es_index
+):
+    """Отсутствие фильма кешируется отрицательной записью с коротким TTL"""
+    some_id = '2d811247-a406-32da-b34e-699bd10f7aec'
+    await redis_client.delete(some_id)
+
+    response = await make_get_request(f'{settings.method_films}{some_id}', {})
+    ttl = await redis_client.ttl(some_id)
+
+    assert response.status == HTTPStatus.NOT_FOUND
+    assert await redis_client.get(some_id) == b'\x00'
+    assert 0 < ttl <= 30
+
+
+async def test_films_shared_load_deadline(
+    es_client, redis_client, session, create_fill_delete_es_index
+):
+    """Короткий срок одного запроса не обрывает общую загрузку для
+    запроса с длинным сроком, который ждет ту же запись"""
+    some_id = '3d825f60-9fff-4dfe-b294-1a45fa1e115d'
+    await redis_client.delete(some_id)
+    url = f'{settings.service_url}{settings.api_url}{settings.method_films}'
+
+    async def get(timeout: str) -> int:
+        async with session.get(
+            f'{url}{some_id}', headers={'X-Request-Timeout': timeout}
+        ) as response:
+            return response.status
+
+    short, long = await asyncio.gather(get('0.01'), get('10'))
+
+    assert short in (HTTPStatus.OK, HTTPStatus.GATEWAY_TIMEOUT)
+    assert long == HTTPStatus.OK
@@ -1,3 +1,4 @@
+import asyncio
 import json
 from http import HTTPStatus
 
@@ -83,3 +84,56 @@ async def test_genres_non_existent_uuid(
 
     assert response.status == HTTPStatus.NOT_FOUND
     assert response.body == error_msg
+
+
+async def test_genres_batch(
+    es_client, make_get_request, make_post_request,
+    create_fill_delete_es_index
+):
+    """Пакетное получение жанров: порядок запроса и null для отсутствующих"""
+    ids = [
+        'ca88141b-a6b4-450d-bbc3-efa940e4953f',
+        '2d811247-a406-32da-b34e-699bd10f7aec',
+        '63c24835-34d3-4279-8d81-3c5f4ddb0cdc',
+    ]
+
+    response = await make_post_request(
+        f'{settings.method_genres}batch', {'ids': ids}
+    )
+
+    assert response.status == HTTPStatus.OK
+    assert [genre and genre['uuid'] for genre in response.body] == [
+        ids[0], None, ids[2]
+    ]
+    single = await make_get_request(f'{settings.method_genres}{ids[2]}', {})
+    assert response.body[2] == single.body
+
+
+async def test_genres_batch_from_registry(
+    es_client, redis_client, session, create_fill_delete_es_index
+):
+    """Пакетное получение жанров из реестра в памяти: после сигнала
+    о смене жанров API с включенным реестром отдает их без редиса"""
+    ids = [
+        'ca88141b-a6b4-450d-bbc3-efa940e4953f',
+        '63c24835-34d3-4279-8d81-3c5f4ddb0cdc',
+    ]
+    url = (f'{settings.genre_registry_service_url}{settings.api_url}'
+           f'{settings.method_genres}batch')
+
+    # Реестр загрузился при старте API, когда индекс был еще пуст
+    await redis_client.publish(settings.genre_registry_channel, 1)
+    for _ in range(50):
+        await redis_client.flushall()
+        async with session.post(url, json={'ids': ids}) as response:
+            body = await response.json()
+        if await redis_client.dbsize() == 0:
+            break
+        await asyncio.sleep(0.1)
+
+    assert response.status == HTTPStatus.OK
+    assert await redis_client.dbsize() == 0
+    assert body == [
+        {'uuid': ids[0], 'name': 'Mystery'},
+        {'uuid': ids[1], 'name': 'Crime'},
+    ]
@@ -142,3 +142,74 @@ async def test_persons_search_by_non_existent_person(
 
     assert response.status == HTTPStatus.NOT_FOUND
     assert response.body == result
+
+
+async def test_persons_batch(
+    es_client, make_get_request, make_post_request,
+    create_fill_delete_es_index
+):
+    """Пакетное получение персон: порядок запроса и null для отсутствующих"""
+    ids = [
+        '01377f6d-9767-48ce-9e37-3c81f8a3c739',
+        '2d811247-a406-32da-b34e-699bd10f7aec',
+        '0031feab-8f53-412a-8f53-47098a60ac73',
+    ]
+
+    response = await make_post_request(
+        f'{settings.method_persons}batch', {'ids': ids}
+    )
+
+    assert response.status == HTTPStatus.OK
+    assert [person and person['uuid'] for person in response.body] == [
+        ids[0], None, ids[2]
+    ]
+    single = await make_get_request(f'{settings.method_persons}{ids[0]}', {})
+    assert response.body[0] == single.body
+
+
+async def test_persons_batch_too_many_ids(
+    es_client, make_post_request, create_fill_delete_es_index
+):
+    """Тест на ограничение числа uuid в пакетном запросе"""
+    ids = ['01377f6d-9767-48ce-9e37-3c81f8a3c739'] * 101
+
+    response = await make_post_request(
+        f'{settings.method_persons}batch', {'ids': ids}
+    )
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+async def test_persons_export(
+    es_client, session, create_fill_delete_es_index
+):
+    """Выгрузка всех персон в NDJSON с выбором полей. Страница выгрузки
+    в тестах - 2 документа (EXPORT_PAGE_SIZE), так что 5 персон
+    читаются из эластика в три страницы"""
+    url = f'{settings.service_url}{settings.api_url}{settings.method_persons}'
+
+    async with session.get(
+        f'{url}export', params={'fields': 'id,full_name'}
+    ) as response:
+        lines = (await response.text()).splitlines()
+
+    assert response.status == HTTPStatus.OK
+    assert response.content_type == 'application/x-ndjson'
+    persons = [json.loads(line) for line in lines]
+    assert len(persons) == 5
+    assert len({person['id'] for person in persons}) == 5
+    assert all(set(person) == {'id', 'full_name'} for person in persons)
+
+
+async def test_persons_export_unknown_fields(
+    es_client, make_get_request, create_fill_delete_es_index
+):
+    """Тест на неизвестные поля выгрузки"""
+    error_msg = {'detail': 'Unknown export fields'}
+
+    response = await make_get_request(
+        f'{settings.method_persons}export', {'fields': 'id,title'}
+    )
+
+    assert response.status == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.body == error_msg